@@ -6,17 +6,49 @@ Enhanced Quiz Mini App - Полнофункциональное приложен
 
 from flask import Flask, render_template, jsonify, request, send_from_directory, g
 import json
+import re
 import sqlite3
 import os
+import sys
 import random
 import logging
 import hashlib
 import hmac
 import urllib.parse
-from datetime import datetime, date, timedelta
-from functools import wraps
-from contextlib import closing
+from datetime import datetime, date, timedelta, timezone
+from functools import wraps, lru_cache
+from contextlib import closing, contextmanager
 import traceback
+import atexit
+import queue
+import uuid
+import gzip
+import threading
+import time
+import math
+import bisect
+import itertools
+import shutil
+import tempfile
+from collections import namedtuple, OrderedDict, deque
+from types import MappingProxyType
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import psycopg
+    import psycopg_pool
+except ImportError:
+    psycopg = None
+    psycopg_pool = None
+
+# Ошибки базы данных любого из хранилищ
+DB_ERRORS = (sqlite3.Error, psycopg.Error) if psycopg else (sqlite3.Error,)
+# Временные ошибки (база заблокирована, соединение оборвалось), после которых запись можно повторить
+TRANSIENT_DB_ERRORS = (sqlite3.OperationalError, psycopg.OperationalError) if psycopg else (sqlite3.OperationalError,)
 
 # =====================================
 # КОНФИГУРАЦИЯ ПРИЛОЖЕНИЯ
@@ -26,12 +58,74 @@ app = Flask(__name__)
 app.config['JSON_AS_ASCII'] = False
 app.config['JSON_SORT_KEYS'] = False
 app.config['JSONIFY_PRETTYPRINT_REGULAR'] = True
+# Flask 2.3+ читает эти настройки только из app.json
+app.json.ensure_ascii = False
+app.json.sort_keys = False
+app.json.compact = True
 
 # Настройки
 DEBUG = os.environ.get('FLASK_ENV') == 'development'
 BOT_TOKEN = os.environ.get('BOT_TOKEN', '')
-DATABASE_PATH = 'quiz_scores.db'
+# off — не проверять, optional — проверять присланные initData, required — требовать.
+# По умолчанию optional: старые клиенты без initData продолжают работать
+TELEGRAM_AUTH_MODE = os.environ.get('TELEGRAM_AUTH_MODE', 'optional' if BOT_TOKEN else 'off')
+TELEGRAM_AUTH_MAX_AGE = int(os.environ.get('TELEGRAM_AUTH_MAX_AGE', 86400))
+TELEGRAM_AUTH_CACHE_SIZE = int(os.environ.get('TELEGRAM_AUTH_CACHE_SIZE', 4096))
+TELEGRAM_AUTH_CACHE_TTL = int(os.environ.get('TELEGRAM_AUTH_CACHE_TTL', 600))
+# sqlite — файл DATABASE_PATH, postgres — база POSTGRES_DSN через пул соединений
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'sqlite')
+DATABASE_PATH = os.environ.get('DATABASE_PATH', 'quiz_scores.db')
+POSTGRES_DSN = os.environ.get('POSTGRES_DSN', '')
+POSTGRES_POOL_MIN_SIZE = int(os.environ.get('POSTGRES_POOL_MIN_SIZE', 2))
+POSTGRES_POOL_MAX_SIZE = int(os.environ.get('POSTGRES_POOL_MAX_SIZE', 10))
 QUESTIONS_FILE = 'questions.json'
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 8))
+SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_CACHE_SIZE_KB = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 16384))
+SQLITE_MMAP_SIZE = int(os.environ.get('SQLITE_MMAP_SIZE', 128 * 1024 * 1024))
+SQLITE_BUSY_TIMEOUT_MS = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+MARATHON_QUESTIONS_COUNT = 20
+# Категория, под которой клиент сохраняет игры марафона
+MARATHON_CATEGORY = 'mixed'
+MAX_QUESTIONS_PER_REQUEST = 100
+MAX_QUESTION_WEIGHT = 1000
+MAX_GAMES_PER_BATCH = 100
+IDEMPOTENCY_KEY_MAX_LENGTH = 64
+IDEMPOTENCY_KEY_TTL_DAYS = int(os.environ.get('IDEMPOTENCY_KEY_TTL_DAYS', 30))
+MIN_COMPRESS_SIZE = 1024
+LEADERBOARD_SIZE = 100
+LEADERBOARD_MIN_GAMES = 2
+LEADERBOARD_MIN_GAMES_OVERALL = 3
+LEADERBOARD_CACHE_TTL = int(os.environ.get('LEADERBOARD_CACHE_TTL', 300))
+# Периодические рейтинги и срок хранения их корзин в днях
+LEADERBOARD_PERIOD_RETENTION_DAYS = {'day': 7, 'week': 35, 'month': 93}
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN', '')
+SQL_PROFILER_ENABLED = os.environ.get('SQL_PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 100))
+PROFILE_CACHE_SIZE = int(os.environ.get('PROFILE_CACHE_SIZE', 1024))
+SAVE_QUEUE_ENABLED = os.environ.get('SAVE_QUEUE_ENABLED', '').lower() in ('1', 'true', 'yes')
+SAVE_QUEUE_SIZE = int(os.environ.get('SAVE_QUEUE_SIZE', 1000))
+SAVE_QUEUE_BATCH_SIZE = int(os.environ.get('SAVE_QUEUE_BATCH_SIZE', 50))
+SAVE_RESULT_TTL = int(os.environ.get('SAVE_RESULT_TTL', 300))
+# Сколько секунд очередь повторяет запись пачки при временных ошибках базы
+SAVE_RETRY_TIMEOUT = float(os.environ.get('SAVE_RETRY_TIMEOUT', 60))
+# Месяцы game_results старше ARCHIVE_KEEP_MONTHS переносятся в сжатые файлы ARCHIVE_DIR
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_KEEP_MONTHS = int(os.environ.get('ARCHIVE_KEEP_MONTHS', 6))
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+# memory — счетчики в процессе, sqlite — общий файл для всех воркеров на сервере
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH', 'rate_limits.db')
+RATE_LIMIT_TRUST_FORWARDED = os.environ.get('RATE_LIMIT_TRUST_FORWARDED', '').lower() in ('1', 'true', 'yes')
+# Лимиты маршрутов: (запросов в минуту, размер всплеска); RATE_LIMIT_<ИМЯ>=30/10
+RATE_LIMITS = {
+    'save': (20, 10),
+    'save_batch': (10, 5),
+    'questions': (60, 20),
+    'leaderboard': (60, 20),
+    'user': (120, 30)
+}
 
 # =====================================
 # НАСТРОЙКА ЛОГИРОВАНИЯ
@@ -48,6 +142,871 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
+# =====================================
+# МЕТРИКИ
+# =====================================
+
+REQUEST_DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+SQL_QUERIES_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+class Histogram:
+    """Гистограмма Prometheus с метками (накопительные корзины при выводе)"""
+
+    def __init__(self, name, help_text, labels, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}
+
+    def observe(self, label_values, value):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series.setdefault(label_values, [[0] * len(self.buckets), 0.0, 0])
+        counts = series[0]
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(counts):
+            counts[index] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, total, count) in sorted(self._series.items()):
+            labels = dict(zip(self.labels, label_values))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(metric_line(f'{self.name}_bucket', {**labels, 'le': bound}, cumulative))
+            lines.append(metric_line(f'{self.name}_bucket', {**labels, 'le': '+Inf'}, count))
+            lines.append(metric_line(f'{self.name}_sum', labels, total))
+            lines.append(metric_line(f'{self.name}_count', labels, count))
+        return lines
+
+def escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def metric_line(name, labels, value):
+    """Строка текстового формата Prometheus"""
+    if labels:
+        escaped = ','.join(f'{key}="{escape_label_value(label)}"' for key, label in labels.items())
+        name = f'{name}{{{escaped}}}'
+    return f'{name} {value}'
+
+class AppMetrics:
+    """Метрики процесса: время запросов по маршрутам и работа с SQLite"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.request_duration = Histogram(
+            'quiz_http_request_duration_seconds', 'Время обработки запроса',
+            ('route', 'method'), REQUEST_DURATION_BUCKETS
+        )
+        self.request_sql_queries = Histogram(
+            'quiz_http_request_sql_queries', 'Число SQL-запросов за HTTP-запрос',
+            ('route',), SQL_QUERIES_BUCKETS
+        )
+        self.request_sql_duration = Histogram(
+            'quiz_http_request_sql_seconds', 'Время SQL за HTTP-запрос',
+            ('route',), REQUEST_DURATION_BUCKETS
+        )
+        self.responses = {}
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+
+    def record_request(self, route, method, status, elapsed, sql_queries, sql_seconds):
+        with self._lock:
+            self.request_duration.observe((route, method), elapsed)
+            self.request_sql_queries.observe((route,), sql_queries)
+            self.request_sql_duration.observe((route,), sql_seconds)
+            key = (route, method, str(status))
+            self.responses[key] = self.responses.get(key, 0) + 1
+            self.sql_queries += sql_queries
+            self.sql_seconds += sql_seconds
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for histogram in (self.request_duration, self.request_sql_queries, self.request_sql_duration):
+                lines.extend(histogram.render())
+            
+            lines.append('# HELP quiz_http_responses_total Ответы по маршрутам и статусам')
+            lines.append('# TYPE quiz_http_responses_total counter')
+            for (route, method, status), count in sorted(self.responses.items()):
+                lines.append(metric_line(
+                    'quiz_http_responses_total', {'route': route, 'method': method, 'status': status}, count
+                ))
+            
+            lines.append('# HELP quiz_sql_queries_total SQL-запросы, выполненные HTTP-запросами')
+            lines.append('# TYPE quiz_sql_queries_total counter')
+            lines.append(metric_line('quiz_sql_queries_total', {}, self.sql_queries))
+            lines.append('# HELP quiz_sql_seconds_total Время выполнения SQL-запросов')
+            lines.append('# TYPE quiz_sql_seconds_total counter')
+            lines.append(metric_line('quiz_sql_seconds_total', {}, round(self.sql_seconds, 6)))
+        return lines
+
+metrics = AppMetrics()
+
+SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+SQL_NUMBER_LITERAL = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?\b')
+SQL_PLACEHOLDER_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+PLANNABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+@lru_cache(maxsize=2048)
+def normalize_sql(sql):
+    """SQL без литералов и лишних пробелов: одна строка на форму запроса"""
+    sql = ' '.join(sql.split())
+    sql = SQL_STRING_LITERAL.sub('?', sql)
+    sql = SQL_NUMBER_LITERAL.sub('?', sql)
+    return SQL_PLACEHOLDER_LIST.sub('(?, ...)', sql)
+
+class SqlStatementStats:
+    __slots__ = ('count', 'total', 'max', 'samples')
+
+    def __init__(self, sample_size):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples = deque(maxlen=sample_size)
+
+class SqlProfiler:
+    """Профилировщик SQL и журнал медленных запросов.
+
+    Запросы, выполнявшиеся дольше slow_query_ms, пишутся в лог всегда,
+    вместе с планом запроса (план — один раз на форму запроса). При
+    enabled дополнительно собирается статистика по нормализованному SQL:
+    число вызовов, суммарное, максимальное и p95 время по последним
+    sample_size вызовам. Настройки действуют в пределах воркера.
+    """
+
+    def __init__(self, enabled, slow_query_ms, sample_size=512, max_statements=1000):
+        self.enabled = enabled
+        self.slow_query_ms = slow_query_ms
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.sample_size = sample_size
+        self.max_statements = max_statements
+        self._statements = {}
+        # Формы запросов, чей план уже записан (не зависит от enabled)
+        self._planned = OrderedDict()
+        self._lock = threading.Lock()
+        self.slow_queries = 0
+
+    def configure(self, enabled=None, slow_query_ms=None):
+        if enabled is not None:
+            self.enabled = enabled
+        if slow_query_ms is not None:
+            self.slow_query_ms = slow_query_ms
+            self.slow_query_seconds = slow_query_ms / 1000
+
+    def record(self, cursor, sql, parameters, elapsed):
+        if self.enabled:
+            self._add(normalize_sql(sql), elapsed)
+        if elapsed >= self.slow_query_seconds:
+            self._log_slow(cursor, sql, parameters, elapsed)
+
+    def _add(self, statement, elapsed):
+        with self._lock:
+            stats = self._statements.get(statement)
+            if stats is None:
+                if len(self._statements) >= self.max_statements:
+                    return
+                stats = self._statements[statement] = SqlStatementStats(self.sample_size)
+            stats.count += 1
+            stats.total += elapsed
+            stats.max = max(stats.max, elapsed)
+            stats.samples.append(elapsed)
+
+    def _log_slow(self, cursor, sql, parameters, elapsed):
+        self.slow_queries += 1
+        statement = normalize_sql(sql)
+        logger.warning(f"🐢 Медленный запрос ({elapsed * 1000:.1f} мс): {statement}")
+        
+        # executemany (parameters is None) не объясняется: форма остается без плана
+        if parameters is None or not statement.upper().startswith(PLANNABLE_STATEMENTS):
+            return
+        with self._lock:
+            if statement in self._planned:
+                self._planned.move_to_end(statement)
+                return
+            self._planned[statement] = True
+            if len(self._planned) > self.max_statements:
+                self._planned.popitem(last=False)
+        
+        try:
+            plan = cursor.connection.explain(sql, parameters)
+            logger.warning("🐢 План запроса:\n" + '\n'.join(f"  {line}" for line in plan))
+        except DB_ERRORS as e:
+            logger.debug(f"Query plan unavailable: {e}")
+
+    def report(self, limit=50):
+        """Самые затратные формы запросов по суммарному времени"""
+        with self._lock:
+            items = [
+                (statement, stats.count, stats.total, stats.max, sorted(stats.samples))
+                for statement, stats in self._statements.items()
+            ]
+        items.sort(key=lambda item: item[2], reverse=True)
+        return [
+            {
+                'sql': statement,
+                'count': count,
+                'total_ms': round(total * 1000, 3),
+                'avg_ms': round(total / count * 1000, 3),
+                'p95_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000, 3),
+                'max_ms': round(longest * 1000, 3)
+            } for statement, count, total, longest, samples in items[:limit]
+        ]
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+            self._planned.clear()
+        self.slow_queries = 0
+
+    def stats(self):
+        return {
+            'enabled': self.enabled,
+            'slow_query_ms': self.slow_query_ms,
+            'statements': len(self._statements),
+            'slow_queries': self.slow_queries
+        }
+
+sql_profiler = SqlProfiler(SQL_PROFILER_ENABLED, SLOW_QUERY_MS)
+
+class TimedCursor(sqlite3.Cursor):
+    """Курсор, засчитывающий число и время execute/executemany своему соединению"""
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            conn = self.connection
+            conn.sql_queries += 1
+            conn.sql_seconds += elapsed
+            profiler = conn.profiler
+            if profiler is not None and (profiler.enabled or elapsed >= profiler.slow_query_seconds):
+                profiler.record(self, sql, parameters, elapsed)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - started
+            conn = self.connection
+            conn.sql_queries += 1
+            conn.sql_seconds += elapsed
+            profiler = conn.profiler
+            if profiler is not None and (profiler.enabled or elapsed >= profiler.slow_query_seconds):
+                profiler.record(self, sql, None, elapsed)
+
+class TimedConnection(sqlite3.Connection):
+    """Соединение, все запросы которого выполняются через TimedCursor.
+
+    Счетчики накапливаются за всю жизнь соединения; запрос Flask берет
+    разницу между значениями при получении соединения и в конце запроса.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.profiler = sql_profiler
+
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def explain(self, sql, parameters=()):
+        """План запроса построчно (для журнала медленных запросов)"""
+        plan = self.cursor(sqlite3.Cursor).execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+        return [row[3] for row in plan]
+
+# =====================================
+# ХРАНИЛИЩЕ ДАННЫХ
+# =====================================
+
+def connect_db(path=None):
+    """Новое соединение с SQLite в режиме WAL и с настроенными PRAGMA"""
+    conn = sqlite3.connect(path or DATABASE_PATH, check_same_thread=False, factory=TimedConnection)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+    conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}')
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
+class ConnectionPool:
+    """Пул соединений SQLite внутри одного воркера.
+
+    Соединение выдается запросу целиком и возвращается в пул при
+    завершении контекста приложения. После fork (gunicorn) унаследованные
+    соединения отбрасываются, при смене DATABASE_PATH — тоже.
+    """
+
+    def __init__(self, max_idle):
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self.created = 0
+        self.reused = 0
+        self.closed = 0
+        self.in_use = 0
+
+    def _reset_after_fork(self):
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._idle = []
+            self.in_use = 0
+
+    def acquire(self):
+        path = DATABASE_PATH
+        with self._lock:
+            self._reset_after_fork()
+            while self._idle:
+                conn = self._idle.pop()
+                if conn.db_path == path:
+                    self.reused += 1
+                    self.in_use += 1
+                    return conn
+                conn.close()
+                self.closed += 1
+            self.created += 1
+            self.in_use += 1
+        conn = connect_db(path)
+        conn.db_path = path
+        return conn
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            self.in_use = max(self.in_use - 1, 0)
+            if conn.db_path == DATABASE_PATH and len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+            self.closed += 1
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.closed += len(idle)
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        return {
+            'created': self.created,
+            'reused': self.reused,
+            'closed': self.closed,
+            'in_use': self.in_use,
+            'idle': len(self._idle),
+            'max_idle': self.max_idle
+        }
+
+db_pool = ConnectionPool(DB_POOL_SIZE)
+
+class SQLiteStorage:
+    """Хранилище по умолчанию: файл DATABASE_PATH и пул соединений воркера.
+
+    Схема ведется миграциями (run_migrations).
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def acquire(self):
+        return self.pool.acquire()
+
+    def release(self, conn):
+        self.pool.release(conn)
+
+    @contextmanager
+    def connection(self):
+        """Отдельное соединение для работы вне запроса (инициализация, команды)"""
+        with closing(connect_db()) as conn:
+            yield conn
+
+    def init_schema(self):
+        init_database()
+
+    def table_names(self, cursor):
+        return [row[0] for row in cursor.execute('''
+            SELECT name FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%'
+        ''')]
+
+    def close_all(self):
+        self.pool.close_all()
+
+    def stats(self):
+        return {'backend': self.name, **self.pool.stats()}
+
+def postgres_value(value):
+    """Дата и время из PostgreSQL в текстовом виде, в котором их хранит SQLite"""
+    if isinstance(value, datetime):
+        return value.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(value, date):
+        return value.isoformat()
+    return value
+
+class PostgresRow:
+    """Строка результата с доступом по индексу и по имени столбца, как у sqlite3.Row"""
+
+    __slots__ = ('_columns', '_values')
+
+    def __init__(self, columns, values):
+        self._columns = columns
+        self._values = values
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self._values[self._columns[key]]
+        return self._values[key]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def keys(self):
+        return list(self._columns)
+
+def postgres_row_factory(cursor):
+    """Фабрика строк psycopg, возвращающая PostgresRow"""
+    columns = {column.name: i for i, column in enumerate(cursor.description or ())}
+
+    def make_row(values):
+        return PostgresRow(columns, tuple(postgres_value(value) for value in values))
+    return make_row
+
+@lru_cache(maxsize=1024)
+def postgres_sql(sql):
+    """Запрос приложения с плейсхолдерами ? в синтаксисе psycopg (%s)"""
+    return sql.replace('%', '%%').replace('?', '%s')
+
+class PostgresCursor:
+    """Курсор psycopg с интерфейсом TimedCursor: плейсхолдеры ?, учет числа и времени запросов"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection.raw.cursor()
+
+    def _record(self, sql, parameters, started):
+        elapsed = time.perf_counter() - started
+        conn = self.connection
+        conn.sql_queries += 1
+        conn.sql_seconds += elapsed
+        profiler = conn.profiler
+        if profiler is not None and (profiler.enabled or elapsed >= profiler.slow_query_seconds):
+            profiler.record(self, sql, parameters, elapsed)
+
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            self._cursor.execute(postgres_sql(sql), parameters)
+            return self
+        finally:
+            self._record(sql, parameters, started)
+
+    def executemany(self, sql, seq_of_parameters):
+        started = time.perf_counter()
+        try:
+            self._cursor.executemany(postgres_sql(sql), seq_of_parameters)
+            return self
+        finally:
+            self._record(sql, None, started)
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+class PostgresConnection:
+    """Соединение psycopg с интерфейсом sqlite3, на который рассчитан код приложения.
+
+    with conn: — транзакция (commit или rollback), а не закрытие
+    соединения, как у самого psycopg.
+    """
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.profiler = sql_profiler
+
+    def cursor(self):
+        return PostgresCursor(self)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def explain(self, sql, parameters=()):
+        """План запроса построчно (для журнала медленных запросов)"""
+        return [row[0] for row in self.raw.execute(f'EXPLAIN {postgres_sql(sql)}', parameters)]
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    @property
+    def in_transaction(self):
+        return self.raw.info.transaction_status != psycopg.pq.TransactionStatus.IDLE
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.rollback()
+        return False
+
+# Схема PostgreSQL, соответствующая последней миграции SQLite
+POSTGRES_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS game_results (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        score INTEGER NOT NULL,
+        total INTEGER NOT NULL,
+        category TEXT NOT NULL,
+        difficulty TEXT NOT NULL,
+        percentage DOUBLE PRECISION NOT NULL,
+        time_spent INTEGER DEFAULT 0,
+        hints_used INTEGER DEFAULT 0,
+        game_mode TEXT DEFAULT 'normal',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_game_results_user_created ON game_results(user_id, created_at)',
+    'CREATE INDEX IF NOT EXISTS idx_game_results_created ON game_results(created_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS game_results_monthly (
+        user_id TEXT NOT NULL,
+        month TEXT NOT NULL,
+        category TEXT NOT NULL,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_score INTEGER NOT NULL DEFAULT 0,
+        total_questions INTEGER NOT NULL DEFAULT 0,
+        total_percentage DOUBLE PRECISION NOT NULL DEFAULT 0,
+        best_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, month, category)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_profiles (
+        user_id TEXT PRIMARY KEY,
+        username TEXT,
+        first_name TEXT NOT NULL,
+        last_name TEXT,
+        total_games INTEGER DEFAULT 0,
+        total_score INTEGER DEFAULT 0,
+        best_streak INTEGER DEFAULT 0,
+        current_streak INTEGER DEFAULT 0,
+        favorite_category TEXT,
+        level INTEGER DEFAULT 1,
+        experience_points INTEGER DEFAULT 0,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS daily_challenges (
+        id BIGSERIAL PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        challenge_date DATE NOT NULL,
+        challenge_type TEXT NOT NULL,
+        target_value INTEGER NOT NULL,
+        current_progress INTEGER DEFAULT 0,
+        completed BOOLEAN DEFAULT FALSE,
+        reward_claimed BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        UNIQUE(user_id, challenge_date, challenge_type)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS achievements (
+        id TEXT PRIMARY KEY,
+        name TEXT NOT NULL,
+        description TEXT NOT NULL,
+        icon TEXT NOT NULL,
+        condition_type TEXT NOT NULL,
+        condition_value INTEGER NOT NULL,
+        reward_points INTEGER DEFAULT 0,
+        rarity TEXT DEFAULT 'common'
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard_stats (
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_percentage DOUBLE PRECISION NOT NULL DEFAULT 0,
+        best_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        avg_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, category)
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_stats_rank
+    ON leaderboard_stats(category, avg_score DESC, best_score DESC, user_id)
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS leaderboard_periods (
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        period TEXT NOT NULL,
+        bucket TEXT NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_percentage DOUBLE PRECISION NOT NULL DEFAULT 0,
+        best_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        avg_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, category, period, bucket)
+    )
+    ''',
+    '''
+    CREATE INDEX IF NOT EXISTS idx_leaderboard_periods_rank
+    ON leaderboard_periods(period, bucket, category, avg_score DESC, best_score DESC, user_id)
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_achievements (
+        user_id TEXT NOT NULL,
+        achievement_id TEXT NOT NULL,
+        unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, achievement_id)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_progress (
+        user_id TEXT PRIMARY KEY,
+        mastered_categories INTEGER NOT NULL DEFAULT 0,
+        daily_streak INTEGER NOT NULL DEFAULT 0,
+        best_daily_streak INTEGER NOT NULL DEFAULT 0,
+        last_played_date DATE
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS user_mastered_categories (
+        user_id TEXT NOT NULL,
+        category TEXT NOT NULL,
+        PRIMARY KEY (user_id, category)
+    )
+    ''',
+    '''
+    CREATE TABLE IF NOT EXISTS game_save_keys (
+        user_id TEXT NOT NULL,
+        idempotency_key TEXT NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        PRIMARY KEY (user_id, idempotency_key)
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_game_save_keys_created ON game_save_keys(created_at)',
+    '''
+    CREATE TABLE IF NOT EXISTS app_stats (
+        id INTEGER PRIMARY KEY,
+        total_users INTEGER DEFAULT 0,
+        total_games INTEGER DEFAULT 0,
+        total_questions_answered BIGINT DEFAULT 0,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    'INSERT INTO app_stats (id) VALUES (1) ON CONFLICT DO NOTHING',
+    '''
+    CREATE TABLE IF NOT EXISTS category_stats (
+        category TEXT PRIMARY KEY,
+        games INTEGER NOT NULL DEFAULT 0,
+        total_percentage DOUBLE PRECISION NOT NULL DEFAULT 0
+    )
+    ''',
+    'CREATE INDEX IF NOT EXISTS idx_category_stats_games ON category_stats(games DESC)',
+    # Счетчики app_stats/category_stats, как APP_STATS_TRIGGERS в SQLite
+    '''
+    CREATE OR REPLACE FUNCTION game_results_app_stats() RETURNS trigger AS $$
+    BEGIN
+        UPDATE app_stats
+        SET total_games = total_games + 1,
+            total_questions_answered = total_questions_answered + NEW.total,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+        INSERT INTO category_stats (category, games, total_percentage)
+        VALUES (NEW.category, 1, NEW.percentage)
+        ON CONFLICT (category) DO UPDATE SET
+            games = category_stats.games + 1,
+            total_percentage = category_stats.total_percentage + excluded.total_percentage;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS trg_game_results_app_stats ON game_results',
+    '''
+    CREATE TRIGGER trg_game_results_app_stats
+    AFTER INSERT ON game_results
+    FOR EACH ROW EXECUTE FUNCTION game_results_app_stats()
+    ''',
+    '''
+    CREATE OR REPLACE FUNCTION user_profiles_app_stats() RETURNS trigger AS $$
+    BEGIN
+        UPDATE app_stats
+        SET total_users = total_users + 1, updated_at = CURRENT_TIMESTAMP
+        WHERE id = 1;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    ''',
+    'DROP TRIGGER IF EXISTS trg_user_profiles_app_stats ON user_profiles',
+    '''
+    CREATE TRIGGER trg_user_profiles_app_stats
+    AFTER INSERT ON user_profiles
+    FOR EACH ROW EXECUTE FUNCTION user_profiles_app_stats()
+    '''
+)
+
+def configure_postgres_connection(conn):
+    """Время в UTC, как CURRENT_TIMESTAMP в SQLite"""
+    conn.execute("SET TIME ZONE 'UTC'")
+    conn.commit()
+
+class PostgresStorage:
+    """Хранилище PostgreSQL: пул соединений psycopg на процесс.
+
+    Запросы приложения (доступ к данным и бизнес-логика) одни и те же для
+    обоих хранилищ и пишутся в общем подмножестве SQL. Схема создается
+    целиком из POSTGRES_SCHEMA; миграции и сверка счетчиков из командной
+    строки работают только с SQLite. После fork (gunicorn) пул создается
+    заново, чтобы не делить соединения с родительским процессом.
+    """
+
+    name = 'postgres'
+
+    def __init__(self, dsn, min_size, max_size):
+        if psycopg is None:
+            raise RuntimeError("STORAGE_BACKEND=postgres требует пакеты psycopg и psycopg_pool")
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = psycopg_pool.ConnectionPool(
+                    self.dsn,
+                    min_size=self.min_size,
+                    max_size=self.max_size,
+                    kwargs={'row_factory': postgres_row_factory},
+                    configure=configure_postgres_connection,
+                    open=True
+                )
+                self._pid = os.getpid()
+            return self._pool
+
+    def acquire(self):
+        return PostgresConnection(self._get_pool().getconn())
+
+    def release(self, conn):
+        conn.rollback()
+        self._get_pool().putconn(conn.raw)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def init_schema(self):
+        with self.connection() as conn, conn:
+            for statement in POSTGRES_SCHEMA:
+                conn.raw.execute(statement)
+        logger.info("✅ Схема PostgreSQL создана")
+
+    def table_names(self, cursor):
+        return [row[0] for row in cursor.execute('''
+            SELECT table_name FROM information_schema.tables
+            WHERE table_schema = current_schema()
+        ''')]
+
+    def close_all(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.close()
+
+    def stats(self):
+        pool = self._pool.get_stats() if self._pool is not None else {}
+        return {
+            'backend': self.name,
+            'created': pool.get('connections_num', 0),
+            'in_use': pool.get('pool_size', 0) - pool.get('pool_available', 0),
+            'idle': pool.get('pool_available', 0),
+            'max_size': self.max_size
+        }
+
+def create_storage():
+    """Хранилище, выбранное STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'postgres':
+        return PostgresStorage(POSTGRES_DSN, POSTGRES_POOL_MIN_SIZE, POSTGRES_POOL_MAX_SIZE)
+    if STORAGE_BACKEND != 'sqlite':
+        raise ValueError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return SQLiteStorage(db_pool)
+
+storage = create_storage()
+
+def get_db():
+    """Получение соединения с базой данных из пула хранилища"""
+    if 'db' not in g:
+        g.db = storage.acquire()
+        g.db.profiler = sql_profiler
+        g.sql_baseline = (g.db.sql_queries, g.db.sql_seconds)
+    return g.db
+
+def close_db(error):
+    """Возврат соединения с базой данных в пул"""
+    db = g.pop('db', None)
+    if db is not None:
+        storage.release(db)
+
+app.teardown_appcontext(close_db)
+
 # =====================================
 # ДЕКОРАТОРЫ И УТИЛИТЫ
 # =====================================
@@ -58,7 +1017,7 @@ def handle_db_error(f):
     def decorated_function(*args, **kwargs):
         try:
             return f(*args, **kwargs)
-        except sqlite3.Error as e:
+        except DB_ERRORS as e:
             logger.error(f"Database error in {f.__name__}: {e}")
             return jsonify({'error': 'Database error', 'message': str(e)}), 500
         except Exception as e:
@@ -67,165 +1026,916 @@ def handle_db_error(f):
             return jsonify({'error': 'Internal error', 'message': str(e)}), 500
     return decorated_function
 
-def get_db():
-    """Получение соединения с базой данных"""
-    if 'db' not in g:
-        g.db = sqlite3.connect(DATABASE_PATH)
-        g.db.row_factory = sqlite3.Row
-    return g.db
-
-def close_db(error):
-    """Закрытие соединения с базой данных"""
-    db = g.pop('db', None)
-    if db is not None:
-        db.close()
+def telegram_secret_key(bot_token):
+    """Секретный ключ проверки initData (HMAC-SHA256 токена бота с ключом WebAppData)"""
+    return hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
 
-app.teardown_appcontext(close_db)
+def parse_telegram_init_data(init_data, secret_key):
+    """Разбор и проверка подписи initData; возвращает поля или None"""
+    try:
+        params = dict(urllib.parse.parse_qsl(init_data, keep_blank_values=True, strict_parsing=True))
+    except ValueError:
+        return None
+    
+    received_hash = params.pop('hash', None)
+    if not received_hash:
+        return None
+    
+    # Строка для проверки: отсортированные пары key=value через перевод строки
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(params.items()))
+    calculated_hash = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    
+    if not hmac.compare_digest(calculated_hash, received_hash):
+        return None
+    return params
 
 def validate_telegram_data(init_data, bot_token):
     """Валидация данных от Telegram Web App"""
     try:
         if not init_data or not bot_token:
             return False
-            
-        parsed_data = urllib.parse.parse_qs(init_data)
         
-        # Извлекаем хеш
-        received_hash = parsed_data.get('hash', [None])[0]
-        if not received_hash:
-            return False
+        return parse_telegram_init_data(init_data, telegram_secret_key(bot_token)) is not None
         
-        # Создаем строку для проверки
-        data_check_string = '\n'.join([
-            f"{key}={value[0]}" 
-            for key, value in sorted(parsed_data.items()) 
-            if key != 'hash'
-        ])
+    except Exception as e:
+        logger.warning(f"Telegram data validation error: {e}")
+        return False
+
+class TelegramAuth:
+    """Проверка initData Telegram Web App с кэшем проверенных сессий.
+
+    Секретный ключ вычисляется один раз. Успешно проверенные initData
+    запоминаются по их hash на cache_ttl секунд (но не дольше, чем
+    initData остаются свежими), так что запросы одной сессии Mini App
+    не пересчитывают HMAC. Запись кэша совпадает только с той же строкой
+    initData целиком.
+    """
+
+    def __init__(self, bot_token, max_age, cache_size, cache_ttl):
+        self.secret_key = telegram_secret_key(bot_token) if bot_token else None
+        self.max_age = max_age
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.failures = 0
+
+    def _cached(self, received_hash, init_data, now):
+        with self._lock:
+            entry = self._cache.get(received_hash)
+            if entry is None:
+                return None
+            cached_init_data, expires_at, user = entry
+            if expires_at <= now:
+                del self._cache[received_hash]
+                return None
+            if not hmac.compare_digest(cached_init_data, init_data):
+                return None
+            self._cache.move_to_end(received_hash)
+            return user
+
+    def verify(self, init_data):
+        """Пользователь Telegram из initData или None, если подпись неверна или устарела"""
+        if not init_data or self.secret_key is None:
+            return None
         
-        # Создаем секретный ключ
-        secret_key = hmac.new(
-            b'WebAppData', 
-            bot_token.encode(), 
-            hashlib.sha256
-        ).digest()
+        now = time.time()
+        received_hash = urllib.parse.parse_qs(init_data).get('hash', [''])[-1]
+        user = self._cached(received_hash, init_data, now)
+        if user is not None:
+            self.hits += 1
+            return user
+        self.misses += 1
         
-        # Вычисляем хеш
-        calculated_hash = hmac.new(
-            secret_key, 
-            data_check_string.encode(), 
-            hashlib.sha256
-        ).hexdigest()
+        params = parse_telegram_init_data(init_data, self.secret_key)
+        try:
+            auth_date = int(params['auth_date'])
+            user = json.loads(params['user'])
+            user['id']
+        except (TypeError, KeyError, ValueError):
+            self.failures += 1
+            return None
         
-        return calculated_hash == received_hash
+        if not 0 <= now - auth_date <= self.max_age:
+            self.failures += 1
+            return None
         
-    except Exception as e:
-        logger.warning(f"Telegram data validation error: {e}")
-        return False
+        with self._lock:
+            self._cache[received_hash] = (init_data, min(now + self.cache_ttl, auth_date + self.max_age), user)
+            self._cache.move_to_end(received_hash)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return user
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def stats(self):
+        return {
+            'mode': TELEGRAM_AUTH_MODE,
+            'cached': len(self._cache),
+            'hits': self.hits,
+            'misses': self.misses,
+            'failures': self.failures
+        }
+
+telegram_auth = TelegramAuth(BOT_TOKEN, TELEGRAM_AUTH_MAX_AGE, TELEGRAM_AUTH_CACHE_SIZE, TELEGRAM_AUTH_CACHE_TTL)
+
+def request_init_data():
+    """initData из заголовка X-Telegram-Init-Data или Authorization: tma <initData>"""
+    init_data = request.headers.get('X-Telegram-Init-Data')
+    if init_data:
+        return init_data
+    
+    scheme, _, credentials = request.headers.get('Authorization', '').partition(' ')
+    return credentials if scheme.lower() == 'tma' else None
+
+def authenticate_request():
+    """Проверка initData запроса; проверенный пользователь сохраняется в g"""
+    g.telegram_user = None
+    g.user_id = None
+    if TELEGRAM_AUTH_MODE == 'off':
+        return
+    
+    init_data = request_init_data()
+    if not init_data:
+        return
+    
+    user = telegram_auth.verify(init_data)
+    if user is None:
+        logger.warning(f"🔒 Неверные или устаревшие initData от {request.remote_addr}")
+        return
+    
+    g.telegram_user = user
+    g.user_id = str(user['id'])
+
+def is_user_allowed(user_id):
+    """Может ли текущий запрос действовать от имени user_id"""
+    if TELEGRAM_AUTH_MODE == 'off':
+        return True
+    if g.user_id is None:
+        return TELEGRAM_AUTH_MODE == 'optional'
+    return str(user_id) == g.user_id
+
+def telegram_auth_required(f):
+    """Декоратор маршрутов, работающих с данными конкретного пользователя.
+
+    В режиме required без проверенных initData возвращает 401; если
+    user_id из URL не совпадает с проверенным пользователем — 403.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if TELEGRAM_AUTH_MODE == 'required' and g.get('user_id') is None:
+            return jsonify({'error': 'Authentication required'}), 401
+        if 'user_id' in kwargs and not is_user_allowed(kwargs['user_id']):
+            return jsonify({'error': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+# =====================================
+# КЭШ ГОТОВЫХ ОТВЕТОВ
+# =====================================
+
+CachedResponse = namedtuple('CachedResponse', ['version', 'etag', 'bodies'])
+
+def encode_json(payload):
+    """Компактная сериализация в JSON (UTF-8 без экранирования кириллицы)"""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def compress_body(body, encodings=('br', 'gzip')):
+    """Варианты тела ответа по Content-Encoding (только из encodings)"""
+    bodies = {'identity': body}
+    if len(body) >= MIN_COMPRESS_SIZE:
+        if 'gzip' in encodings:
+            bodies['gzip'] = gzip.compress(body, compresslevel=6)
+        if 'br' in encodings and brotli is not None:
+            bodies['br'] = brotli.compress(body)
+    return bodies
+
+def accepted_encoding():
+    """Лучшее из доступных сжатий, которое принимает клиент, или 'identity'"""
+    for candidate in ('br', 'gzip'):
+        if (candidate != 'br' or brotli is not None) and request.accept_encodings[candidate]:
+            return candidate
+    return 'identity'
+
+class ResponseCache:
+    """LRU-кэш сериализованных и сжатых ответов.
+
+    Запись действительна, пока версия данных совпадает с той, для которой
+    она построена; при несовпадении ответ строится заново.
+    """
+
+    def __init__(self, max_entries=512):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version, build):
+        """Возвращает CachedResponse; build() должен вернуть тело в байтах"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        body = build()
+        entry = CachedResponse(version, hashlib.sha1(body).hexdigest(), compress_body(body))
+
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+response_cache = ResponseCache()
+
+def json_bytes_response(bodies, etag=None):
+    """Ответ из готовых байтов с учетом Accept-Encoding и If-None-Match"""
+    if etag and request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+        response.set_etag(etag)
+        # Тот же Vary, что и у 200, чтобы кэши не путали сжатые варианты
+        response.vary.add('Accept-Encoding')
+        return response
+
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in bodies and request.accept_encodings[candidate]:
+            encoding = candidate
+            break
+
+    response = app.response_class(bodies[encoding], mimetype='application/json')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    if etag:
+        response.set_etag(etag)
+    return response
+
+def cached_json_response(key, version, build_payload):
+    """Ответ из кэша; build_payload() вызывается только при смене версии"""
+    entry = response_cache.get(key, version, lambda: encode_json(build_payload()))
+    return json_bytes_response(entry.bodies, entry.etag)
 
 # =====================================
 # ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ
 # =====================================
 
-def init_database():
-    """Инициализация базы данных со всеми таблицами"""
+Migration = namedtuple('Migration', ['version', 'name', 'apply'])
+
+MIGRATIONS = []
+
+def migration(version, name):
+    """Регистрация шага миграции схемы; шаг получает cursor и не делает commit"""
+    def register(apply):
+        MIGRATIONS.append(Migration(version, name, apply))
+        MIGRATIONS.sort()
+        return apply
+    return register
+
+def table_columns(cursor, table):
+    """Имена столбцов таблицы (пустое множество, если таблицы нет)"""
+    return {row['name'] for row in cursor.execute(f'PRAGMA table_info({table})')}
+
+def rebuild_table(cursor, table, create_sql, column_exprs):
+    """Пересоздание таблицы по новой схеме с переносом данных.
+
+    column_exprs: столбец новой таблицы -> выражение над старой таблицей.
+    Индексы старой таблицы удаляются вместе с ней.
+    """
+    cursor.execute(create_sql.replace(f'CREATE TABLE IF NOT EXISTS {table}', f'CREATE TABLE {table}_new'))
+    cursor.execute(f'''
+        INSERT INTO {table}_new ({', '.join(column_exprs)})
+        SELECT {', '.join(column_exprs.values())} FROM {table}
+    ''')
+    cursor.execute(f'DROP TABLE {table}')
+    cursor.execute(f'ALTER TABLE {table}_new RENAME TO {table}')
+
+# Схема версии 2.0.0, на которую опираются первые миграции
+INITIAL_TABLES = {
+    'game_results': '''
+        CREATE TABLE IF NOT EXISTS game_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            last_name TEXT,
+            score INTEGER NOT NULL,
+            total INTEGER NOT NULL,
+            category TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            percentage REAL NOT NULL,
+            time_spent INTEGER DEFAULT 0,
+            hints_used INTEGER DEFAULT 0,
+            game_mode TEXT DEFAULT 'normal',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    'user_profiles': '''
+        CREATE TABLE IF NOT EXISTS user_profiles (
+            user_id TEXT PRIMARY KEY,
+            username TEXT,
+            first_name TEXT NOT NULL,
+            last_name TEXT,
+            total_games INTEGER DEFAULT 0,
+            total_score INTEGER DEFAULT 0,
+            best_streak INTEGER DEFAULT 0,
+            current_streak INTEGER DEFAULT 0,
+            achievements TEXT DEFAULT '[]',
+            favorite_category TEXT,
+            level INTEGER DEFAULT 1,
+            experience_points INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''',
+    'daily_challenges': '''
+        CREATE TABLE IF NOT EXISTS daily_challenges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            challenge_date DATE NOT NULL,
+            challenge_type TEXT NOT NULL,
+            target_value INTEGER NOT NULL,
+            current_progress INTEGER DEFAULT 0,
+            completed BOOLEAN DEFAULT FALSE,
+            reward_claimed BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(user_id, challenge_date, challenge_type)
+        )
+    ''',
+    'achievements': '''
+        CREATE TABLE IF NOT EXISTS achievements (
+            id TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            description TEXT NOT NULL,
+            icon TEXT NOT NULL,
+            condition_type TEXT NOT NULL,
+            condition_value INTEGER NOT NULL,
+            reward_points INTEGER DEFAULT 0,
+            rarity TEXT DEFAULT 'common'
+        )
+    ''',
+    'app_stats': '''
+        CREATE TABLE IF NOT EXISTS app_stats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            total_users INTEGER DEFAULT 0,
+            total_games INTEGER DEFAULT 0,
+            total_questions_answered INTEGER DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    '''
+}
+
+@migration(1, 'initial_schema')
+def migrate_initial_schema(cursor):
+    """Таблицы версии 2.0.0"""
+    for create_sql in INITIAL_TABLES.values():
+        cursor.execute(create_sql)
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_results_user_id 
+        ON game_results(user_id)
+    ''')
+
+@migration(2, 'upgrade_legacy_tables')
+def migrate_legacy_tables(cursor):
+    """Приведение таблиц первой версии бота (столбцы date, join_date...) к схеме 2.0.0"""
+    columns = table_columns(cursor, 'game_results')
+    if 'created_at' not in columns:
+        rebuild_table(cursor, 'game_results', INITIAL_TABLES['game_results'], {
+            'id': 'id',
+            'user_id': "COALESCE(user_id, '')",
+            'username': 'username',
+            'first_name': 'first_name',
+            'last_name': 'last_name',
+            'score': 'COALESCE(score, 0)',
+            'total': 'COALESCE(total, 0)',
+            'category': "COALESCE(category, 'unknown')",
+            'difficulty': "COALESCE(difficulty, 'easy')",
+            'percentage': 'COALESCE(percentage, 0)',
+            'time_spent': 'COALESCE(time_spent, 0)',
+            'hints_used': 'COALESCE(hints_used, 0)',
+            'game_mode': "COALESCE(game_mode, 'normal')",
+            'created_at': 'COALESCE(date, CURRENT_TIMESTAMP)' if 'date' in columns else 'CURRENT_TIMESTAMP'
+        })
+    
+    columns = table_columns(cursor, 'user_profiles')
+    if 'updated_at' not in columns:
+        column_exprs = {
+            column: column for column in [
+                'user_id', 'username', 'last_name', 'total_games', 'total_score',
+                'best_streak', 'current_streak', 'achievements', 'favorite_category'
+            ] if column in columns
+        }
+        column_exprs['first_name'] = "COALESCE(first_name, 'Игрок')"
+        column_exprs['created_at'] = 'COALESCE(join_date, CURRENT_TIMESTAMP)' if 'join_date' in columns else 'CURRENT_TIMESTAMP'
+        column_exprs['updated_at'] = 'COALESCE(last_activity, CURRENT_TIMESTAMP)' if 'last_activity' in columns else 'CURRENT_TIMESTAMP'
+        rebuild_table(cursor, 'user_profiles', INITIAL_TABLES['user_profiles'], column_exprs)
+    
+    if 'rarity' not in table_columns(cursor, 'achievements'):
+        cursor.execute("ALTER TABLE achievements ADD COLUMN rarity TEXT DEFAULT 'common'")
+    
+    if 'created_at' not in table_columns(cursor, 'daily_challenges'):
+        cursor.execute('ALTER TABLE daily_challenges ADD COLUMN created_at TIMESTAMP')
+
+@migration(3, 'game_results_covering_indexes')
+def migrate_game_results_indexes(cursor):
+    """Индексы под основные запросы к game_results"""
+    # idx_game_results_user_id покрывается idx_game_results_user_category
+    cursor.execute('DROP INDEX IF EXISTS idx_game_results_user_id')
+    
+    # Статистика профиля по категориям: WHERE user_id GROUP BY category
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_results_user_category 
+        ON game_results(user_id, category, percentage)
+    ''')
+    
+    # Последние игры профиля: WHERE user_id ORDER BY created_at DESC
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_results_user_created 
+        ON game_results(user_id, created_at)
+    ''')
+    
+    # Статистика по категориям: GROUP BY category
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_results_category 
+        ON game_results(category, percentage, total)
+    ''')
+
+@migration(4, 'leaderboard_stats')
+def migrate_leaderboard_stats(cursor):
+    """Агрегаты для таблиц лидеров (обновляются при сохранении игры)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leaderboard_stats (
+            user_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_percentage REAL NOT NULL DEFAULT 0,
+            best_score REAL NOT NULL DEFAULT 0,
+            avg_score REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_stats_rank
+        ON leaderboard_stats(category, avg_score DESC, best_score DESC, user_id)
+    ''')
+    
+    rebuild_leaderboard_stats(cursor)
+
+@migration(5, 'user_progress')
+def migrate_user_progress(cursor):
+    """Достижения и счетчики прогресса пользователей в отдельных таблицах"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_achievements (
+            user_id TEXT NOT NULL,
+            achievement_id TEXT NOT NULL,
+            unlocked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, achievement_id)
+        )
+    ''')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_progress (
+            user_id TEXT PRIMARY KEY,
+            mastered_categories INTEGER NOT NULL DEFAULT 0,
+            daily_streak INTEGER NOT NULL DEFAULT 0,
+            best_daily_streak INTEGER NOT NULL DEFAULT 0,
+            last_played_date DATE
+        )
+    ''')
+    
+    # Категории, в которых пользователь набрал 80%+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS user_mastered_categories (
+            user_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            PRIMARY KEY (user_id, category)
+        )
+    ''')
+    
+    # Переносим достижения из JSON-поля профиля
+    for row in cursor.execute('SELECT user_id, achievements FROM user_profiles').fetchall():
+        try:
+            achievement_ids = json.loads(row['achievements'] or '[]')
+        except ValueError:
+            continue
+        cursor.executemany(
+            'INSERT OR IGNORE INTO user_achievements (user_id, achievement_id) VALUES (?, ?)',
+            [(row['user_id'], achievement_id) for achievement_id in achievement_ids]
+        )
+    
+    rebuild_user_progress(cursor)
+
+@migration(6, 'drop_profile_achievements_json')
+def migrate_drop_achievements_json(cursor):
+    """JSON-поле user_profiles.achievements заменено таблицей user_achievements"""
+    if 'achievements' in table_columns(cursor, 'user_profiles'):
+        cursor.execute('ALTER TABLE user_profiles DROP COLUMN achievements')
+
+# Триггеры, поддерживающие app_stats/category_stats (массовая загрузка
+# может снять их на время вставки и затем вызвать reconcile_app_stats)
+APP_STATS_TRIGGERS = {
+    'trg_game_results_app_stats': '''
+        CREATE TRIGGER IF NOT EXISTS trg_game_results_app_stats
+        AFTER INSERT ON game_results
+        BEGIN
+            UPDATE app_stats
+            SET total_games = total_games + 1,
+                total_questions_answered = total_questions_answered + NEW.total,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+            INSERT INTO category_stats (category, games, total_percentage)
+            VALUES (NEW.category, 1, NEW.percentage)
+            ON CONFLICT(category) DO UPDATE SET
+                games = games + 1,
+                total_percentage = total_percentage + excluded.total_percentage;
+        END
+    ''',
+    'trg_user_profiles_app_stats': '''
+        CREATE TRIGGER IF NOT EXISTS trg_user_profiles_app_stats
+        AFTER INSERT ON user_profiles
+        BEGIN
+            UPDATE app_stats
+            SET total_users = total_users + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE id = 1;
+        END
+    '''
+}
+
+@migration(7, 'live_app_stats')
+def migrate_live_app_stats(cursor):
+    """Счетчики app_stats/category_stats, обновляемые триггерами при вставке"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_stats (
+            category TEXT PRIMARY KEY,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_percentage REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_category_stats_games
+        ON category_stats(games DESC)
+    ''')
+    
+    # /api/stats больше не агрегирует game_results по категориям
+    cursor.execute('DROP INDEX IF EXISTS idx_game_results_category')
+    
+    for create_sql in APP_STATS_TRIGGERS.values():
+        cursor.execute(create_sql)
+    
+    cursor.execute('DELETE FROM app_stats WHERE id != 1')
+    cursor.execute('INSERT OR IGNORE INTO app_stats (id) VALUES (1)')
+    reconcile_app_stats(cursor, fix=True)
+
+@migration(8, 'game_save_keys')
+def migrate_game_save_keys(cursor):
+    """Ключи идемпотентности сохраненных игр (повторная отправка не дублирует игру)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_save_keys (
+            user_id TEXT NOT NULL,
+            idempotency_key TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, idempotency_key)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_save_keys_created
+        ON game_save_keys(created_at)
+    ''')
+
+@migration(9, 'game_results_monthly')
+def migrate_game_results_monthly(cursor):
+    """Помесячные агрегаты игр пользователей и реестр архивных месяцев game_results"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_results_monthly (
+            user_id TEXT NOT NULL,
+            month TEXT NOT NULL,
+            category TEXT NOT NULL,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_score INTEGER NOT NULL DEFAULT 0,
+            total_questions INTEGER NOT NULL DEFAULT 0,
+            total_percentage REAL NOT NULL DEFAULT 0,
+            best_score REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, month, category)
+        ) WITHOUT ROWID
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS game_archive_partitions (
+            month TEXT PRIMARY KEY,
+            path TEXT NOT NULL,
+            games INTEGER NOT NULL,
+            archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Статистика профиля по категориям читается из помесячных агрегатов
+    cursor.execute('DROP INDEX IF EXISTS idx_game_results_user_category')
+    
+    # Архивация выбирает и удаляет строки по месяцу created_at
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_game_results_created
+        ON game_results(created_at)
+    ''')
+    
+    rebuild_game_results_monthly(cursor)
+
+@migration(10, 'leaderboard_periods')
+def migrate_leaderboard_periods(cursor):
+    """Агрегаты рейтингов за день, неделю и месяц (корзины по периодам)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leaderboard_periods (
+            user_id TEXT NOT NULL,
+            category TEXT NOT NULL,
+            period TEXT NOT NULL,
+            bucket TEXT NOT NULL,
+            username TEXT,
+            first_name TEXT,
+            games INTEGER NOT NULL DEFAULT 0,
+            total_percentage REAL NOT NULL DEFAULT 0,
+            best_score REAL NOT NULL DEFAULT 0,
+            avg_score REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, category, period, bucket)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Топ корзины и удаление устаревших корзин
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leaderboard_periods_rank
+        ON leaderboard_periods(period, bucket, category, avg_score DESC, best_score DESC, user_id)
+    ''')
+    
+    rebuild_leaderboard_periods(cursor)
+
+def get_schema_version(cursor):
+    """Текущая версия схемы (0 для новой или неотслеживаемой базы)"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    return cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+def run_migrations(conn, dry_run=False):
+    """Применение недостающих миграций по порядку.
+
+    Каждый шаг выполняется в своей транзакции BEGIN IMMEDIATE вместе с
+    записью в schema_version, поэтому прерванный шаг откатывается целиком,
+    а параллельно запущенные воркеры не применят его дважды. В WAL-режиме
+    читатели продолжают работать, пока строятся индексы. При dry_run все
+    шаги выполняются в одной транзакции и откатываются.
+
+    Возвращает [(version, name, [выполненные SQL])].
+    """
+    applied = []
+    conn.execute('BEGIN IMMEDIATE')
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
-            cursor = conn.cursor()
-            
-            # Таблица результатов игр
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS game_results (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    username TEXT,
-                    first_name TEXT,
-                    last_name TEXT,
-                    score INTEGER NOT NULL,
-                    total INTEGER NOT NULL,
-                    category TEXT NOT NULL,
-                    difficulty TEXT NOT NULL,
-                    percentage REAL NOT NULL,
-                    time_spent INTEGER DEFAULT 0,
-                    hints_used INTEGER DEFAULT 0,
-                    game_mode TEXT DEFAULT 'normal',
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Индекс для быстрого поиска по пользователю
-            cursor.execute('''
-                CREATE INDEX IF NOT EXISTS idx_game_results_user_id 
-                ON game_results(user_id)
-            ''')
-            
-            # Таблица профилей игроков
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS user_profiles (
-                    user_id TEXT PRIMARY KEY,
-                    username TEXT,
-                    first_name TEXT NOT NULL,
-                    last_name TEXT,
-                    total_games INTEGER DEFAULT 0,
-                    total_score INTEGER DEFAULT 0,
-                    best_streak INTEGER DEFAULT 0,
-                    current_streak INTEGER DEFAULT 0,
-                    achievements TEXT DEFAULT '[]',
-                    favorite_category TEXT,
-                    level INTEGER DEFAULT 1,
-                    experience_points INTEGER DEFAULT 0,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица ежедневных заданий
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS daily_challenges (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id TEXT NOT NULL,
-                    challenge_date DATE NOT NULL,
-                    challenge_type TEXT NOT NULL,
-                    target_value INTEGER NOT NULL,
-                    current_progress INTEGER DEFAULT 0,
-                    completed BOOLEAN DEFAULT FALSE,
-                    reward_claimed BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(user_id, challenge_date, challenge_type)
-                )
-            ''')
-            
-            # Таблица достижений
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS achievements (
-                    id TEXT PRIMARY KEY,
-                    name TEXT NOT NULL,
-                    description TEXT NOT NULL,
-                    icon TEXT NOT NULL,
-                    condition_type TEXT NOT NULL,
-                    condition_value INTEGER NOT NULL,
-                    reward_points INTEGER DEFAULT 0,
-                    rarity TEXT DEFAULT 'common'
-                )
-            ''')
+        cursor = conn.cursor()
+        for step in MIGRATIONS:
+            if step.version <= get_schema_version(cursor):
+                continue
             
-            # Таблица статистики приложения
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS app_stats (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    total_users INTEGER DEFAULT 0,
-                    total_games INTEGER DEFAULT 0,
-                    total_questions_answered INTEGER DEFAULT 0,
-                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
+            statements = []
+            conn.set_trace_callback(statements.append)
+            try:
+                step.apply(cursor)
+            finally:
+                conn.set_trace_callback(None)
+            cursor.execute(
+                'INSERT INTO schema_version (version, name) VALUES (?, ?)',
+                (step.version, step.name)
+            )
+            applied.append((step.version, step.name, statements))
             
-            conn.commit()
-            logger.info("✅ База данных инициализирована успешно")
+            if not dry_run:
+                conn.commit()
+                logger.info(f"✅ Миграция {step.version} ({step.name}) применена")
+                conn.execute('BEGIN IMMEDIATE')
+    finally:
+        conn.rollback()
+    return applied
+
+def init_database(dry_run=False):
+    """Инициализация базы данных: применение недостающих миграций схемы"""
+    try:
+        with closing(connect_db()) as conn:
+            applied = run_migrations(conn, dry_run)
+        
+        if dry_run:
+            logger.info(f"🔎 Ожидают применения миграций: {len(applied)}")
+        else:
+            logger.info(f"✅ База данных инициализирована успешно (новых миграций: {len(applied)})")
+        return applied
             
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации базы данных: {e}")
         raise
 
+def rebuild_game_results_monthly(cursor):
+    """Пересчет помесячных агрегатов по строкам game_results.
+
+    Агрегаты архивных месяцев остаются как есть: их строк в game_results уже нет.
+    """
+    cursor.execute('''
+        DELETE FROM game_results_monthly
+        WHERE month NOT IN (SELECT month FROM game_archive_partitions)
+    ''')
+    cursor.execute('''
+        INSERT INTO game_results_monthly
+        (user_id, month, category, games, total_score, total_questions, total_percentage, best_score)
+        SELECT user_id, substr(created_at, 1, 7), category, COUNT(*),
+               SUM(score), SUM(total), SUM(percentage), MAX(percentage)
+        FROM game_results
+        WHERE substr(created_at, 1, 7) NOT IN (SELECT month FROM game_archive_partitions)
+        GROUP BY user_id, substr(created_at, 1, 7), category
+    ''')
+    logger.info("✅ Помесячные агрегаты игр пересчитаны")
+
+def rebuild_leaderboard_stats(cursor):
+    """Полный пересчет агрегатов таблиц лидеров.
+
+    Источник — помесячные агрегаты, в которых учтены и архивные месяцы;
+    до появления их в схеме — строки game_results.
+    """
+    cursor.execute('DELETE FROM leaderboard_stats')
+    if table_columns(cursor, 'game_results_monthly'):
+        for category_expr in ('m.category', "'overall'"):
+            cursor.execute(f'''
+                INSERT INTO leaderboard_stats
+                (user_id, category, username, first_name, games, total_percentage, best_score, avg_score)
+                SELECT m.user_id, {category_expr}, p.username, p.first_name, SUM(m.games),
+                       SUM(m.total_percentage), MAX(m.best_score), SUM(m.total_percentage) / SUM(m.games)
+                FROM game_results_monthly m
+                LEFT JOIN user_profiles p ON p.user_id = m.user_id
+                GROUP BY m.user_id{', m.category' if category_expr == 'm.category' else ''}
+            ''')
+        logger.info("✅ Агрегаты таблиц лидеров пересчитаны")
+        return
+    
+    for category_expr in ('category', "'overall'"):
+        cursor.execute(f'''
+            INSERT INTO leaderboard_stats
+            (user_id, category, username, first_name, games, total_percentage, best_score, avg_score)
+            SELECT user_id, {category_expr}, username, first_name, COUNT(*),
+                   SUM(percentage), MAX(percentage), AVG(percentage)
+            FROM game_results
+            GROUP BY user_id{', category' if category_expr == 'category' else ''}
+        ''')
+    logger.info("✅ Агрегаты таблиц лидеров пересчитаны")
+
+def rebuild_leaderboard_periods(cursor, now=None):
+    """Пересчет корзин периодических рейтингов по играм в пределах срока хранения"""
+    now = now or datetime.now(timezone.utc)
+    cursor.execute('DELETE FROM leaderboard_periods')
+    since = now - timedelta(days=max(LEADERBOARD_PERIOD_RETENTION_DAYS.values()))
+    
+    aggregates = {}
+    for row in cursor.execute('''
+        SELECT g.user_id, g.category, g.percentage, g.created_at, p.username, p.first_name
+        FROM game_results g
+        LEFT JOIN user_profiles p ON p.user_id = g.user_id
+        WHERE g.created_at >= ?
+    ''', (since.strftime('%Y-%m-%d %H:%M:%S'),)):
+        played_at = datetime.strptime(row['created_at'][:19], '%Y-%m-%d %H:%M:%S')
+        for period, bucket in leaderboard_buckets(played_at).items():
+            for category in dict.fromkeys((row['category'], 'overall')):
+                key = (row['user_id'], category, period, bucket)
+                entry = aggregates.get(key)
+                if entry is None:
+                    entry = aggregates[key] = [row['username'], row['first_name'], 0, 0.0, 0.0]
+                entry[2] += 1
+                entry[3] += row['percentage']
+                entry[4] = max(entry[4], row['percentage'])
+    
+    cursor.executemany('''
+        INSERT INTO leaderboard_periods
+        (user_id, category, period, bucket, username, first_name, games, total_percentage, best_score, avg_score)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (*key, username, first_name, games, total, best, total / games)
+        for key, (username, first_name, games, total, best) in aggregates.items()
+    ])
+    expire_leaderboard_periods(cursor, now)
+    logger.info(f"✅ Периодические рейтинги пересчитаны ({len(aggregates)} строк)")
+
+def rebuild_user_progress(cursor):
+    """Пересчет освоенных категорий и user_progress по game_results"""
+    if table_columns(cursor, 'game_results_monthly'):
+        cursor.execute('''
+            INSERT OR IGNORE INTO user_mastered_categories (user_id, category)
+            SELECT DISTINCT user_id, category FROM game_results_monthly WHERE best_score >= 80
+        ''')
+    else:
+        cursor.execute('''
+            INSERT OR IGNORE INTO user_mastered_categories (user_id, category)
+            SELECT DISTINCT user_id, category FROM game_results WHERE percentage >= 80
+        ''')
+    cursor.execute('''
+        INSERT INTO user_progress (user_id, mastered_categories)
+        SELECT user_id, (
+            SELECT COUNT(*) FROM user_mastered_categories m WHERE m.user_id = p.user_id
+        )
+        FROM user_profiles p WHERE true
+        ON CONFLICT(user_id) DO UPDATE SET mastered_categories = excluded.mastered_categories
+    ''')
+    logger.info("✅ Счетчики прогресса пользователей пересчитаны")
+
+def reconcile_app_stats(cursor, fix=False):
+    """Сверка счетчиков app_stats/category_stats с исходными таблицами.
+
+    Возвращает расхождения {счетчик: (сохранено, фактически)}; при fix=True
+    счетчики перезаписываются фактическими значениями.
+    """
+    stored = cursor.execute('SELECT * FROM app_stats WHERE id = 1').fetchone()
+    actual = {
+        'total_users': cursor.execute('SELECT COUNT(*) FROM user_profiles').fetchone()[0],
+        'total_games': cursor.execute('SELECT COUNT(*) FROM game_results').fetchone()[0],
+        'total_questions_answered': cursor.execute(
+            'SELECT COALESCE(SUM(total), 0) FROM game_results'
+        ).fetchone()[0]
+    }
+    actual_categories = {
+        row['category']: (row['games'], row['total_percentage'])
+        for row in cursor.execute('''
+            SELECT category, COUNT(*) AS games, SUM(percentage) AS total_percentage
+            FROM game_results GROUP BY category
+        ''')
+    }
+    
+    # Строки архивных месяцев перенесены из game_results, их учитываем по помесячным агрегатам
+    if table_columns(cursor, 'game_archive_partitions'):
+        for row in cursor.execute('''
+            SELECT category, SUM(games) AS games, SUM(total_questions) AS questions,
+                   SUM(total_percentage) AS total_percentage
+            FROM game_results_monthly
+            WHERE month IN (SELECT month FROM game_archive_partitions)
+            GROUP BY category
+        ''').fetchall():
+            actual['total_games'] += row['games']
+            actual['total_questions_answered'] += row['questions']
+            games, total_percentage = actual_categories.get(row['category'], (0, 0.0))
+            actual_categories[row['category']] = (games + row['games'], total_percentage + row['total_percentage'])
+    
+    drift = {
+        key: (stored[key] if stored else None, value)
+        for key, value in actual.items()
+        if not stored or stored[key] != value
+    }
+    
+    stored_categories = {
+        row['category']: (row['games'], row['total_percentage'])
+        for row in cursor.execute('SELECT * FROM category_stats')
+    }
+    for category in stored_categories.keys() | actual_categories.keys():
+        stored_value = stored_categories.get(category)
+        actual_value = actual_categories.get(category)
+        if stored_value is None or actual_value is None or (
+            stored_value[0] != actual_value[0] or abs(stored_value[1] - actual_value[1]) > 1e-6
+        ):
+            drift[f'category:{category}'] = (stored_value, actual_value)
+    
+    if drift:
+        logger.warning(f"⚠️ Расхождение счетчиков статистики: {drift}")
+    
+    if drift and fix:
+        cursor.execute('''
+            INSERT OR REPLACE INTO app_stats
+            (id, total_users, total_games, total_questions_answered, updated_at)
+            VALUES (1, ?, ?, ?, CURRENT_TIMESTAMP)
+        ''', (actual['total_users'], actual['total_games'], actual['total_questions_answered']))
+        cursor.execute('DELETE FROM category_stats')
+        cursor.executemany(
+            'INSERT INTO category_stats (category, games, total_percentage) VALUES (?, ?, ?)',
+            [(category, games, total) for category, (games, total) in actual_categories.items()]
+        )
+    
+    return drift
+
 def init_achievements():
     """Инициализация стандартных достижений"""
     achievements = [
@@ -312,26 +2022,48 @@ def init_achievements():
     ]
     
     try:
-        with sqlite3.connect(DATABASE_PATH) as conn:
+        with storage.connection() as conn, conn:
             cursor = conn.cursor()
-            
-            for ach in achievements:
-                cursor.execute('''
-                    INSERT OR REPLACE INTO achievements 
-                    (id, name, description, icon, condition_type, condition_value, reward_points, rarity)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (
-                    ach['id'], ach['name'], ach['description'], ach['icon'],
-                    ach['condition_type'], ach['condition_value'], 
-                    ach['reward_points'], ach['rarity']
-                ))
-            
+            upsert_achievements(cursor, achievements)
             conn.commit()
             logger.info(f"✅ Инициализировано {len(achievements)} достижений")
             
+            reset_achievement_catalogue(cursor)
+            
     except Exception as e:
         logger.error(f"❌ Ошибка инициализации достижений: {e}")
 
+AchievementCatalogue = namedtuple('AchievementCatalogue', ['all', 'by_id', 'by_condition'])
+
+_achievement_catalogue = None
+
+def load_achievement_catalogue(cursor):
+    """Неизменяемый каталог достижений с индексом по condition_type"""
+    rows = tuple(fetch_achievements(cursor))
+    by_condition = {}
+    for row in rows:
+        by_condition.setdefault(row['condition_type'], []).append(row)
+    return AchievementCatalogue(
+        rows,
+        MappingProxyType({row['id']: row for row in rows}),
+        MappingProxyType({key: tuple(value) for key, value in by_condition.items()})
+    )
+
+def reset_achievement_catalogue(cursor):
+    """Перезагрузка каталога после изменения таблицы achievements"""
+    global _achievement_catalogue
+    _achievement_catalogue = load_achievement_catalogue(cursor)
+
+def get_achievement_catalogue(cursor):
+    """Каталог достижений; загружается из базы один раз на процесс"""
+    global _achievement_catalogue
+    if _achievement_catalogue is None:
+        catalogue = load_achievement_catalogue(cursor)
+        if not catalogue.all:
+            return catalogue  # Таблица еще не заполнена, не кэшируем
+        _achievement_catalogue = catalogue
+    return _achievement_catalogue
+
 def create_questions_file():
     """Создание файла с вопросами"""
     questions = {
@@ -693,220 +2425,863 @@ def create_questions_file():
         logger.error(f"❌ Ошибка создания файла вопросов: {e}")
         raise
 
+QuestionSnapshot = namedtuple('QuestionSnapshot', ['version', 'data', 'encoded', 'total', 'signature'])
+
+class QuestionBank:
+    """Банк вопросов в памяти процесса с горячей перезагрузкой файла.
+
+    Файл разбирается один раз, после чего запросы получают неизменяемый
+    снимок: category -> difficulty -> tuple(questions), а также заранее
+    сериализованные в JSON вопросы в той же структуре. Новый снимок
+    подменяет старый целиком только при изменении mtime/размера файла.
+    """
+
+    def __init__(self, path, check_interval=1.0):
+        self.path = path
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._snapshot = QuestionSnapshot(0, MappingProxyType({}), MappingProxyType({}), 0, None)
+        self._last_check = 0.0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.last_parse_time = 0.0
+        self.total_parse_time = 0.0
+
+    def _file_signature(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _parse(self):
+        with open(self.path, 'r', encoding='utf-8') as f:
+            raw = json.load(f)
+
+        data = {}
+        encoded = {}
+        total = 0
+        for category, difficulties in raw.items():
+            data[category] = MappingProxyType({
+                difficulty: tuple(questions)
+                for difficulty, questions in difficulties.items()
+            })
+            encoded[category] = MappingProxyType({
+                difficulty: tuple(encode_json(question) for question in questions)
+                for difficulty, questions in difficulties.items()
+            })
+            total += sum(len(questions) for questions in data[category].values())
+        return MappingProxyType(data), MappingProxyType(encoded), total
+
+    def reload(self, force=False):
+        """Перечитывает файл, если он изменился (или принудительно)"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                logger.info("📄 Файл вопросов не найден, создаем новый...")
+                create_questions_file()
+
+            signature = self._file_signature()
+            if not force and signature == self._snapshot.signature:
+                return self._snapshot
+
+            started = time.perf_counter()
+            try:
+                data, encoded, total = self._parse()
+            except Exception as e:
+                self.reload_errors += 1
+                logger.error(f"❌ Ошибка загрузки вопросов: {e}")
+                return self._snapshot
+            elapsed = time.perf_counter() - started
+
+            self._snapshot = QuestionSnapshot(self._snapshot.version + 1, data, encoded, total, signature)
+            self.reloads += 1
+            self.last_parse_time = elapsed
+            self.total_parse_time += elapsed
+
+            logger.info(f"✅ Загружено {len(data)} категорий, {total} вопросов ({elapsed * 1000:.1f} мс)")
+            return self._snapshot
+
+    def snapshot(self):
+        """Текущий снимок; файл проверяется не чаще раза в check_interval секунд"""
+        now = time.monotonic()
+        if self._snapshot.signature is None or now - self._last_check >= self.check_interval:
+            self._last_check = now
+            try:
+                return self.reload()
+            except OSError as e:
+                logger.error(f"❌ Ошибка проверки файла вопросов: {e}")
+        return self._snapshot
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'version': snapshot.version,
+            'categories': len(snapshot.data),
+            'loaded': snapshot.total,
+            'reloads': self.reloads,
+            'reload_errors': self.reload_errors,
+            'last_parse_ms': round(self.last_parse_time * 1000, 3),
+            'total_parse_ms': round(self.total_parse_time * 1000, 3)
+        }
+
+question_bank = QuestionBank(QUESTIONS_FILE)
+
 def load_questions():
-    """Загрузка вопросов из файла"""
-    try:
-        if not os.path.exists(QUESTIONS_FILE):
-            logger.info("📄 Файл вопросов не найден, создаем новый...")
-            create_questions_file()
-        
-        with open(QUESTIONS_FILE, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            
-        # Подсчет общего количества вопросов
-        total_questions = sum(
-            len(difficulties.get(diff, [])) 
-            for category, difficulties in data.items()
-            for diff in ['easy', 'medium', 'hard']
+    """Получение вопросов из банка в памяти (category -> difficulty -> tuple)"""
+    return question_bank.snapshot().data
+
+def sample_questions(questions, limit=None, rng=random):
+    """Равномерная выборка limit вопросов без копирования всего списка.
+
+    Выбираются только индексы (random.sample по range работает за O(limit)),
+    поэтому стоимость не зависит от размера банка.
+    """
+    if limit is None or limit > len(questions):
+        limit = len(questions)
+    return [questions[i] for i in rng.sample(range(len(questions)), limit)]
+
+def get_request_rng():
+    """Генератор случайных чисел с учетом параметра seed запроса"""
+    seed = request.args.get('seed')
+    return random.Random(seed) if seed else random
+
+def parse_question_weights(value):
+    """Разбор весов 'ключ:вес,...'; вес — конечное число от 0 до MAX_QUESTION_WEIGHT"""
+    weights = {}
+    for item in filter(None, value.split(',')):
+        key, _, weight = item.partition(':')
+        weight = float(weight)
+        if not key or not math.isfinite(weight) or not 0 <= weight <= MAX_QUESTION_WEIGHT:
+            raise ValueError(f"Invalid weight: {item}")
+        weights[key] = weight
+    return weights
+
+def sample_mixed_questions(questions_data, count, categories=None, difficulties=None,
+                           category_weights=None, difficulty_weights=None, rng=random):
+    """Выборка вопросов из нескольких категорий и сложностей без повторов.
+
+    Вес пула (category, difficulty) равен произведению весов категории и
+    сложности (по умолчанию 1). Каждый следующий вопрос берется из пула с
+    вероятностью, пропорциональной весу пула и числу оставшихся в нем
+    вопросов, поэтому полные списки не копируются и не перемешиваются.
+    """
+    category_weights = category_weights or {}
+    difficulty_weights = difficulty_weights or {}
+    pools = []
+    for category, difficulties_data in questions_data.items():
+        if categories and category not in categories:
+            continue
+        for difficulty, questions in difficulties_data.items():
+            if difficulties and difficulty not in difficulties:
+                continue
+            weight = category_weights.get(category, 1.0) * difficulty_weights.get(difficulty, 1.0)
+            if questions and weight > 0:
+                pools.append([category, difficulty, questions, weight, set()])
+
+    result = []
+    while pools and len(result) < count:
+        pool = rng.choices(
+            pools,
+            weights=[p[3] * (len(p[2]) - len(p[4])) for p in pools]
+        )[0]
+        category, difficulty, questions, weight, taken = pool
+
+        index = rng.randrange(len(questions))
+        while index in taken:
+            index = rng.randrange(len(questions))
+        taken.add(index)
+        if len(taken) == len(questions):
+            pools.remove(pool)
+
+        result.append(dict(questions[index], category=category, difficulty=difficulty))
+
+    return result
+
+# =====================================
+# ДОСТУП К ДАННЫМ
+# =====================================
+# Все запросы приложения к базе. Функции получают cursor и не делают
+# commit; SQL общий для SQLite и PostgreSQL (плейсхолдеры ?, ON CONFLICT
+# вместо INSERT OR IGNORE/REPLACE, без скалярных MAX/MIN).
+
+# --- Профили ---
+
+def fetch_profile(cursor, user_id):
+    return cursor.execute('SELECT * FROM user_profiles WHERE user_id = ?', (user_id,)).fetchone()
+
+def count_profiles(cursor):
+    return cursor.execute('SELECT COUNT(*) FROM user_profiles').fetchone()[0]
+
+def upsert_profiles(cursor, users):
+    """Создание профилей или обновление имен пользователей"""
+    cursor.executemany('''
+        INSERT INTO user_profiles
+        (user_id, username, first_name, last_name, total_games, total_score,
+         best_streak, current_streak, level, experience_points)
+        VALUES (?, ?, ?, ?, 0, 0, 0, 0, 1, 0)
+        ON CONFLICT(user_id) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            last_name = excluded.last_name,
+            updated_at = CURRENT_TIMESTAMP
+    ''', [
+        (
+            user.get('user_id'),
+            user.get('username', ''),
+            user.get('first_name', 'Игрок'),
+            user.get('last_name', '')
+        ) for user in users
+    ])
+
+def add_profile_game(cursor, user_id, score):
+    cursor.execute('''
+        UPDATE user_profiles
+        SET total_games = total_games + 1,
+            total_score = total_score + ?,
+            updated_at = CURRENT_TIMESTAMP
+        WHERE user_id = ?
+    ''', (score, user_id))
+
+def update_profile_streaks(cursor, user_id, best_streak, current_streak):
+    cursor.execute('''
+        UPDATE user_profiles SET best_streak = ?, current_streak = ? WHERE user_id = ?
+    ''', (best_streak, current_streak, user_id))
+
+def add_experience_points(cursor, user_id, points):
+    cursor.execute('''
+        UPDATE user_profiles
+        SET experience_points = experience_points + ?
+        WHERE user_id = ?
+    ''', (points, user_id))
+
+# --- Результаты игр ---
+
+def insert_game_results(cursor, games, percentages, created_at):
+    cursor.executemany('''
+        INSERT INTO game_results
+        (user_id, username, first_name, last_name, score, total, category,
+         difficulty, percentage, time_spent, hints_used, game_mode, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [
+        (
+            data.get('user_id'),
+            data.get('username', ''),
+            data.get('first_name', 'Игрок'),
+            data.get('last_name', ''),
+            data.get('score', 0),
+            data.get('total', 0),
+            data.get('category', 'unknown'),
+            data.get('difficulty', 'easy'),
+            percentage,
+            data.get('time_spent', 0),
+            data.get('hints_used', 0),
+            data.get('game_mode', 'normal'),
+            created_at
+        ) for data, percentage in zip(games, percentages)
+    ])
+
+def upsert_monthly_rollups(cursor, games, percentages, month):
+    """Помесячные агрегаты пользователя по категориям (история после архивации)"""
+    cursor.executemany('''
+        INSERT INTO game_results_monthly
+        (user_id, month, category, games, total_score, total_questions, total_percentage, best_score)
+        VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+        ON CONFLICT(user_id, month, category) DO UPDATE SET
+            games = game_results_monthly.games + 1,
+            total_score = game_results_monthly.total_score + excluded.total_score,
+            total_questions = game_results_monthly.total_questions + excluded.total_questions,
+            total_percentage = game_results_monthly.total_percentage + excluded.total_percentage,
+            best_score = CASE WHEN excluded.best_score > game_results_monthly.best_score
+                              THEN excluded.best_score ELSE game_results_monthly.best_score END
+    ''', [
+        (
+            data.get('user_id'),
+            month,
+            data.get('category', 'unknown'),
+            data.get('score', 0),
+            data.get('total', 0),
+            percentage,
+            percentage
+        ) for data, percentage in zip(games, percentages)
+    ])
+
+def fetch_user_category_stats(cursor, user_id):
+    return cursor.execute('''
+        SELECT category, SUM(games) as games,
+               SUM(total_percentage) / SUM(games) as avg_score, MAX(best_score) as best_score
+        FROM game_results_monthly
+        WHERE user_id = ?
+        GROUP BY category
+    ''', (user_id,)).fetchall()
+
+def fetch_recent_games(cursor, user_id, limit=10):
+    return cursor.execute('''
+        SELECT category, difficulty, score, total, percentage, created_at
+        FROM game_results
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT ?
+    ''', (user_id, limit)).fetchall()
+
+def insert_idempotency_key(cursor, user_id, key):
+    """True, если ключ записан впервые"""
+    cursor.execute(
+        'INSERT INTO game_save_keys (user_id, idempotency_key) VALUES (?, ?) ON CONFLICT DO NOTHING',
+        (user_id, key)
+    )
+    return cursor.rowcount == 1
+
+def delete_idempotency_keys(cursor, before):
+    cursor.execute('DELETE FROM game_save_keys WHERE created_at < ?', (before,))
+    return cursor.rowcount
+
+# --- Таблицы лидеров ---
+
+def upsert_leaderboard_stats(cursor, user_data, categories, percentage):
+    cursor.executemany('''
+        INSERT INTO leaderboard_stats
+        (user_id, category, username, first_name, games, total_percentage, best_score, avg_score)
+        VALUES (?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT(user_id, category) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            games = leaderboard_stats.games + 1,
+            total_percentage = leaderboard_stats.total_percentage + excluded.total_percentage,
+            best_score = CASE WHEN excluded.best_score > leaderboard_stats.best_score
+                              THEN excluded.best_score ELSE leaderboard_stats.best_score END,
+            avg_score = (leaderboard_stats.total_percentage + excluded.total_percentage)
+                        / (leaderboard_stats.games + 1)
+    ''', [
+        (
+            user_data.get('user_id'),
+            category,
+            user_data.get('username', ''),
+            user_data.get('first_name', 'Игрок'),
+            percentage,
+            percentage,
+            percentage
+        ) for category in categories
+    ])
+
+def fetch_user_leaderboard_rows(cursor, user_id, category):
+    return cursor.execute('''
+        SELECT * FROM leaderboard_stats WHERE user_id = ? AND category IN (?, 'overall')
+    ''', (user_id, category)).fetchall()
+
+def fetch_leaderboard_rows(cursor, category, limit):
+    """Лучшие строки leaderboard_stats по категории"""
+    return cursor.execute('''
+        SELECT user_id, username, first_name, games, avg_score, best_score
+        FROM leaderboard_stats
+        WHERE category = ? AND games >= ?
+        ORDER BY avg_score DESC, best_score DESC, user_id
+        LIMIT ?
+    ''', (category, leaderboard_min_games(category), limit)).fetchall()
+
+def upsert_leaderboard_periods(cursor, user_data, categories, buckets, percentage):
+    cursor.executemany('''
+        INSERT INTO leaderboard_periods
+        (user_id, category, period, bucket, username, first_name, games, total_percentage, best_score, avg_score)
+        VALUES (?, ?, ?, ?, ?, ?, 1, ?, ?, ?)
+        ON CONFLICT(user_id, category, period, bucket) DO UPDATE SET
+            username = excluded.username,
+            first_name = excluded.first_name,
+            games = leaderboard_periods.games + 1,
+            total_percentage = leaderboard_periods.total_percentage + excluded.total_percentage,
+            best_score = CASE WHEN excluded.best_score > leaderboard_periods.best_score
+                              THEN excluded.best_score ELSE leaderboard_periods.best_score END,
+            avg_score = (leaderboard_periods.total_percentage + excluded.total_percentage)
+                        / (leaderboard_periods.games + 1)
+    ''', [
+        (
+            user_data.get('user_id'),
+            category,
+            period,
+            bucket,
+            user_data.get('username', ''),
+            user_data.get('first_name', 'Игрок'),
+            percentage,
+            percentage,
+            percentage
+        ) for category in categories for period, bucket in buckets.items()
+    ])
+
+def fetch_user_period_rows(cursor, user_id, category, buckets):
+    """Строки пользователя в текущих корзинах (форматы корзин периодов не пересекаются)"""
+    return cursor.execute('''
+        SELECT * FROM leaderboard_periods
+        WHERE user_id = ? AND category IN (?, 'overall') AND bucket IN (?, ?, ?)
+    ''', (user_id, category, *buckets.values())).fetchall()
+
+def fetch_period_leaderboard_rows(cursor, period, bucket, category, limit):
+    """Лучшие строки корзины периодического рейтинга"""
+    return cursor.execute('''
+        SELECT user_id, username, first_name, games, avg_score, best_score
+        FROM leaderboard_periods
+        WHERE period = ? AND bucket = ? AND category = ? AND games >= ?
+        ORDER BY avg_score DESC, best_score DESC, user_id
+        LIMIT ?
+    ''', (period, bucket, category, leaderboard_min_games(category), limit)).fetchall()
+
+def delete_leaderboard_periods_before(cursor, period, bucket):
+    cursor.execute('DELETE FROM leaderboard_periods WHERE period = ? AND bucket < ?', (period, bucket))
+    return cursor.rowcount
+
+# --- Прогресс и достижения ---
+
+def fetch_user_progress(cursor, user_id):
+    """Счетчики прогресса; строка создается при первом обращении"""
+    cursor.execute('INSERT INTO user_progress (user_id) VALUES (?) ON CONFLICT DO NOTHING', (user_id,))
+    return cursor.execute('SELECT * FROM user_progress WHERE user_id = ?', (user_id,)).fetchone()
+
+def add_mastered_category(cursor, user_id, category):
+    """1, если категория освоена впервые, иначе 0"""
+    cursor.execute(
+        'INSERT INTO user_mastered_categories (user_id, category) VALUES (?, ?) ON CONFLICT DO NOTHING',
+        (user_id, category)
+    )
+    return cursor.rowcount
+
+def update_progress_counters(cursor, user_id, mastered_categories, daily_streak, best_daily_streak, last_played_date):
+    cursor.execute('''
+        UPDATE user_progress
+        SET mastered_categories = ?, daily_streak = ?,
+            best_daily_streak = ?, last_played_date = ?
+        WHERE user_id = ?
+    ''', (mastered_categories, daily_streak, best_daily_streak, last_played_date, user_id))
+
+def fetch_achievements(cursor):
+    return cursor.execute('SELECT * FROM achievements ORDER BY rarity, name').fetchall()
+
+def upsert_achievements(cursor, achievements):
+    cursor.executemany('''
+        INSERT INTO achievements
+        (id, name, description, icon, condition_type, condition_value, reward_points, rarity)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT(id) DO UPDATE SET
+            name = excluded.name,
+            description = excluded.description,
+            icon = excluded.icon,
+            condition_type = excluded.condition_type,
+            condition_value = excluded.condition_value,
+            reward_points = excluded.reward_points,
+            rarity = excluded.rarity
+    ''', [
+        (
+            ach['id'], ach['name'], ach['description'], ach['icon'],
+            ach['condition_type'], ach['condition_value'],
+            ach['reward_points'], ach['rarity']
+        ) for ach in achievements
+    ])
+
+def fetch_unlocked_achievement_ids(cursor, user_id):
+    return {
+        row['achievement_id'] for row in cursor.execute(
+            'SELECT achievement_id FROM user_achievements WHERE user_id = ?', (user_id,)
         )
-        
-        logger.info(f"✅ Загружено {len(data)} категорий, {total_questions} вопросов")
-        return data
-        
-    except Exception as e:
-        logger.error(f"❌ Ошибка загрузки вопросов: {e}")
-        return {}
+    }
+
+def insert_user_achievements(cursor, user_id, achievement_ids):
+    cursor.executemany(
+        'INSERT INTO user_achievements (user_id, achievement_id) VALUES (?, ?) ON CONFLICT DO NOTHING',
+        [(user_id, achievement_id) for achievement_id in achievement_ids]
+    )
+
+# --- Ежедневные задания ---
+
+def fetch_daily_challenge(cursor, user_id, challenge_date):
+    """Последнее задание пользователя на дату"""
+    return cursor.execute('''
+        SELECT * FROM daily_challenges
+        WHERE user_id = ? AND challenge_date = ?
+        ORDER BY id DESC
+        LIMIT 1
+    ''', (user_id, challenge_date)).fetchone()
+
+def fetch_open_daily_challenges(cursor, user_id, challenge_date):
+    return cursor.execute('''
+        SELECT * FROM daily_challenges
+        WHERE user_id = ? AND challenge_date = ? AND completed = FALSE
+    ''', (user_id, challenge_date)).fetchall()
+
+def insert_daily_challenge(cursor, user_id, challenge_date, challenge_type, target_value):
+    cursor.execute('''
+        INSERT INTO daily_challenges
+        (user_id, challenge_date, challenge_type, target_value)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT DO NOTHING
+    ''', (user_id, challenge_date, challenge_type, target_value))
+
+def update_daily_challenge(cursor, challenge_id, current_progress, completed):
+    cursor.execute('''
+        UPDATE daily_challenges
+        SET current_progress = ?, completed = ?
+        WHERE id = ?
+    ''', (current_progress, completed, challenge_id))
+
+# --- Статистика приложения ---
+
+def fetch_app_stats(cursor):
+    return cursor.execute('SELECT * FROM app_stats WHERE id = 1').fetchone()
+
+def fetch_category_stats(cursor):
+    return cursor.execute('''
+        SELECT category, games, total_percentage
+        FROM category_stats
+        ORDER BY games DESC
+    ''').fetchall()
 
 # =====================================
 # БИЗНЕС-ЛОГИКА
 # =====================================
 
-def create_or_update_user_profile(user_data):
-    """Создание или обновление профиля пользователя"""
-    try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        user_id = user_data.get('user_id')
-        if not user_id:
-            raise ValueError("User ID is required")
-        
-        # Проверяем существование профиля
-        existing = cursor.execute(
-            'SELECT user_id FROM user_profiles WHERE user_id = ?', 
-            (user_id,)
-        ).fetchone()
+def create_or_update_user_profile(cursor, user_data):
+    """Создание или обновление профиля пользователя (без commit)"""
+    user_id = user_data.get('user_id')
+    if not user_id:
+        raise ValueError("User ID is required")
+    
+    upsert_profiles(cursor, [user_data])
+    logger.debug(f"Upserted profile for user {user_id}")
+
+def utc_today():
+    """Текущая дата по UTC: общая граница суток для серий, заданий и рейтингов"""
+    return datetime.now(timezone.utc).date()
+
+def leaderboard_buckets(moment):
+    """Корзины рейтингов за день, ISO-неделю и месяц, в которые попадает момент (UTC)"""
+    year, week, _ = moment.isocalendar()
+    return {
+        'day': moment.strftime('%Y-%m-%d'),
+        'week': f'{year}-W{week:02d}',
+        'month': moment.strftime('%Y-%m')
+    }
+
+def expire_leaderboard_periods(cursor, now):
+    """Удаление корзин старше LEADERBOARD_PERIOD_RETENTION_DAYS; возвращает число строк"""
+    removed = 0
+    for period, days in LEADERBOARD_PERIOD_RETENTION_DAYS.items():
+        oldest = leaderboard_buckets(now - timedelta(days=days))[period]
+        removed += delete_leaderboard_periods_before(cursor, period, oldest)
+    return removed
+
+_leaderboard_periods_expired_on = None
+# (сутки, удалено строк) в еще не закрытой транзакции текущего потока
+_leaderboard_periods_expiry = threading.local()
+
+def expire_leaderboard_periods_daily(cursor, now):
+    """Удаление устаревших корзин при первой записи игры за сутки.
+
+    Сутки отмечаются обработанными только после commit
+    (mark_leaderboard_periods_expired): если транзакция откатится,
+    удаление повторит следующая запись.
+    """
+    _leaderboard_periods_expiry.pending = None
+    today = now.strftime('%Y-%m-%d')
+    if _leaderboard_periods_expired_on != today:
+        _leaderboard_periods_expiry.pending = (today, expire_leaderboard_periods(cursor, now))
+
+def mark_leaderboard_periods_expired():
+    """Отметка об удалении устаревших корзин после commit транзакции этого потока"""
+    global _leaderboard_periods_expired_on
+    pending = getattr(_leaderboard_periods_expiry, 'pending', None)
+    if pending is None:
+        return
+    _leaderboard_periods_expiry.pending = None
+    _leaderboard_periods_expired_on, removed = pending
+    if removed:
+        logger.info(f"🧹 Удалено устаревших строк периодических рейтингов: {removed}")
+
+def update_leaderboard_stats(cursor, user_data, category, percentage, buckets):
+    """Инкрементальное обновление агрегатов лидеров для категории и 'overall'
+    за все время и в текущих корзинах дня, недели и месяца.
+
+    Возвращает обновленные строки leaderboard_stats и leaderboard_periods.
+    """
+    # Одна категория не должна попасть в upsert дважды
+    categories = tuple(dict.fromkeys((category, 'overall')))
+    upsert_leaderboard_stats(cursor, user_data, categories, percentage)
+    upsert_leaderboard_periods(cursor, user_data, categories, buckets, percentage)
+    return (
+        fetch_user_leaderboard_rows(cursor, user_data.get('user_id'), category)
+        + fetch_user_period_rows(cursor, user_data.get('user_id'), category, buckets)
+    )
+
+def update_user_progress(cursor, user_id, game_result):
+    """Инкрементальное обновление счетчиков прогресса (без commit).
+
+    Каждая игра стоит O(1) запросов независимо от длины истории.
+    Возвращает счетчики, по которым проверяются достижения.
+    """
+    progress = fetch_user_progress(cursor, user_id)
+    profile = fetch_profile(cursor, user_id)
+    
+    # Категории с результатом 80%+
+    mastered_categories = progress['mastered_categories']
+    if game_result.get('percentage', 0) >= 80:
+        mastered_categories += add_mastered_category(cursor, user_id, game_result.get('category'))
+    
+    # Серия дней подряд
+    today = utc_today()
+    daily_streak = progress['daily_streak']
+    if progress['last_played_date'] != today.isoformat():
+        yesterday = (today - timedelta(days=1)).isoformat()
+        daily_streak = daily_streak + 1 if progress['last_played_date'] == yesterday else 1
+    
+    # Серия правильных ответов: идеальная игра продолжает серию прошлых игр
+    total = game_result.get('total', 0)
+    if total and game_result.get('score') == total:
+        current_streak = profile['current_streak'] + total
+    else:
+        current_streak = game_result.get('current_streak', 0)
+    best_streak = max(profile['best_streak'], game_result.get('best_streak', 0), current_streak)
+    
+    update_progress_counters(
+        cursor, user_id, mastered_categories, daily_streak,
+        max(progress['best_daily_streak'], daily_streak), today.isoformat()
+    )
+    update_profile_streaks(cursor, user_id, best_streak, current_streak)
+    
+    return {
+        'games_played': profile['total_games'],
+        'category_master': mastered_categories,
+        'answer_streak': best_streak,
+        'daily_streak': daily_streak
+    }
+
+def check_achievements(cursor, user_id, game_result, progress):
+    """Проверка и присвоение достижений по счетчикам прогресса (без commit)"""
+    unlocked = fetch_unlocked_achievement_ids(cursor, user_id)
+    new_achievements = []
+    
+    # Проверяем только достижения, на условия которых влияет эта игра
+    percentage = game_result.get('percentage', 0)
+    condition_types = ['games_played', 'speed_completion', 'answer_streak', 'daily_streak']
+    if percentage == 100:
+        condition_types.append('perfect_score')
+    if percentage >= 80:
+        condition_types.append('category_master')
+    if game_result.get('game_mode') == 'marathon':
+        condition_types.append('marathon_completed')
+    
+    by_condition = get_achievement_catalogue(cursor).by_condition
+    candidates = [
+        achievement
+        for condition_type in condition_types
+        for achievement in by_condition.get(condition_type, ())
+    ]
+    
+    for achievement in candidates:
+        if achievement['id'] in unlocked:
+            continue
         
-        if existing:
-            # Обновляем существующий профиль
-            cursor.execute('''
-                UPDATE user_profiles 
-                SET username = ?, first_name = ?, last_name = ?, updated_at = CURRENT_TIMESTAMP
-                WHERE user_id = ?
-            ''', (
-                user_data.get('username', ''),
-                user_data.get('first_name', 'Игрок'),
-                user_data.get('last_name', ''),
-                user_id
-            ))
-            logger.debug(f"Updated profile for user {user_id}")
+        condition_type = achievement['condition_type']
+        if condition_type in progress:
+            earned = progress[condition_type] >= achievement['condition_value']
+        elif condition_type == 'perfect_score':
+            earned = percentage == 100
+        elif condition_type == 'marathon_completed':
+            earned = game_result.get('game_mode') == 'marathon'
+        elif condition_type == 'speed_completion':
+            earned = game_result.get('time_spent', 999) <= achievement['condition_value']
         else:
-            # Создаем новый профиль
-            cursor.execute('''
-                INSERT INTO user_profiles 
-                (user_id, username, first_name, last_name, total_games, total_score, 
-                 best_streak, current_streak, achievements, level, experience_points)
-                VALUES (?, ?, ?, ?, 0, 0, 0, 0, '[]', 1, 0)
-            ''', (
-                user_id,
-                user_data.get('username', ''),
-                user_data.get('first_name', 'Игрок'),
-                user_data.get('last_name', '')
-            ))
-            logger.info(f"Created new profile for user {user_id}")
-        
-        db.commit()
-        return True
+            earned = False
         
-    except Exception as e:
-        logger.error(f"Error creating/updating user profile: {e}")
-        return False
+        if earned:
+            new_achievements.append({
+                'id': achievement['id'],
+                'name': achievement['name'],
+                'description': achievement['description'],
+                'icon': achievement['icon'],
+                'points': achievement['reward_points'],
+                'rarity': achievement['rarity']
+            })
+    
+    if new_achievements:
+        insert_user_achievements(cursor, user_id, [ach['id'] for ach in new_achievements])
+        add_experience_points(cursor, user_id, sum(ach['points'] for ach in new_achievements))
+    
+    return new_achievements
 
-def check_achievements(user_id, game_result):
-    """Проверка и присвоение достижений"""
-    try:
-        db = get_db()
-        cursor = db.cursor()
-        
-        # Получаем текущие достижения пользователя
-        profile = cursor.execute(
-            'SELECT achievements, total_games FROM user_profiles WHERE user_id = ?',
-            (user_id,)
-        ).fetchone()
-        
-        if not profile:
-            return []
-        
-        current_achievements = json.loads(profile['achievements'] or '[]')
-        new_achievements = []
-        
-        # Получаем все достижения
-        all_achievements = cursor.execute('SELECT * FROM achievements').fetchall()
+def update_daily_challenge_progress(cursor, user_id, game_result):
+    """Обновление прогресса ежедневных заданий (без commit)"""
+    today = utc_today()
+    
+    # Получаем активные задания пользователя на сегодня
+    challenges = fetch_open_daily_challenges(cursor, user_id, today)
+    
+    for challenge in challenges:
+        progress_made = False
+        new_progress = challenge['current_progress']
         
-        for achievement in all_achievements:
-            if achievement['id'] in current_achievements:
-                continue
-                
-            # Проверяем условия для достижения
-            earned = False
-            
-            if achievement['condition_type'] == 'games_played':
-                total_games = profile['total_games'] + 1  # +1 за текущую игру
-                earned = total_games >= achievement['condition_value']
-                
-            elif achievement['condition_type'] == 'perfect_score':
-                earned = game_result.get('percentage', 0) == 100
-                
-            elif achievement['condition_type'] == 'marathon_completed':
-                earned = game_result.get('game_mode') == 'marathon'
-                
-            elif achievement['condition_type'] == 'speed_completion':
-                earned = game_result.get('time_spent', 999) <= achievement['condition_value']
-                
-            elif achievement['condition_type'] == 'category_master':
-                # Подсчитываем категории с 80%+ результатом
-                categories_80_plus = cursor.execute('''
-                    SELECT COUNT(DISTINCT category) FROM game_results 
-                    WHERE user_id = ? AND percentage >= 80
-                ''', (user_id,)).fetchone()[0]
-                earned = categories_80_plus >= achievement['condition_value']
-            
-            if earned:
-                current_achievements.append(achievement['id'])
-                new_achievements.append({
-                    'id': achievement['id'],
-                    'name': achievement['name'],
-                    'description': achievement['description'],
-                    'icon': achievement['icon'],
-                    'points': achievement['reward_points'],
-                    'rarity': achievement['rarity']
-                })
+        if challenge['challenge_type'] == 'games_count':
+            new_progress += 1
+            progress_made = True
         
-        # Обновляем достижения в профиле
-        if new_achievements:
-            cursor.execute('''
-                UPDATE user_profiles 
-                SET achievements = ?, experience_points = experience_points + ?
-                WHERE user_id = ?
-            ''', (
-                json.dumps(current_achievements),
-                sum(ach['points'] for ach in new_achievements),
-                user_id
-            ))
-            db.commit()
+        elif challenge['challenge_type'] == 'category_master' and game_result.get('percentage', 0) >= 80:
+            new_progress = challenge['target_value']  # Выполнено сразу
+            progress_made = True
         
-        return new_achievements
+        elif challenge['challenge_type'] == 'perfect_answers' and game_result.get('percentage', 0) == 100:
+            new_progress = min(new_progress + game_result.get('total', 0), challenge['target_value'])
+            progress_made = True
         
-    except Exception as e:
-        logger.error(f"Error checking achievements: {e}")
-        return []
+        if progress_made:
+            completed = new_progress >= challenge['target_value']
+            update_daily_challenge(cursor, challenge['id'], new_progress, completed)
 
-def update_daily_challenge_progress(user_id, game_result):
-    """Обновление прогресса ежедневных заданий"""
-    try:
-        db = get_db()
-        cursor = db.cursor()
-        today = date.today()
+def is_known_category(category):
+    """Категория из банка вопросов или категория марафона ('overall' — только рейтинг)"""
+    return isinstance(category, str) and (
+        category == MARATHON_CATEGORY or category in question_bank.snapshot().data
+    )
+
+# Наибольшее целое, которое SQLite и PostgreSQL хранят в BIGINT
+MAX_STORED_INTEGER = 2 ** 63 - 1
+
+def validate_game_data(data):
+    """Проверка результата игры до записи; возвращает текст ошибки или None.
+
+    Любое значение, прошедшее проверку, записывается без ошибок базы,
+    поэтому в пакете /api/save_games плохая игра не мешает остальным.
+    Числовые user_id, difficulty и game_mode приводятся к строке: в базе
+    это текстовые колонки, и PostgreSQL не сравнивает их с числами.
+    """
+    if not isinstance(data, dict) or not data.get('user_id'):
+        return 'Invalid data'
+    
+    for field in ('user_id', 'difficulty', 'game_mode'):
+        value = data.get(field, '')
+        if isinstance(value, bool) or not isinstance(value, (str, int)) or (
+            isinstance(value, int) and not 0 <= value <= MAX_STORED_INTEGER
+        ):
+            return f'Invalid field: {field}'
+        if field in data:
+            data[field] = str(value)
+    
+    for field in ('username', 'first_name', 'last_name'):
+        value = data.get(field)
+        if value is not None and not isinstance(value, str):
+            return f'Invalid field: {field}'
+    
+    if not is_known_category(data.get('category')):
+        return 'Invalid field: category'
+    
+    for field in ('score', 'total', 'time_spent', 'hints_used', 'best_streak', 'current_streak'):
+        value = data.get(field, 0)
+        if (isinstance(value, bool) or not isinstance(value, (int, float))
+                or not math.isfinite(value) or not 0 <= value <= MAX_STORED_INTEGER):
+            return f'Invalid field: {field}'
+    
+    if data.get('score', 0) > data.get('total', 0):
+        return 'Invalid field: score'
+    
+    key = data.get('idempotency_key')
+    if key is not None and (not isinstance(key, str) or not 0 < len(key) <= IDEMPOTENCY_KEY_MAX_LENGTH):
+        return 'Invalid field: idempotency_key'
+    
+    return None
+
+def game_percentage(data):
+    return (data.get('score', 0) / max(data.get('total', 1), 1)) * 100
+
+def record_game_results(cursor, games):
+    """Запись пачки результатов игр в текущей транзакции (без commit).
+
+    Профили и строки game_results вставляются через executemany, затем
+    для каждой игры по порядку обновляются счетчики, агрегаты лидеров,
+    достижения и ежедневные задания. Для каждой игры возвращает
+    (percentage, новые достижения, обновленные строки рейтингов).
+    """
+    for data in games:
+        if not data.get('user_id'):
+            raise ValueError("User ID is required")
+    
+    upsert_profiles(cursor, games)
+    percentages = [game_percentage(data) for data in games]
+    now = datetime.now(timezone.utc)
+    created_at = now.strftime('%Y-%m-%d %H:%M:%S')
+    insert_game_results(cursor, games, percentages, created_at)
+    upsert_monthly_rollups(cursor, games, percentages, created_at[:7])
+    buckets = leaderboard_buckets(now)
+    expire_leaderboard_periods_daily(cursor, now)
+    
+    results = []
+    for data, percentage in zip(games, percentages):
+        # Обновляем статистику профиля
+        add_profile_game(cursor, data.get('user_id'), data.get('score', 0))
         
-        # Получаем активные задания пользователя на сегодня
-        challenges = cursor.execute('''
-            SELECT * FROM daily_challenges 
-            WHERE user_id = ? AND challenge_date = ? AND completed = FALSE
-        ''', (user_id, today)).fetchall()
+        # Обновляем агрегаты таблиц лидеров
+        leaderboard_rows = update_leaderboard_stats(
+            cursor, data, data.get('category', 'unknown'), percentage, buckets
+        )
         
-        for challenge in challenges:
-            progress_made = False
-            new_progress = challenge['current_progress']
-            
-            if challenge['challenge_type'] == 'games_count':
-                new_progress += 1
-                progress_made = True
-                
-            elif challenge['challenge_type'] == 'category_master' and game_result.get('percentage', 0) >= 80:
-                new_progress = challenge['target_value']  # Выполнено сразу
-                progress_made = True
-                
-            elif challenge['challenge_type'] == 'perfect_answers' and game_result.get('percentage', 0) == 100:
-                new_progress = min(new_progress + game_result.get('total', 0), challenge['target_value'])
-                progress_made = True
-            
-            if progress_made:
-                completed = new_progress >= challenge['target_value']
-                cursor.execute('''
-                    UPDATE daily_challenges 
-                    SET current_progress = ?, completed = ?
-                    WHERE id = ?
-                ''', (new_progress, completed, challenge['id']))
+        total = data.get('total', 0)
+        game_result = {
+            'percentage': percentage,
+            'category': data.get('category', 'unknown'),
+            'game_mode': data.get('game_mode', 'normal'),
+            'time_spent': data.get('time_spent', 0),
+            'score': data.get('score', 0),
+            'total': total,
+            'best_streak': max(0, min(int(data.get('best_streak', 0)), total)),
+            'current_streak': max(0, min(int(data.get('current_streak', 0)), total))
+        }
         
-        db.commit()
+        # Обновляем счетчики прогресса и проверяем достижения
+        progress = update_user_progress(cursor, data.get('user_id'), game_result)
+        new_achievements = check_achievements(cursor, data.get('user_id'), game_result, progress)
         
-    except Exception as e:
-        logger.error(f"Error updating daily challenges: {e}")
+        # Обновляем ежедневные задания
+        update_daily_challenge_progress(cursor, data.get('user_id'), game_result)
+        
+        results.append((percentage, new_achievements, leaderboard_rows))
+    
+    return results
+
+def record_game_result(cursor, data):
+    """Запись одного результата игры в текущей транзакции (без commit)"""
+    return record_game_results(cursor, [data])[0]
+
+def claim_idempotency_key(cursor, data):
+    """Резервирует ключ идемпотентности игры; False, если игра уже сохранена"""
+    key = data.get('idempotency_key')
+    if key is None:
+        return True
+    
+    return insert_idempotency_key(cursor, str(data.get('user_id')), key)
+
+def record_new_game_results(cursor, games):
+    """Как record_game_results, но пропускает игры с уже использованным ключом.
+
+    Для повторно присланных игр вместо результата возвращается None.
+    """
+    is_new = [claim_idempotency_key(cursor, data) for data in games]
+    recorded = iter(record_game_results(cursor, [data for data, new in zip(games, is_new) if new]))
+    return [next(recorded) if new else None for new in is_new]
+
+def purge_idempotency_keys(cursor):
+    """Удаление ключей идемпотентности старше IDEMPOTENCY_KEY_TTL_DAYS"""
+    cutoff = datetime.now(timezone.utc) - timedelta(days=IDEMPOTENCY_KEY_TTL_DAYS)
+    return delete_idempotency_keys(cursor, cutoff.strftime('%Y-%m-%d %H:%M:%S'))
+
+def publish_game_results(games, results):
+    """Обновление кэшей процесса после commit записанных игр"""
+    mark_leaderboard_periods_expired()
+    for data, result in zip(games, results):
+        if result is None:
+            continue
+        _, _, leaderboard_rows = result
+        for row in leaderboard_rows:
+            leaderboard_cache.update(row)
+        profile_cache.invalidate(str(data['user_id']))
 
 def create_daily_challenge(user_id):
     """Создание ежедневного задания для пользователя"""
     try:
         db = get_db()
         cursor = db.cursor()
-        today = date.today()
+        today = utc_today()
         
         # Проверяем, есть ли уже задание на сегодня
-        existing = cursor.execute('''
-            SELECT id FROM daily_challenges 
-            WHERE user_id = ? AND challenge_date = ?
-        ''', (user_id, today)).fetchone()
-        
-        if existing:
+        if fetch_daily_challenge(cursor, user_id, today):
             return
         
         # Создаем случайное задание
@@ -930,17 +3305,395 @@ def create_daily_challenge(user_id):
         
         challenge = random.choice(challenges)
         
-        cursor.execute('''
-            INSERT INTO daily_challenges 
-            (user_id, challenge_date, challenge_type, target_value)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, today, challenge['type'], challenge['target']))
+        insert_daily_challenge(cursor, user_id, today, challenge['type'], challenge['target'])
         
         db.commit()
         logger.debug(f"Created daily challenge for user {user_id}")
         
-    except Exception as e:
-        logger.error(f"Error creating daily challenge: {e}")
+    except Exception as e:
+        logger.error(f"Error creating daily challenge: {e}")
+
+# =====================================
+# ОЧЕРЕДЬ ОТЛОЖЕННОЙ ЗАПИСИ ИГР
+# =====================================
+
+class SaveQueue:
+    """Отложенная запись результатов игр (включается SAVE_QUEUE_ENABLED).
+
+    save_game только проверяет данные, кладет их в ограниченную очередь
+    и сразу отвечает номером заявки. Фоновый поток забирает до
+    batch_size игр и пишет их одной транзакцией через
+    record_game_results; достижения складываются в результаты заявок,
+    которые клиент забирает через /api/save_game/<ticket>. Если очередь
+    заполнена, submit возвращает None и клиент получает 503.
+
+    Принятая игра не теряется из-за временной ошибки базы (например,
+    database is locked): пачка повторяется с нарастающей паузой до
+    retry_timeout секунд и только потом помечается ошибкой.
+    """
+
+    def __init__(self, size, batch_size, result_ttl, retry_timeout=SAVE_RETRY_TIMEOUT,
+                 retry_delay=0.1, max_retry_delay=5.0):
+        self.size = size
+        self.batch_size = batch_size
+        self.result_ttl = result_ttl
+        self.retry_timeout = retry_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+        self._queue = queue.Queue(maxsize=size)
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.failed = 0
+        self.retries = 0
+        self.batches = 0
+
+    def _ensure_writer(self):
+        # После fork (gunicorn --preload) поток писателя нужно запустить заново
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='save-queue-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, data):
+        """Ставит игру в очередь; возвращает номер заявки или None при переполнении"""
+        self._ensure_writer()
+        ticket = uuid.uuid4().hex
+        with self._lock:
+            self._results[ticket] = (time.monotonic(), {'status': 'queued'})
+        try:
+            self._queue.put_nowait((ticket, data))
+        except queue.Full:
+            with self._lock:
+                self._results.pop(ticket, None)
+            self.rejected += 1
+            return None
+        
+        self.accepted += 1
+        return ticket
+
+    def result(self, ticket):
+        """Состояние заявки или None, если заявка неизвестна или устарела"""
+        with self._lock:
+            self._expire()
+            entry = self._results.get(ticket)
+            return entry[1] if entry else None
+
+    def _expire(self):
+        deadline = time.monotonic() - self.result_ttl
+        while self._results:
+            ticket, (stored_at, _) = next(iter(self._results.items()))
+            if stored_at >= deadline:
+                break
+            del self._results[ticket]
+
+    def _finish(self, ticket, result):
+        with self._lock:
+            self._results.pop(ticket, None)
+            self._results[ticket] = (time.monotonic(), result)
+
+    def _take_batch(self, timeout=None):
+        batch = [self._queue.get(timeout=timeout)]
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _record(self, conn, games):
+        """Запись пачки; временные ошибки базы повторяются до retry_timeout"""
+        deadline = time.monotonic() + self.retry_timeout
+        delay = self.retry_delay
+        while True:
+            try:
+                with conn:
+                    return record_new_game_results(conn.cursor(), games)
+            except TRANSIENT_DB_ERRORS as e:
+                if time.monotonic() + delay > deadline:
+                    raise
+                self.retries += 1
+                logger.warning(f"⏳ Повтор записи {len(games)} игр через {delay:.1f} с: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, self.max_retry_delay)
+
+    def _fail(self, batch, error):
+        self.failed += len(batch)
+        for ticket, data in batch:
+            logger.error(f"❌ Ошибка отложенной записи игры {data.get('user_id')}: {error}")
+            self._finish(ticket, {'status': 'error', 'error': 'Database error'})
+
+    def _write(self, conn, batch):
+        games = [data for _, data in batch]
+        try:
+            results = self._record(conn, games)
+        except TRANSIENT_DB_ERRORS as e:
+            # База недоступна дольше retry_timeout
+            self._fail(batch, e)
+            return
+        except Exception as e:
+            if len(batch) == 1:
+                self._fail(batch, e)
+                return
+            # Пишем по одной, чтобы ошибочная игра не потянула за собой всю пачку
+            for item in batch:
+                self._write(conn, [item])
+            return
+        
+        publish_game_results(games, results)
+        self.batches += 1
+        self.written += len(batch)
+        for (ticket, _), result in zip(batch, results):
+            self._finish(ticket, game_save_status(result))
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            try:
+                conn = storage.acquire()
+                try:
+                    self._write(conn, batch)
+                finally:
+                    storage.release(conn)
+            except Exception as e:
+                logger.error(f"❌ Ошибка потока записи игр: {e}")
+                self._fail(batch, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def flush(self, timeout=None):
+        """Ожидание записи всех принятых игр"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        if timeout is None:
+            self._queue.join()
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self):
+        return {
+            'enabled': SAVE_QUEUE_ENABLED,
+            'queued': self._queue.qsize(),
+            'size': self.size,
+            'accepted': self.accepted,
+            'rejected': self.rejected,
+            'written': self.written,
+            'failed': self.failed,
+            'retries': self.retries,
+            'batches': self.batches
+        }
+
+save_queue = SaveQueue(SAVE_QUEUE_SIZE, SAVE_QUEUE_BATCH_SIZE, SAVE_RESULT_TTL)
+atexit.register(save_queue.flush, 5.0)
+
+# =====================================
+# ОГРАНИЧЕНИЕ ЧАСТОТЫ ЗАПРОСОВ
+# =====================================
+
+class MemoryBucketStore:
+    """Корзины токенов в памяти процесса.
+
+    Корзины хранятся в порядке последнего обращения; сверх max_keys
+    вытесняются самые давние, поэтому поток новых ключей (например,
+    IP-адресов) стоит O(1) на запрос и не раздувает память.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, key, rate, burst, now):
+        """Забирает токен; возвращает 0 или сколько секунд ждать следующего"""
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (burst, now))
+            tokens = min(burst, tokens + (now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+class SQLiteBucketStore:
+    """Корзины токенов в отдельном файле SQLite, общем для воркеров gunicorn.
+
+    Раз в prune_interval секунд соединение удаляет полностью
+    восстановившиеся корзины: они неотличимы от отсутствующих.
+    """
+
+    def __init__(self, path, prune_interval=60.0):
+        self.path = path
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                    key TEXT PRIMARY KEY,
+                    tokens REAL NOT NULL,
+                    updated_at REAL NOT NULL,
+                    full_at REAL NOT NULL DEFAULT 0
+                ) WITHOUT ROWID
+            ''')
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(rate_limit_buckets)')}
+            if 'full_at' not in columns:
+                # Файл, созданный до появления очистки
+                conn.execute('ALTER TABLE rate_limit_buckets ADD COLUMN full_at REAL NOT NULL DEFAULT 0')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limit_buckets_full_at ON rate_limit_buckets(full_at)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+            self._local.pruned_at = 0.0
+        return conn
+
+    def _prune(self, conn, now):
+        if now - self._local.pruned_at >= self.prune_interval:
+            self._local.pruned_at = now
+            conn.execute('DELETE FROM rate_limit_buckets WHERE full_at <= ?', (now,))
+
+    def consume(self, key, rate, burst, now):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)
+            ).fetchone()
+            tokens, updated_at = row if row else (burst, now)
+            tokens = min(burst, tokens + max(0.0, now - updated_at) * rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            if not wait:
+                tokens -= 1
+            # full_at — момент, когда корзина снова наполнится
+            conn.execute(
+                'INSERT OR REPLACE INTO rate_limit_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)',
+                (key, tokens, now, now + (burst - tokens) / rate)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        self._prune(conn, now)
+        return wait
+
+    def clear(self):
+        self._connection().execute('DELETE FROM rate_limit_buckets')
+
+class RateLimiter:
+    """Ограничение частоты запросов по алгоритму корзины токенов.
+
+    Ключ — проверенный пользователь Telegram, а без него IP клиента.
+    Лимиты задаются по именам в RATE_LIMITS. Ошибка хранилища не
+    блокирует запрос.
+    """
+
+    def __init__(self, store, limits):
+        self.store = store
+        self.limits = limits
+        self.allowed = {}
+        self.throttled = {}
+        self.errors = 0
+
+    def check(self, name, client_key):
+        """0, если запрос разрешен, иначе через сколько секунд повторить"""
+        per_minute, burst = self.limits[name]
+        try:
+            wait = self.store.consume(f'{name}:{client_key}', per_minute / 60.0, burst, time.time())
+        except Exception as e:
+            self.errors += 1
+            logger.error(f"❌ Ошибка хранилища лимитов: {e}")
+            return 0.0
+        
+        counters = self.throttled if wait else self.allowed
+        counters[name] = counters.get(name, 0) + 1
+        return wait
+
+    def stats(self):
+        return {
+            'enabled': RATE_LIMIT_ENABLED,
+            'backend': RATE_LIMIT_BACKEND,
+            'allowed': dict(self.allowed),
+            'throttled': dict(self.throttled),
+            'errors': self.errors
+        }
+
+def parse_rate_limit(value):
+    """'<в минуту>/<всплеск>' -> (в минуту, всплеск); без всплеска он равен лимиту в минуту"""
+    per_minute, _, burst = value.partition('/')
+    per_minute = float(per_minute)
+    burst = int(burst) if burst else math.ceil(per_minute)
+    if not math.isfinite(per_minute) or per_minute <= 0 or burst < 1:
+        raise ValueError(value)
+    return per_minute, burst
+
+def load_rate_limits(defaults):
+    """Лимиты маршрутов с переопределениями из RATE_LIMIT_<ИМЯ>=<в минуту>/<всплеск>"""
+    limits = dict(defaults)
+    for name in limits:
+        override = os.environ.get(f'RATE_LIMIT_{name.upper()}')
+        if override:
+            try:
+                limits[name] = parse_rate_limit(override)
+            except ValueError:
+                logger.error(f"❌ Неверное значение RATE_LIMIT_{name.upper()}={override!r}, оставлен лимит {limits[name]}")
+    return limits
+
+def create_bucket_store():
+    if RATE_LIMIT_BACKEND == 'sqlite':
+        return SQLiteBucketStore(RATE_LIMIT_DB_PATH)
+    return MemoryBucketStore()
+
+rate_limiter = RateLimiter(create_bucket_store(), load_rate_limits(RATE_LIMITS))
+
+def rate_limit_client_key():
+    """Проверенный пользователь, а для анонимных запросов — IP клиента.
+
+    За прокси (RATE_LIMIT_TRUST_FORWARDED) берется последний адрес
+    X-Forwarded-For — его дописал сам прокси, клиент подделать его не может.
+    """
+    if g.get('user_id'):
+        return f'user:{g.user_id}'
+    
+    address = request.remote_addr
+    if RATE_LIMIT_TRUST_FORWARDED and request.access_route:
+        address = request.access_route[-1]
+    return f'ip:{address}'
+
+def rate_limited(name):
+    """Декоратор маршрута с лимитом RATE_LIMITS[name]; при превышении — 429"""
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if RATE_LIMIT_ENABLED:
+                wait = rate_limiter.check(name, rate_limit_client_key())
+                if wait:
+                    logger.warning(f"🚦 Лимит '{name}' превышен: {rate_limit_client_key()}")
+                    response = jsonify({'error': 'Too many requests'})
+                    response.headers['Retry-After'] = str(math.ceil(wait))
+                    return response, 429
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
 
 # =====================================
 # МАРШРУТЫ API
@@ -952,6 +3705,12 @@ def before_request():
     # Логирование запросов
     if not request.path.startswith('/static/'):
         logger.debug(f"🌐 {request.method} {request.path} - {request.remote_addr}")
+    
+    # Замер времени обработки
+    g.request_started = time.perf_counter()
+    
+    # Проверка initData Telegram
+    authenticate_request()
 
 @app.after_request
 def after_request(response):
@@ -959,12 +3718,24 @@ def after_request(response):
     # Добавляем CORS заголовки
     response.headers['Access-Control-Allow-Origin'] = '*'
     response.headers['Access-Control-Allow-Methods'] = 'GET, POST, OPTIONS'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type'
+    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, X-Telegram-Init-Data, Authorization'
     
     # Логирование ответов
     if not request.path.startswith('/static/'):
         logger.debug(f"📤 {response.status_code} - {response.content_length or 0} bytes")
     
+    # Метрики маршрута (шаблон URL, а не путь, чтобы не плодить серии)
+    if 'request_started' in g:
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        sql_queries, sql_seconds = 0, 0.0
+        if 'db' in g:
+            sql_queries = g.db.sql_queries - g.sql_baseline[0]
+            sql_seconds = g.db.sql_seconds - g.sql_baseline[1]
+        metrics.record_request(
+            route, request.method, response.status_code,
+            time.perf_counter() - g.request_started, sql_queries, sql_seconds
+        )
+    
     return response
 
 @app.route('/')
@@ -972,75 +3743,93 @@ def index():
     """Главная страница"""
     return render_template('index.html')
 
+@app.route('/api/questions/mixed')
+@handle_db_error
+@rate_limited('questions')
+def get_mixed_questions():
+    """API для смешанной выборки вопросов (марафон) одним запросом.
+
+    Необязательные category_weights=history:2 и difficulty_weights=hard:0.5
+    меняют долю вопросов из категорий и сложностей.
+    """
+    try:
+        count = int(request.args.get('count', MARATHON_QUESTIONS_COUNT))
+        category_weights = parse_question_weights(request.args.get('category_weights', ''))
+        difficulty_weights = parse_question_weights(request.args.get('difficulty_weights', ''))
+    except ValueError:
+        return jsonify({'error': 'Invalid count or weights'}), 400
+
+    if not 1 <= count <= MAX_QUESTIONS_PER_REQUEST:
+        return jsonify({'error': f'Count must be between 1 and {MAX_QUESTIONS_PER_REQUEST}'}), 400
+
+    categories = set(filter(None, request.args.get('categories', '').split(',')))
+    difficulties = set(filter(None, request.args.get('difficulties', '').split(',')))
+
+    mixed_questions = sample_mixed_questions(
+        load_questions(), count, categories, difficulties,
+        category_weights, difficulty_weights, get_request_rng()
+    )
+    
+    logger.info(f"📚 Sent {len(mixed_questions)} mixed questions")
+    return jsonify(mixed_questions)
+
 @app.route('/api/questions/<category>/<difficulty>')
 @handle_db_error
+@rate_limited('questions')
 def get_questions(category, difficulty):
     """API для получения вопросов"""
-    questions_data = load_questions()
+    snapshot = question_bank.snapshot()
     
-    if category not in questions_data:
+    if category not in snapshot.data:
         logger.warning(f"Category {category} not found")
         return jsonify({'error': f'Category {category} not found'}), 404
         
-    if difficulty not in questions_data[category]:
+    if difficulty not in snapshot.data[category]:
         logger.warning(f"Difficulty {difficulty} not found in category {category}")
         return jsonify({'error': f'Difficulty {difficulty} not found'}), 404
     
-    category_questions = questions_data[category][difficulty].copy()
-    random.shuffle(category_questions)
+    limit = request.args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            return jsonify({'error': 'Invalid limit'}), 400
+        if not 1 <= limit <= MAX_QUESTIONS_PER_REQUEST:
+            return jsonify({'error': f'Limit must be between 1 and {MAX_QUESTIONS_PER_REQUEST}'}), 400
     
-    logger.info(f"📚 Sent {len(category_questions)} questions for {category}/{difficulty}")
-    return jsonify(category_questions)
-
-@app.route('/api/profile/<user_id>')
-@handle_db_error
-def get_profile(user_id):
-    """Получение профиля пользователя"""
-    db = get_db()
-    cursor = db.cursor()
+    encoded_questions = snapshot.encoded[category][difficulty]
     
-    # Получаем или создаем профиль
-    profile = cursor.execute(
-        'SELECT * FROM user_profiles WHERE user_id = ?', 
-        (user_id,)
-    ).fetchone()
+    def build_body():
+        selected = sample_questions(encoded_questions, limit, get_request_rng())
+        return b'[' + b','.join(selected) + b']'
     
-    if not profile:
-        # Создаем базовый профиль
-        create_or_update_user_profile({
-            'user_id': user_id,
-            'first_name': 'Игрок',
-            'username': '',
-            'last_name': ''
-        })
-        profile = cursor.execute(
-            'SELECT * FROM user_profiles WHERE user_id = ?', 
-            (user_id,)
-        ).fetchone()
+    # С seed выборка детерминирована, и ответ можно кэшировать целиком
+    seed = request.args.get('seed')
+    if seed:
+        entry = response_cache.get(
+            ('questions', category, difficulty, limit, seed), snapshot.version, build_body
+        )
+        return json_bytes_response(entry.bodies, entry.etag)
+    
+    # Случайная выборка не кэшируется: сжимаем только в формат, который примет клиент
+    logger.debug(f"📚 Sending questions for {category}/{difficulty}")
+    return json_bytes_response(compress_body(build_body(), (accepted_encoding(),)))
+
+def build_profile_payload(cursor, profile):
+    """Профиль, статистика по категориям, последние игры и достижения"""
+    user_id = profile['user_id']
     
     # Статистика по категориям
-    category_stats = cursor.execute('''
-        SELECT category, COUNT(*) as games, 
-               AVG(percentage) as avg_score, MAX(percentage) as best_score
-        FROM game_results 
-        WHERE user_id = ? 
-        GROUP BY category
-    ''', (user_id,)).fetchall()
+    category_stats = fetch_user_category_stats(cursor, user_id)
     
     # Последние игры
-    recent_games = cursor.execute('''
-        SELECT category, difficulty, score, total, percentage, created_at
-        FROM game_results 
-        WHERE user_id = ? 
-        ORDER BY created_at DESC 
-        LIMIT 10
-    ''', (user_id,)).fetchall()
+    recent_games = fetch_recent_games(cursor, user_id)
     
     # Достижения
-    all_achievements = cursor.execute('SELECT * FROM achievements ORDER BY rarity, name').fetchall()
-    user_achievements = json.loads(profile['achievements'] or '[]')
+    all_achievements = get_achievement_catalogue(cursor).all
+    user_achievements = fetch_unlocked_achievement_ids(cursor, user_id)
     
-    return jsonify({
+    return {
         'profile': {
             'user_id': profile['user_id'],
             'username': profile['username'] or '',
@@ -1083,148 +3872,422 @@ def get_profile(user_id):
                 'unlocked': ach['id'] in user_achievements
             } for ach in all_achievements
         ]
-    })
+    }
+
+class ProfileCache:
+    """LRU-кэш готовых профилей пользователей в памяти процесса.
+
+    Снимок хранится вместе с версией строки профиля (total_games,
+    updated_at): любая сохраненная игра меняет ее, поэтому запись,
+    устаревшая из-за другого воркера, отбрасывается при чтении, а
+    save_game этого процесса удаляет запись сразу.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(user_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, user_id, version, payload):
+        with self._lock:
+            self._entries[user_id] = (version, payload)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses
+        }
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE)
+
+def get_profile_payload(user_id):
+    """Профиль пользователя из кэша или из базы; создает профиль при первом входе"""
+    db = get_db()
+    cursor = db.cursor()
+    
+    # Получаем или создаем профиль
+    profile = fetch_profile(cursor, user_id)
+    
+    if not profile:
+        # Создаем базовый профиль
+        create_or_update_user_profile(cursor, {
+            'user_id': user_id,
+            'first_name': 'Игрок',
+            'username': '',
+            'last_name': ''
+        })
+        db.commit()
+        profile = fetch_profile(cursor, user_id)
+    
+    version = (profile['total_games'], profile['updated_at'])
+    payload = profile_cache.get(user_id, version)
+    if payload is None:
+        payload = build_profile_payload(cursor, profile)
+        profile_cache.put(user_id, version, payload)
+    return payload
+
+@app.route('/api/profile/<user_id>')
+@handle_db_error
+@telegram_auth_required
+@rate_limited('user')
+def get_profile(user_id):
+    """Получение профиля пользователя"""
+    return jsonify(get_profile_payload(user_id))
 
 @app.route('/api/save_game', methods=['POST'])
 @handle_db_error
+@telegram_auth_required
+@rate_limited('save')
 def save_game():
     """Сохранение результата игры"""
-    data = request.get_json()
+    data = request.get_json(silent=True)
     
-    if not data or 'user_id' not in data:
-        return jsonify({'error': 'Invalid data'}), 400
+    error = validate_game_data(data)
+    if error:
+        return jsonify({'error': error}), 400
+    if not is_user_allowed(data['user_id']):
+        return jsonify({'error': 'Forbidden'}), 403
     
-    # Создаем/обновляем профиль пользователя
-    create_or_update_user_profile(data)
+    if SAVE_QUEUE_ENABLED:
+        ticket = save_queue.submit(data)
+        if ticket is None:
+            logger.warning("⚠️ Очередь записи игр переполнена")
+            response = jsonify({'error': 'Save queue is full'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        
+        return jsonify({
+            'status': 'queued',
+            'ticket': ticket,
+            'poll_url': f'/api/save_game/{ticket}'
+        }), 202
     
-    # Сохраняем результат игры
+    # Вся запись игры — одна транзакция и один commit
     db = get_db()
-    cursor = db.cursor()
+    with db:
+        result, = record_new_game_results(db.cursor(), [data])
+    publish_game_results([data], [result])
     
-    percentage = (data.get('score', 0) / max(data.get('total', 1), 1)) * 100
+    if result is None:
+        logger.info(f"🔁 Duplicate game ignored for user {data.get('user_id')}")
+    else:
+        logger.info(f"💾 Game saved for user {data.get('user_id')}: {data.get('score')}/{data.get('total')} ({result[0]:.1f}%)")
     
-    cursor.execute('''
-        INSERT INTO game_results 
-        (user_id, username, first_name, last_name, score, total, category, 
-         difficulty, percentage, time_spent, hints_used, game_mode)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-    ''', (
-        data.get('user_id'),
-        data.get('username', ''),
-        data.get('first_name', 'Игрок'),
-        data.get('last_name', ''),
-        data.get('score', 0),
-        data.get('total', 0),
-        data.get('category', 'unknown'),
-        data.get('difficulty', 'easy'),
-        percentage,
-        data.get('time_spent', 0),
-        data.get('hints_used', 0),
-        data.get('game_mode', 'normal')
-    ))
-    
-    # Обновляем статистику профиля
-    cursor.execute('''
-        UPDATE user_profiles 
-        SET total_games = total_games + 1,
-            total_score = total_score + ?,
-            updated_at = CURRENT_TIMESTAMP
-        WHERE user_id = ?
-    ''', (data.get('score', 0), data.get('user_id')))
+    status = game_save_status(result)
+    status.pop('percentage', None)
+    return jsonify(status)
+
+@app.route('/api/save_games', methods=['POST'])
+@handle_db_error
+@telegram_auth_required
+@rate_limited('save_batch')
+def save_games():
+    """Пакетное сохранение игр, накопленных клиентом (одна транзакция).
+
+    Каждая игра должна нести idempotency_key: повторная отправка пакета
+    после обрыва связи не создает дубликатов.
+    """
+    data = request.get_json(silent=True)
+    games = data.get('games') if isinstance(data, dict) else data
     
-    db.commit()
+    if not isinstance(games, list) or not games:
+        return jsonify({'error': 'Invalid data'}), 400
+    if len(games) > MAX_GAMES_PER_BATCH:
+        return jsonify({'error': f'At most {MAX_GAMES_PER_BATCH} games per request'}), 400
     
-    # Проверяем достижения
-    game_result = {
-        'percentage': percentage,
-        'game_mode': data.get('game_mode', 'normal'),
-        'time_spent': data.get('time_spent', 0),
-        'total': data.get('total', 0)
-    }
+    results = [None] * len(games)
+    valid = []
+    for i, game in enumerate(games):
+        error = validate_game_data(game)
+        if not error and not game.get('idempotency_key'):
+            error = 'Missing field: idempotency_key'
+        if not error and not is_user_allowed(game['user_id']):
+            error = 'Forbidden'
+        if error:
+            results[i] = {'status': 'error', 'error': error}
+        else:
+            valid.append(i)
     
-    new_achievements = check_achievements(data.get('user_id'), game_result)
+    db = get_db()
+    valid_games = [games[i] for i in valid]
+    with db:
+        recorded = record_new_game_results(db.cursor(), valid_games)
+    publish_game_results(valid_games, recorded)
     
-    # Обновляем ежедневные задания
-    update_daily_challenge_progress(data.get('user_id'), game_result)
+    for i, result in zip(valid, recorded):
+        results[i] = game_save_status(result)
+    for game, result in zip(games, results):
+        if isinstance(game, dict):
+            result['idempotency_key'] = game.get('idempotency_key')
     
-    logger.info(f"💾 Game saved for user {data.get('user_id')}: {data.get('score')}/{data.get('total')} ({percentage:.1f}%)")
+    saved = sum(result is not None for result in recorded)
+    logger.info(f"💾 Batch saved: {saved} new, {len(recorded) - saved} duplicate, {len(games) - len(valid)} invalid")
     
     return jsonify({
         'status': 'success',
-        'new_achievements': new_achievements
+        'results': results
     })
 
+def game_save_status(result):
+    """Ответ API для результата record_new_game_results"""
+    if result is None:
+        return {'status': 'duplicate', 'new_achievements': []}
+    
+    percentage, new_achievements, _ = result
+    return {
+        'status': 'success',
+        'percentage': round(percentage, 1),
+        'new_achievements': new_achievements
+    }
+
+@app.route('/api/save_game/<ticket>')
+def get_save_result(ticket):
+    """Состояние отложенной записи игры и полученные достижения"""
+    result = save_queue.result(ticket)
+    if result is None:
+        return jsonify({'error': 'Unknown ticket'}), 404
+    return jsonify(result)
+
+def leaderboard_min_games(category):
+    """Минимальное число игр для попадания в таблицу лидеров"""
+    return LEADERBOARD_MIN_GAMES_OVERALL if category == 'overall' else LEADERBOARD_MIN_GAMES
+
+def leaderboard_entry(row):
+    """Запись таблицы лидеров в формате API"""
+    return {
+        'user_id': row['user_id'],
+        'username': row['username'] or '',
+        'first_name': row['first_name'] or 'Игрок',
+        'games': row['games'],
+        'avg_score': round(row['avg_score'] or 0, 1),
+        'best_score': round(row['best_score'] or 0, 1)
+    }
+
+def leaderboard_rank_key(row):
+    """Ключ сортировки: средний балл, лучший балл, user_id"""
+    return (-(row['avg_score'] or 0), -(row['best_score'] or 0), row['user_id'])
+
+class LeaderboardBoard:
+    """Упорядоченный топ одной категории"""
+
+    __slots__ = ('ranking', 'keys', 'entries', 'complete', 'built_at', 'version', 'top')
+
+    def __init__(self, rows, capacity, version):
+        self.ranking = [leaderboard_rank_key(row) for row in rows]
+        self.keys = {key[2]: key for key in self.ranking}
+        self.entries = {row['user_id']: leaderboard_entry(row) for row in rows}
+        # complete: в списке все подходящие пользователи категории
+        self.complete = len(rows) < capacity
+        self.built_at = time.monotonic()
+        self.version = version
+        self.top = None
+
+    def remove(self, user_id):
+        key = self.keys.pop(user_id, None)
+        if key is not None:
+            del self.ranking[bisect.bisect_left(self.ranking, key)]
+            del self.entries[user_id]
+
+    def insert(self, key, entry):
+        bisect.insort(self.ranking, key)
+        self.keys[key[2]] = key
+        self.entries[key[2]] = entry
+
+def leaderboard_board_key(row):
+    """Ключ топа для строки рейтинга: (категория, период, корзина)"""
+    if 'period' in row.keys():
+        return row['category'], row['period'], row['bucket']
+    return row['category'], None, None
+
+def fetch_board_rows(cursor, key, limit):
+    """Строки для построения топа: за все время или из корзины периода"""
+    category, period, bucket = key
+    if period is None:
+        return fetch_leaderboard_rows(cursor, category, limit)
+    return fetch_period_leaderboard_rows(cursor, period, bucket, category, limit)
+
+class LeaderboardCache:
+    """Топ-K таблиц лидеров в памяти процесса с записью насквозь.
+
+    save_game переставляет в списке только запись сыгравшего пользователя.
+    Для каждой категории (и для текущей корзины каждого периода) хранится
+    вдвое больше мест, чем отдается, чтобы выбывание пользователя из топа
+    не требовало обращения к базе. Если запаса не хватило или истек TTL
+    (другие воркеры пишут мимо этого кэша), список перестраивается из
+    leaderboard_stats или leaderboard_periods. Запрос к базе идет вне
+    общей блокировки; обновления, пришедшие во время перестройки,
+    применяются к новому списку.
+    """
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.capacity = size * 2
+        self.ttl = ttl
+        self._boards = {}
+        # Обновления топов, которые сейчас перестраиваются
+        self._pending = {}
+        # Блокировки перестройки по (категория, период)
+        self._build_locks = {}
+        self._lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self.rebuilds = 0
+        self.updates = 0
+
+    def snapshot(self, category, period=None):
+        """(версия, топ записей) категории за все время или за текущий период"""
+        bucket = leaderboard_buckets(datetime.now(timezone.utc))[period] if period else None
+        board_key = (category, period, bucket)
+        board = self._fresh_board(board_key)
+        if board is None:
+            with self._lock:
+                build_lock = self._build_locks.setdefault(board_key[:2], threading.Lock())
+            with build_lock:
+                board = self._fresh_board(board_key) or self._rebuild(board_key)
+
+        with self._lock:
+            if board.top is None:
+                board.top = tuple(board.entries[key[2]] for key in board.ranking[:self.size])
+            return board.version, board.top
+
+    def _fresh_board(self, board_key):
+        with self._lock:
+            board = self._boards.get(board_key)
+            if board is not None and time.monotonic() - board.built_at <= self.ttl:
+                return board
+            return None
+
+    def _rebuild(self, board_key):
+        """Перестройка топа из базы (вызывать под блокировкой перестройки)"""
+        with self._lock:
+            if board_key[1]:
+                # Наступил новый день/неделя/месяц: прошлая корзина больше не нужна
+                for stale in [k for k in self._boards if k[:2] == board_key[:2] and k != board_key]:
+                    del self._boards[stale]
+            self._pending[board_key] = []
+
+        try:
+            rows = fetch_board_rows(get_db().cursor(), board_key, self.capacity)
+        finally:
+            with self._lock:
+                pending = self._pending.pop(board_key)
+
+        with self._lock:
+            board = LeaderboardBoard(rows, self.capacity, next(self._versions))
+            # Строки, записанные после чтения из базы, применяем поверх
+            if all(self._apply(board, row) for row in pending):
+                self._boards[board_key] = board
+            else:
+                self._boards.pop(board_key, None)
+            self.rebuilds += 1
+        return board
+
+    def _apply(self, board, row):
+        """Перестановка пользователя в топе; False, если запаса мест не хватило"""
+        category = row['category']
+        board.remove(row['user_id'])
+        key = leaderboard_rank_key(row)
+        if row['games'] >= leaderboard_min_games(category):
+            if board.complete or (board.ranking and key < board.ranking[-1]):
+                board.insert(key, leaderboard_entry(row))
+                if len(board.ranking) > self.capacity:
+                    board.remove(board.ranking[-1][2])
+                    board.complete = False
+
+        board.version = next(self._versions)
+        board.top = None
+        return board.complete or len(board.ranking) >= self.size
+
+    def update(self, row):
+        """Переставляет пользователя после сохранения игры (вызывать после commit)"""
+        board_key = leaderboard_board_key(row)
+        with self._lock:
+            pending = self._pending.get(board_key)
+            if pending is not None:
+                pending.append(row)
+
+            board = self._boards.get(board_key)
+            if board is None:
+                return
+            if not self._apply(board, row):
+                # Запаса не хватает, перестроим при следующем чтении
+                del self._boards[board_key]
+                return
+            self.updates += 1
+
+    def clear(self):
+        with self._lock:
+            self._boards.clear()
+
+    def stats(self):
+        return {
+            'boards': len(self._boards),
+            'rebuilds': self.rebuilds,
+            'updates': self.updates
+        }
+
+leaderboard_cache = LeaderboardCache(LEADERBOARD_SIZE, LEADERBOARD_CACHE_TTL)
+
 @app.route('/api/leaderboard/<category>')
 @handle_db_error
+@rate_limited('leaderboard')
 def get_leaderboard(category):
-    """Таблица лидеров по категории"""
-    db = get_db()
-    cursor = db.cursor()
+    """Таблица лидеров по категории: за все время или ?period=day|week|month"""
+    if category != 'overall' and not is_known_category(category):
+        return jsonify({'error': f'Category {category} not found'}), 404
     
-    if category == 'overall':
-        results = cursor.execute('''
-            SELECT user_id, username, first_name, COUNT(*) as games, 
-                   AVG(percentage) as avg_score, MAX(percentage) as best_score
-            FROM game_results 
-            GROUP BY user_id 
-            HAVING games >= 3
-            ORDER BY avg_score DESC, best_score DESC 
-            LIMIT 100
-        ''').fetchall()
-    else:
-        results = cursor.execute('''
-            SELECT user_id, username, first_name, COUNT(*) as games,
-                   AVG(percentage) as avg_score, MAX(percentage) as best_score
-            FROM game_results 
-            WHERE category = ?
-            GROUP BY user_id 
-            HAVING games >= 2
-            ORDER BY avg_score DESC, best_score DESC 
-            LIMIT 100
-        ''', (category,)).fetchall()
-    
-    leaderboard = []
-    for row in results:
-        leaderboard.append({
-            'user_id': row['user_id'],
-            'username': row['username'] or '',
-            'first_name': row['first_name'] or 'Игрок',
-            'games': row['games'],
-            'avg_score': round(row['avg_score'] or 0, 1),
-            'best_score': round(row['best_score'] or 0, 1)
-        })
+    period = request.args.get('period')
+    if period is not None and period not in LEADERBOARD_PERIOD_RETENTION_DAYS:
+        return jsonify({'error': 'Invalid period'}), 400
     
-    logger.info(f"🏆 Leaderboard for {category}: {len(leaderboard)} entries")
-    return jsonify(leaderboard)
+    version, top = leaderboard_cache.snapshot(category, period)
+    return cached_json_response(('leaderboard', category, period), version, lambda: list(top))
 
-@app.route('/api/daily_challenge/<user_id>')
-@handle_db_error
-def get_daily_challenge(user_id):
-    """Получение ежедневного задания"""
+def get_daily_challenge_payload(user_id):
+    """Ежедневное задание пользователя на сегодня"""
     db = get_db()
     cursor = db.cursor()
-    today = date.today()
+    today = utc_today()
     
     # Создаем задание, если его нет
     create_daily_challenge(user_id)
     
     # Получаем задание на сегодня
-    challenge = cursor.execute('''
-        SELECT * FROM daily_challenges 
-        WHERE user_id = ? AND challenge_date = ?
-        ORDER BY id DESC
-        LIMIT 1
-    ''', (user_id, today)).fetchone()
+    challenge = fetch_daily_challenge(cursor, user_id, today)
     
     if not challenge:
         # Создаем базовое задание
-        return jsonify({
+        return {
             'type': 'games_count',
             'description': 'Сыграйте первую игру сегодня!',
             'target': 1,
             'progress': 0,
             'completed': False
-        })
+        }
     
     # Описание задания
     descriptions = {
@@ -1233,46 +4296,73 @@ def get_daily_challenge(user_id):
         'perfect_answers': f'Ответьте правильно на {challenge["target_value"]} вопросов'
     }
     
-    return jsonify({
+    return {
         'type': challenge['challenge_type'],
         'description': descriptions.get(challenge['challenge_type'], 'Ежедневное задание'),
         'target': challenge['target_value'],
         'progress': challenge['current_progress'],
         'completed': bool(challenge['completed'])
-    })
+    }
 
-@app.route('/api/stats')
+@app.route('/api/daily_challenge/<user_id>')
 @handle_db_error
-def get_app_stats():
-    """Общая статистика приложения"""
-    db = get_db()
-    cursor = db.cursor()
-    
-    # Общая статистика
-    total_users = cursor.execute('SELECT COUNT(DISTINCT user_id) FROM user_profiles').fetchone()[0]
-    total_games = cursor.execute('SELECT COUNT(*) FROM game_results').fetchone()[0]
-    total_questions = cursor.execute('SELECT SUM(total) FROM game_results').fetchone()[0] or 0
+@telegram_auth_required
+@rate_limited('user')
+def get_daily_challenge(user_id):
+    """Получение ежедневного задания"""
+    return jsonify(get_daily_challenge_payload(user_id))
+
+def get_category_list():
+    """Категории банка вопросов с числом вопросов по сложностям"""
+    return [
+        {
+            'category': category,
+            'questions': sum(len(questions) for questions in difficulties.values()),
+            'difficulties': {
+                difficulty: len(questions) for difficulty, questions in difficulties.items()
+            }
+        } for category, difficulties in load_questions().items()
+    ]
+
+@app.route('/api/bootstrap/<user_id>')
+@handle_db_error
+@telegram_auth_required
+@rate_limited('user')
+def get_bootstrap(user_id):
+    """Данные стартового экрана одним запросом: профиль, задание дня и категории"""
+    return jsonify({
+        'profile': get_profile_payload(user_id),
+        'daily_challenge': get_daily_challenge_payload(user_id),
+        'categories': get_category_list()
+    })
+
+def build_app_stats(stats):
+    """Общая статистика приложения по строке счетчиков app_stats"""
+    cursor = get_db().cursor()
     
     # Статистика по категориям
-    category_stats = cursor.execute('''
-        SELECT category, COUNT(*) as games, AVG(percentage) as avg_score
-        FROM game_results 
-        GROUP BY category
-        ORDER BY games DESC
-    ''').fetchall()
+    category_stats = fetch_category_stats(cursor)
     
-    return jsonify({
-        'total_users': total_users,
-        'total_games': total_games,
-        'total_questions_answered': total_questions,
+    return {
+        'total_users': stats['total_users'],
+        'total_games': stats['total_games'],
+        'total_questions_answered': stats['total_questions_answered'],
         'category_stats': [
             {
                 'category': stat['category'],
                 'games': stat['games'],
-                'avg_score': round(stat['avg_score'] or 0, 1)
+                'avg_score': round(stat['total_percentage'] / stat['games'], 1) if stat['games'] else 0
             } for stat in category_stats
         ]
-    })
+    }
+
+@app.route('/api/stats')
+@handle_db_error
+def get_app_stats():
+    """Общая статистика приложения"""
+    stats = fetch_app_stats(get_db().cursor())
+    version = (stats['total_games'], stats['total_users'])
+    return cached_json_response(('stats',), version, lambda: build_app_stats(stats))
 
 # =====================================
 # АДМИНИСТРАТИВНЫЕ МАРШРУТЫ
@@ -1284,29 +4374,27 @@ def health():
     try:
         # Проверка базы данных
         db = get_db()
-        cursor = db.cursor()
-        cursor.execute('SELECT COUNT(*) FROM user_profiles')
-        users_count = cursor.fetchone()[0]
+        users_count = count_profiles(db.cursor())
         
-        # Проверка файла вопросов
-        questions_data = load_questions()
-        questions_count = sum(
-            len(difficulties.get(diff, [])) 
-            for category, difficulties in questions_data.items()
-            for diff in ['easy', 'medium', 'hard']
-        )
+        # Проверка банка вопросов
+        question_bank.snapshot()
         
         return jsonify({
             'status': 'healthy',
             'timestamp': datetime.now().isoformat(),
             'database': {
                 'connected': True,
-                'users_count': users_count
-            },
-            'questions': {
-                'loaded': questions_count,
-                'categories': len(questions_data)
+                'users_count': users_count,
+                'pool': storage.stats()
             },
+            'questions': question_bank.stats(),
+            'response_cache': response_cache.stats(),
+            'leaderboard_cache': leaderboard_cache.stats(),
+            'profile_cache': profile_cache.stats(),
+            'save_queue': save_queue.stats(),
+            'telegram_auth': telegram_auth.stats(),
+            'rate_limiter': rate_limiter.stats(),
+            'sql_profiler': sql_profiler.stats(),
             'version': '2.0.0'
         })
         
@@ -1318,6 +4406,111 @@ def health():
             'timestamp': datetime.now().isoformat()
         }), 500
 
+def collect_component_metrics():
+    """Показатели банка вопросов, кэшей, очереди записи и пула соединений"""
+    lines = []
+    
+    def add(name, metric_type, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in samples:
+            lines.append(metric_line(name, labels, value))
+    
+    bank = question_bank.stats()
+    add('quiz_question_bank_reloads_total', 'counter', 'Перезагрузки файла вопросов', [({}, bank['reloads'])])
+    add('quiz_question_bank_reload_errors_total', 'counter', 'Ошибки перезагрузки файла вопросов', [({}, bank['reload_errors'])])
+    add('quiz_question_bank_questions', 'gauge', 'Вопросов в банке', [({}, bank['loaded'])])
+    add('quiz_question_bank_parse_seconds_total', 'counter', 'Время разбора файла вопросов', [({}, bank['total_parse_ms'] / 1000)])
+    
+    caches = {
+        'response': response_cache.stats(),
+        'profile': profile_cache.stats(),
+        'telegram_auth': telegram_auth.stats()
+    }
+    add('quiz_cache_hits_total', 'counter', 'Попадания в кэш', [({'cache': name}, stats['hits']) for name, stats in caches.items()])
+    add('quiz_cache_misses_total', 'counter', 'Промахи кэша', [({'cache': name}, stats['misses']) for name, stats in caches.items()])
+    add('quiz_cache_hit_ratio', 'gauge', 'Доля попаданий в кэш', [
+        ({'cache': name}, round(stats['hits'] / (stats['hits'] + stats['misses']), 4) if stats['hits'] + stats['misses'] else 0)
+        for name, stats in caches.items()
+    ])
+    
+    leaderboard = leaderboard_cache.stats()
+    add('quiz_leaderboard_cache_rebuilds_total', 'counter', 'Перестроения топа из базы', [({}, leaderboard['rebuilds'])])
+    add('quiz_leaderboard_cache_updates_total', 'counter', 'Обновления топа без обращения к базе', [({}, leaderboard['updates'])])
+    
+    limiter = rate_limiter.stats()
+    add('quiz_rate_limit_requests_total', 'counter', 'Проверки лимитов частоты запросов', [
+        ({'limit': name, 'result': result}, count)
+        for result, counters in (('allowed', limiter['allowed']), ('throttled', limiter['throttled']))
+        for name, count in sorted(counters.items())
+    ])
+    
+    queue_stats = save_queue.stats()
+    add('quiz_save_queue_depth', 'gauge', 'Игр в очереди отложенной записи', [({}, queue_stats['queued'])])
+    add('quiz_save_queue_games_total', 'counter', 'Игры, прошедшие через очередь записи', [
+        ({'result': result}, queue_stats[result]) for result in ('accepted', 'rejected', 'written', 'failed')
+    ])
+    
+    pool = storage.stats()
+    add('quiz_db_pool_connections', 'gauge', 'Соединения пула базы данных', [
+        ({'backend': pool['backend'], 'state': state}, pool[state]) for state in ('in_use', 'idle')
+    ])
+    add('quiz_db_pool_connections_created_total', 'counter', 'Созданные соединения с базой данных', [
+        ({'backend': pool['backend']}, pool['created'])
+    ])
+    return lines
+
+@app.route('/metrics')
+def get_metrics():
+    """Метрики процесса в текстовом формате Prometheus"""
+    if METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {METRICS_TOKEN}'
+    ):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    lines = metrics.render() + collect_component_metrics()
+    return app.response_class('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+def is_admin_request():
+    """Административный доступ: режим отладки или заголовок Bearer ADMIN_TOKEN"""
+    if DEBUG:
+        return True
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(
+        request.headers.get('Authorization', ''), f'Bearer {ADMIN_TOKEN}'
+    )
+
+@app.route('/admin/sql_profiler', methods=['GET', 'POST'])
+def admin_sql_profiler():
+    """Статистика SQL по формам запросов; POST включает/выключает профилировщик.
+
+    Тело POST: {"enabled": bool, "slow_query_ms": число, "reset": bool}.
+    Действует только на воркер, обработавший запрос.
+    """
+    if not is_admin_request():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        enabled = data.get('enabled')
+        slow_query_ms = data.get('slow_query_ms')
+        if enabled is not None and not isinstance(enabled, bool):
+            return jsonify({'error': 'Invalid field: enabled'}), 400
+        if slow_query_ms is not None and (
+            isinstance(slow_query_ms, bool) or not isinstance(slow_query_ms, (int, float)) or slow_query_ms < 0
+        ):
+            return jsonify({'error': 'Invalid field: slow_query_ms'}), 400
+        
+        sql_profiler.configure(enabled=enabled, slow_query_ms=slow_query_ms)
+        if data.get('reset'):
+            sql_profiler.reset()
+        logger.info(f"🔧 SQL-профилировщик: {sql_profiler.stats()}")
+    
+    limit = request.args.get('limit', 50, type=int)
+    return jsonify({
+        'profiler': sql_profiler.stats(),
+        'statements': sql_profiler.report(limit)
+    })
+
 @app.route('/debug/questions')
 def debug_questions():
     """Отладочная информация о вопросах"""
@@ -1349,20 +4542,15 @@ def debug_database():
         cursor = db.cursor()
         
         # Получаем информацию о таблицах
-        tables = cursor.execute("""
-            SELECT name FROM sqlite_master 
-            WHERE type='table' AND name NOT LIKE 'sqlite_%'
-        """).fetchall()
-        
         table_info = {}
-        for table in tables:
-            table_name = table[0]
+        for table_name in storage.table_names(cursor):
             count = cursor.execute(f'SELECT COUNT(*) FROM {table_name}').fetchone()[0]
             table_info[table_name] = count
         
         return jsonify({
             'tables': table_info,
-            'database_path': DATABASE_PATH
+            'backend': storage.name,
+            'database_path': DATABASE_PATH if storage.name == 'sqlite' else None
         })
         
     except Exception as e:
@@ -1391,6 +4579,175 @@ def bad_request(error):
         return jsonify({'error': 'Bad request'}), 400
     return render_template('index.html')
 
+# =====================================
+# АРХИВ ИСТОРИИ ИГР
+# =====================================
+# game_results разбит по месяцам created_at: свежие месяцы лежат в
+# основной базе, старые переносятся в отдельные базы SQLite
+# ARCHIVE_DIR/game_results_ГГГГ-ММ.db.gz. Статистика профилей, таблицы
+# лидеров и сверка счетчиков опираются на game_results_monthly, поэтому
+# архивация их не меняет.
+
+GAME_RESULT_COLUMNS = (
+    'id', 'user_id', 'username', 'first_name', 'last_name', 'score', 'total', 'category',
+    'difficulty', 'percentage', 'time_spent', 'hints_used', 'game_mode', 'created_at'
+)
+
+def month_bounds(month):
+    """Границы месяца 'ГГГГ-ММ' в формате created_at: [начало, начало следующего)"""
+    year, number = map(int, month.split('-'))
+    next_year, next_number = (year + 1, 1) if number == 12 else (year, number + 1)
+    return f'{year:04d}-{number:02d}-01 00:00:00', f'{next_year:04d}-{next_number:02d}-01 00:00:00'
+
+def archive_cutoff_month(keep_months, today=None):
+    """Первый месяц, который остается в основной базе"""
+    today = today or utc_today()
+    index = today.year * 12 + today.month - 1 - (keep_months - 1)
+    return f'{index // 12:04d}-{index % 12 + 1:02d}'
+
+def partition_path(month, archive_dir):
+    return os.path.abspath(os.path.join(archive_dir, f'game_results_{month}.db.gz'))
+
+def copy_file_gzip(source, target, compress):
+    """Сжатие или распаковка файла через временный файл рядом с target"""
+    temp_path = f'{target}.tmp'
+    opener = gzip.open if compress else open
+    with open(source, 'rb') if compress else gzip.open(source, 'rb') as src:
+        with opener(temp_path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+    with open(temp_path, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(temp_path, target)
+
+def archive_game_month(conn, month, archive_dir):
+    """Перенос строк game_results одного месяца в сжатую базу архива.
+
+    Строки сначала дописываются в базу месяца (существующий архив
+    распаковывается) и удаляются из основной базы только после того, как
+    сжатый файл записан на диск. Прерванный перенос можно повторить.
+    Возвращает число перенесенных строк.
+    """
+    start, end = month_bounds(month)
+    path = partition_path(month, archive_dir)
+    work_path = path[:-len('.gz')]
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if os.path.exists(work_path):
+        os.remove(work_path)
+    if os.path.exists(path):
+        copy_file_gzip(path, work_path, compress=False)
+
+    columns = ', '.join(GAME_RESULT_COLUMNS)
+    conn.execute('ATTACH DATABASE ? AS archive', (work_path,))
+    try:
+        with conn:
+            conn.execute(INITIAL_TABLES['game_results'].replace(
+                'IF NOT EXISTS game_results', 'IF NOT EXISTS archive.game_results'
+            ))
+            conn.execute(f'''
+                INSERT OR IGNORE INTO archive.game_results ({columns})
+                SELECT {columns} FROM main.game_results
+                WHERE created_at >= ? AND created_at < ?
+            ''', (start, end))
+            missing = conn.execute('''
+                SELECT COUNT(*) FROM main.game_results g
+                WHERE g.created_at >= ? AND g.created_at < ?
+                  AND NOT EXISTS (SELECT 1 FROM archive.game_results a WHERE a.id = g.id)
+            ''', (start, end)).fetchone()[0]
+            if missing:
+                raise RuntimeError(f"В архиве {month} нет {missing} строк с совпадающим id")
+            archived = conn.execute('SELECT COUNT(*) FROM archive.game_results').fetchone()[0]
+    finally:
+        conn.execute('DETACH DATABASE archive')
+
+    copy_file_gzip(work_path, path, compress=True)
+    os.remove(work_path)
+
+    with conn:
+        moved = conn.execute(
+            'DELETE FROM game_results WHERE created_at >= ? AND created_at < ?', (start, end)
+        ).rowcount
+        conn.execute('''
+            INSERT INTO game_archive_partitions (month, path, games, archived_at)
+            VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT(month) DO UPDATE SET
+                path = excluded.path, games = excluded.games, archived_at = excluded.archived_at
+        ''', (month, path, archived))
+    logger.info(f"🗄️ Архивирован месяц {month}: перенесено {moved} игр, в архиве {archived}")
+    return moved
+
+def archive_game_results(conn, keep_months=ARCHIVE_KEEP_MONTHS, archive_dir=ARCHIVE_DIR, today=None):
+    """Архивация всех месяцев старше keep_months; возвращает [(месяц, перенесено строк)]"""
+    if keep_months < 1:
+        raise ValueError("keep_months must be at least 1")
+
+    cutoff, _ = month_bounds(archive_cutoff_month(keep_months, today))
+    months = [row[0] for row in conn.execute('''
+        SELECT DISTINCT substr(created_at, 1, 7) FROM game_results
+        WHERE created_at < ? ORDER BY 1
+    ''', (cutoff,))]
+    return [(month, archive_game_month(conn, month, archive_dir)) for month in months]
+
+def merge_game_partitions(partitions, target):
+    """Сборка архивных месяцев в одну базу target.
+
+    Первый месяц распаковывается как есть, остальные по одному
+    подключаются к target и дописываются в его game_results, поэтому
+    число месяцев не упирается в ограничение SQLite на ATTACH.
+    """
+    (_, first_path), *rest = partitions
+    copy_file_gzip(first_path, target, compress=False)
+    columns = ', '.join(GAME_RESULT_COLUMNS)
+    local_path = f'{target}.part'
+    merge_conn = sqlite3.connect(target)
+    try:
+        for _, path in rest:
+            copy_file_gzip(path, local_path, compress=False)
+            merge_conn.execute('ATTACH DATABASE ? AS partition', (local_path,))
+            try:
+                with merge_conn:
+                    merge_conn.execute(f'''
+                        INSERT INTO main.game_results ({columns})
+                        SELECT {columns} FROM partition.game_results
+                    ''')
+            finally:
+                merge_conn.execute('DETACH DATABASE partition')
+            os.remove(local_path)
+    finally:
+        merge_conn.close()
+
+@contextmanager
+def open_game_history(conn, months=None):
+    """Временное представление game_results_history: основная таблица и архивные месяцы.
+
+    Архивы months (по умолчанию все) собираются во временную базу,
+    которая подключается одним ATTACH; после выхода из контекста она
+    отключается и удаляется.
+    """
+    partitions = [
+        (row['month'], row['path'])
+        for row in conn.execute('SELECT month, path FROM game_archive_partitions ORDER BY month')
+        if months is None or row['month'] in months
+    ]
+
+    columns = ', '.join(GAME_RESULT_COLUMNS)
+    temp_dir = tempfile.mkdtemp(prefix='quiz_history_')
+    attached = False
+    try:
+        selects = [f'SELECT {columns} FROM main.game_results']
+        if partitions:
+            history_path = os.path.join(temp_dir, 'history.db')
+            merge_game_partitions(partitions, history_path)
+            conn.execute('ATTACH DATABASE ? AS history', (history_path,))
+            attached = True
+            selects.append(f'SELECT {columns} FROM history.game_results')
+        conn.execute(f"CREATE TEMP VIEW game_results_history AS {' UNION ALL '.join(selects)}")
+        yield conn
+    finally:
+        conn.execute('DROP VIEW IF EXISTS temp.game_results_history')
+        if attached:
+            conn.execute('DETACH DATABASE history')
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
 # =====================================
 # ИНИЦИАЛИЗАЦИЯ И ЗАПУСК
 # =====================================
@@ -1401,11 +4758,17 @@ def initialize_app():
         logger.info("🚀 Инициализация Enhanced Quiz Mini App...")
         
         # Инициализация базы данных
-        init_database()
+        storage.init_schema()
         
         # Инициализация достижений
         init_achievements()
         
+        # Очистка устаревших ключей идемпотентности
+        with storage.connection() as conn, conn:
+            purged = purge_idempotency_keys(conn.cursor())
+        if purged:
+            logger.info(f"🧹 Удалено ключей идемпотентности: {purged}")
+        
         # Проверка файла вопросов
         questions = load_questions()
         if not questions:
@@ -1419,7 +4782,87 @@ def initialize_app():
         logger.error(traceback.format_exc())
         return False
 
+def migrate_command(dry_run=False):
+    """Применение миграций из командной строки (python app.py --migrate [--dry-run])"""
+    if storage.name != 'sqlite':
+        if dry_run:
+            print(f"🔎 Схема {storage.name} создается целиком при --migrate")
+            return 0
+        storage.init_schema()
+        init_achievements()
+        print(f"✅ Схема {storage.name} актуальна")
+        return 0
+    
+    applied = init_database(dry_run=dry_run)
+    for version, name, statements in applied:
+        print(f"{'🔎' if dry_run else '✅'} {version:03d} {name}")
+        if dry_run:
+            for statement in statements:
+                print(f"    {' '.join(statement.split())}")
+    if not applied:
+        print("✅ Схема базы данных актуальна")
+    if not dry_run:
+        init_achievements()
+    return 0
+
+def reconcile_stats_command(fix=False):
+    """Сверка счетчиков статистики (python app.py --reconcile-stats [--fix])"""
+    if storage.name != 'sqlite':
+        print(f"❌ Сверка счетчиков доступна только для SQLite (STORAGE_BACKEND={storage.name})")
+        return 2
+    
+    init_database()
+    with closing(connect_db()) as conn:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            drift = reconcile_app_stats(conn.cursor(), fix=fix)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    for key, (stored, actual) in sorted(drift.items()):
+        print(f"⚠️ {key}: сохранено {stored}, фактически {actual}")
+    if not drift:
+        print("✅ Счетчики статистики совпадают с данными")
+    elif fix:
+        print("✅ Счетчики пересчитаны")
+    return 1 if drift and not fix else 0
+
+def archive_command(keep_months=ARCHIVE_KEEP_MONTHS, vacuum=False):
+    """Перенос старых месяцев game_results в архив (python app.py --archive-games [--keep-months N] [--vacuum])"""
+    if storage.name != 'sqlite':
+        print(f"❌ Архивация доступна только для SQLite (STORAGE_BACKEND={storage.name})")
+        return 2
+    
+    init_database()
+    size_before = os.path.getsize(DATABASE_PATH)
+    with closing(connect_db()) as conn:
+        archived = archive_game_results(conn, keep_months)
+        if vacuum and archived:
+            conn.execute('VACUUM')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    
+    for month, moved in archived:
+        print(f"🗄️ {month}: перенесено {moved} игр в {partition_path(month, ARCHIVE_DIR)}")
+    if not archived:
+        print(f"✅ Месяцев старше {keep_months} мес. в основной базе нет")
+    print(f"📦 Размер базы: {size_before / 2**20:.1f} МБ → {os.path.getsize(DATABASE_PATH) / 2**20:.1f} МБ")
+    return 0
+
 if __name__ == '__main__':
+    if '--migrate' in sys.argv:
+        sys.exit(migrate_command(dry_run='--dry-run' in sys.argv))
+    
+    if '--reconcile-stats' in sys.argv:
+        sys.exit(reconcile_stats_command(fix='--fix' in sys.argv))
+    
+    if '--archive-games' in sys.argv:
+        keep_months = ARCHIVE_KEEP_MONTHS
+        if '--keep-months' in sys.argv:
+            keep_months = int(sys.argv[sys.argv.index('--keep-months') + 1])
+        sys.exit(archive_command(keep_months, vacuum='--vacuum' in sys.argv))
+    
     # Инициализация приложения
     if not initialize_app():
         logger.error("❌ Не удалось инициализировать приложение")
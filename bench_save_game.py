@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Бенчмарк сохранения результатов игр (/api/save_game)
+
+Запуск: python bench_save_game.py [--games 2000] [--users 200] [--queue]
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+import app as quiz_app
+
+def run_benchmark(games, users, seed=0, use_queue=False):
+    """Сохраняет games результатов во временную базу и возвращает saves/sec.
+
+    С use_queue игры пишет очередь отложенной записи; время включает
+    ожидание, пока фоновый поток запишет все принятые игры.
+    """
+    quiz_app.SAVE_QUEUE_ENABLED = use_queue
+    quiz_app.RATE_LIMIT_ENABLED = False
+    rng = random.Random(seed)
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        quiz_app.DATABASE_PATH = os.path.join(tmp_dir, 'bench.db')
+        quiz_app.init_database()
+        quiz_app.init_achievements()
+        client = quiz_app.app.test_client()
+        
+        payloads = [
+            {
+                'user_id': f'bench_{rng.randrange(users)}',
+                'first_name': 'Bench',
+                'score': rng.randint(0, 10),
+                'total': 10,
+                'category': rng.choice(['history', 'science', 'geography', 'sports', 'technology', 'arts']),
+                'difficulty': rng.choice(['easy', 'medium', 'hard']),
+                'time_spent': rng.randint(30, 300),
+                'game_mode': 'normal'
+            } for _ in range(games)
+        ]
+        
+        started = time.perf_counter()
+        for payload in payloads:
+            response = client.post('/api/save_game', json=payload)
+            if response.status_code not in (200, 202):
+                raise RuntimeError(f"save_game failed: {response.status_code} {response.get_data(as_text=True)}")
+        quiz_app.save_queue.flush()
+        elapsed = time.perf_counter() - started
+    
+    return games / elapsed
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк /api/save_game')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--queue', action='store_true', help='писать через очередь отложенной записи')
+    args = parser.parse_args()
+    
+    quiz_app.logger.setLevel('WARNING')
+    saves_per_second = run_benchmark(args.games, args.users, use_queue=args.queue)
+    print(f"💾 {args.games} игр: {saves_per_second:.0f} saves/sec")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
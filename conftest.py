@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Общие фикстуры тестов: чистая база во временном каталоге и клиент Flask
+"""
+
+import pytest
+
+import app as quiz_app
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Чистая база с достижениями и пустыми кэшами; пул закрывается после теста"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'quiz.db'))
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    quiz_app.init_database()
+    quiz_app.init_achievements()
+    quiz_app.leaderboard_cache.clear()
+    quiz_app.response_cache.clear()
+    quiz_app.profile_cache.clear()
+    yield quiz_app.DATABASE_PATH
+    quiz_app.db_pool.close_all()
+
+@pytest.fixture
+def client(database):
+    """Тестовый клиент на чистой базе"""
+    return quiz_app.app.test_client()
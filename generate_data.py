@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Генератор синтетических данных для бенчмарков
+
+База: пользователи с активностью по степенному закону (немногие играют
+очень много), перекосом категорий и любимой категорией у каждого игрока,
+уровнем мастерства, от которого зависят результаты и серии, а также
+ежедневные задания за последние дни. Все производные таблицы (рейтинг,
+прогресс, общая статистика) пересчитываются после загрузки.
+
+Банк вопросов: файл в формате questions.json любого размера.
+
+Запуск:
+    python generate_data.py db --out big.db [--users 100000] [--games 10000000] [--days 365]
+    python generate_data.py questions --out big_questions.json [--count 50000]
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import app as quiz_app
+
+CATEGORY_WEIGHTS = {
+    'history': 25,
+    'science': 20,
+    'geography': 18,
+    'sports': 15,
+    'technology': 12,
+    'arts': 10
+}
+DIFFICULTY_WEIGHTS = {'easy': 50, 'medium': 35, 'hard': 15}
+DIFFICULTY_PENALTY = {'easy': 0.0, 'medium': 0.1, 'hard': 0.2}
+FAVORITE_CATEGORY_SHARE = 0.5
+MARATHON_SHARE = 0.1
+HINTS_WEIGHTS = (70, 20, 10)
+CHALLENGE_TARGETS = {'games_count': 3, 'category_master': 80, 'perfect_answers': 5}
+
+FIRST_NAMES = [
+    'Александр', 'Мария', 'Дмитрий', 'Анна', 'Иван', 'Елена', 'Сергей', 'Ольга',
+    'Никита', 'Татьяна', 'Максим', 'Наталья', 'Артем', 'Ксения', 'Павел', 'Юлия'
+]
+WORDS = [
+    'какой', 'город', 'год', 'ученый', 'открытие', 'страна', 'река', 'картина',
+    'автор', 'команда', 'чемпионат', 'элемент', 'планета', 'изобретение', 'язык',
+    'столица', 'композитор', 'роман', 'континент', 'скорость', 'закон', 'век'
+]
+
+# =====================================
+# БАЗА ДАННЫХ
+# =====================================
+
+def cumulative_user_weights(users, exponent):
+    """Накопленные веса активности: вес пользователя ранга r ~ 1 / r^exponent"""
+    return list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(users)))
+
+def timestamp(seconds):
+    return datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+class UserState:
+    """Параметры и накопленные счетчики одного синтетического игрока"""
+    __slots__ = (
+        'user_id', 'first_name', 'skill', 'favorite', 'games', 'score', 'best_streak',
+        'current_streak', 'first_played', 'last_day', 'daily_streak', 'best_daily_streak'
+    )
+
+    def __init__(self, index, rng):
+        self.user_id = str(100000000 + index)
+        self.first_name = rng.choice(FIRST_NAMES)
+        self.skill = rng.betavariate(5, 3)
+        self.favorite = rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+        self.games = 0
+        self.score = 0
+        self.best_streak = 0
+        self.current_streak = 0
+        self.first_played = None
+        self.last_day = None
+        self.daily_streak = 0
+        self.best_daily_streak = 0
+
+    def play(self, day, created_at, score, best_streak, current_streak):
+        self.games += 1
+        self.score += score
+        self.best_streak = max(self.best_streak, best_streak)
+        self.current_streak = current_streak
+        if self.first_played is None:
+            self.first_played = created_at
+
+        if day != self.last_day:
+            previous = (datetime.strptime(day, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y-%m-%d')
+            self.daily_streak = self.daily_streak + 1 if self.last_day == previous else 1
+            self.best_daily_streak = max(self.best_daily_streak, self.daily_streak)
+            self.last_day = day
+
+def generate_game(rng, user):
+    """Одна игра пользователя: (category, difficulty, mode, score, total, ...)"""
+    if rng.random() < MARATHON_SHARE:
+        category, difficulty, mode, total = 'mixed', 'mixed', 'marathon', quiz_app.MARATHON_QUESTIONS_COUNT
+        penalty = DIFFICULTY_PENALTY['medium']
+    else:
+        if rng.random() < FAVORITE_CATEGORY_SHARE:
+            category = user.favorite
+        else:
+            category = rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+        difficulty = rng.choices(list(DIFFICULTY_WEIGHTS), weights=list(DIFFICULTY_WEIGHTS.values()))[0]
+        mode, total = 'normal', 10
+        penalty = DIFFICULTY_PENALTY[difficulty]
+
+    # Нормальное приближение биномиального числа правильных ответов
+    p = min(0.98, max(0.02, user.skill - penalty))
+    score = int(round(rng.gauss(total * p, math.sqrt(total * p * (1 - p)))))
+    score = min(total, max(0, score))
+
+    best_streak = total if score == total else rng.randint(min(1, score), score)
+    current_streak = rng.randint(0, best_streak)
+    time_spent = int(total * rng.lognormvariate(math.log(12), 0.4))
+    hints_used = rng.choices((0, 1, 2), weights=HINTS_WEIGHTS)[0]
+    return category, difficulty, mode, score, total, best_streak, current_streak, time_spent, hints_used
+
+def generate_database(path, users, games, days, seed=0, batch_size=50000, challenge_days=30, exponent=1.1):
+    """Заполнение новой базы path; возвращает число строк по таблицам"""
+    rng = random.Random(seed)
+    quiz_app.DATABASE_PATH = path
+    quiz_app.init_database()
+    quiz_app.init_achievements()
+
+    conn = quiz_app.connect_db(path)
+    conn.profiler = None
+    conn.execute('PRAGMA synchronous = OFF')
+    cursor = conn.cursor()
+
+    if cursor.execute('SELECT EXISTS (SELECT 1 FROM game_results)').fetchone()[0]:
+        raise RuntimeError(f'{path} уже содержит игры')
+
+    players = [UserState(index, rng) for index in range(users)]
+    cum_weights = cumulative_user_weights(users, exponent)
+
+    end = time.time()
+    start = end - days * 86400
+    challenge_from = datetime.fromtimestamp(end - challenge_days * 86400, timezone.utc).strftime('%Y-%m-%d')
+    # (user_id, день) -> [игр, был ли результат 80%+, вопросов в идеальных играх]
+    challenge_days_stats = {}
+
+    conn.execute('BEGIN')
+    # Триггеры счетчиков снимаются на время загрузки, счетчики пересчитываются в конце
+    for trigger in quiz_app.APP_STATS_TRIGGERS:
+        conn.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+
+    batches = max(1, math.ceil(games / batch_size))
+    span = (end - start) / batches
+    generated = 0
+    for batch in range(batches):
+        count = min(batch_size, games - generated)
+        # Игры пачки лежат в своем временном окне, id растут вместе со временем
+        moments = sorted(rng.uniform(start + batch * span, start + (batch + 1) * span) for _ in range(count))
+        chosen = rng.choices(players, cum_weights=cum_weights, k=count)
+
+        rows = []
+        for user, moment in zip(chosen, moments):
+            category, difficulty, mode, score, total, best_streak, current_streak, time_spent, hints_used = generate_game(rng, user)
+            created_at = timestamp(moment)
+            day = created_at[:10]
+            percentage = score / total * 100
+            user.play(day, created_at, score, best_streak, current_streak)
+
+            if day >= challenge_from:
+                stats = challenge_days_stats.setdefault((user.user_id, day), [0, False, 0])
+                stats[0] += 1
+                stats[1] = stats[1] or percentage >= 80
+                if score == total:
+                    stats[2] += total
+
+            rows.append((
+                user.user_id, '', user.first_name, '', score, total, category, difficulty,
+                percentage, time_spent, hints_used, mode, created_at
+            ))
+
+        cursor.executemany('''
+            INSERT INTO game_results
+            (user_id, username, first_name, last_name, score, total, category,
+             difficulty, percentage, time_spent, hints_used, game_mode, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        generated += count
+        print(f"  🎲 {generated}/{games} игр", end='\r', flush=True)
+    print()
+
+    cursor.executemany('''
+        INSERT INTO user_profiles
+        (user_id, username, first_name, last_name, total_games, total_score,
+         best_streak, current_streak, level, experience_points, created_at, updated_at)
+        VALUES (?, '', ?, '', ?, ?, ?, ?, 1, 0, ?, ?)
+    ''', [
+        (
+            user.user_id, user.first_name, user.games, user.score, user.best_streak,
+            user.current_streak, user.first_played or timestamp(start), user.first_played or timestamp(start)
+        ) for user in players
+    ])
+
+    challenge_rows = []
+    for (user_id, day), (played, mastered, perfect_total) in challenge_days_stats.items():
+        challenge_type = rng.choice(list(CHALLENGE_TARGETS))
+        target = CHALLENGE_TARGETS[challenge_type]
+        progress = {
+            'games_count': min(played, target),
+            'category_master': target if mastered else 0,
+            'perfect_answers': min(perfect_total, target)
+        }[challenge_type]
+        challenge_rows.append((user_id, day, challenge_type, target, progress, progress >= target, f'{day} 00:00:00'))
+    cursor.executemany('''
+        INSERT INTO daily_challenges
+        (user_id, challenge_date, challenge_type, target_value, current_progress, completed, created_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', challenge_rows)
+
+    print("  🧮 Пересчет производных таблиц...")
+    for create_sql in quiz_app.APP_STATS_TRIGGERS.values():
+        conn.execute(create_sql)
+    quiz_app.rebuild_game_results_monthly(cursor)
+    quiz_app.rebuild_leaderboard_stats(cursor)
+    quiz_app.rebuild_leaderboard_periods(cursor)
+    quiz_app.rebuild_user_progress(cursor)
+    cursor.executemany('''
+        UPDATE user_progress
+        SET daily_streak = ?, best_daily_streak = ?, last_played_date = ?
+        WHERE user_id = ?
+    ''', [
+        (user.daily_streak, user.best_daily_streak, user.last_day, user.user_id)
+        for user in players if user.last_day
+    ])
+    quiz_app.reconcile_app_stats(cursor, fix=True)
+    conn.commit()
+
+    conn.execute('ANALYZE')
+    conn.close()
+
+    return {
+        'user_profiles': users,
+        'game_results': games,
+        'daily_challenges': len(challenge_rows)
+    }
+
+# =====================================
+# БАНК ВОПРОСОВ
+# =====================================
+
+def generate_sentence(rng, min_words, max_words):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))]
+    return ' '.join(words).capitalize()
+
+def generate_questions(count, seed=0):
+    """Банк вопросов в формате questions.json: category -> difficulty -> список"""
+    rng = random.Random(seed)
+    buckets = [(category, difficulty) for category in CATEGORY_WEIGHTS for difficulty in DIFFICULTY_WEIGHTS]
+    bank = {category: {difficulty: [] for difficulty in DIFFICULTY_WEIGHTS} for category in CATEGORY_WEIGHTS}
+
+    for number in range(count):
+        category, difficulty = buckets[number % len(buckets)]
+        bank[category][difficulty].append({
+            'question': f"{generate_sentence(rng, 5, 14)} (№{number + 1})?",
+            'options': [generate_sentence(rng, 1, 4) for _ in range(4)],
+            'correct': rng.randrange(4),
+            'explanation': generate_sentence(rng, 8, 24) + '.'
+        })
+    return bank
+
+def main():
+    parser = argparse.ArgumentParser(description='Генератор синтетических данных викторины')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    db_parser = commands.add_parser('db', help='база результатов игр')
+    db_parser.add_argument('--out', required=True, help='путь к новой базе')
+    db_parser.add_argument('--users', type=int, default=100000)
+    db_parser.add_argument('--games', type=int, default=1000000)
+    db_parser.add_argument('--days', type=int, default=365, help='за сколько дней распределить игры')
+    db_parser.add_argument('--challenge-days', type=int, default=30, help='дней с ежедневными заданиями')
+    db_parser.add_argument('--exponent', type=float, default=1.1, help='показатель степенного закона активности')
+    db_parser.add_argument('--batch-size', type=int, default=50000)
+    db_parser.add_argument('--seed', type=int, default=0)
+    db_parser.add_argument('--force', action='store_true', help='перезаписать существующий файл')
+
+    questions_parser = commands.add_parser('questions', help='банк вопросов')
+    questions_parser.add_argument('--out', required=True)
+    questions_parser.add_argument('--count', type=int, default=10000)
+    questions_parser.add_argument('--seed', type=int, default=0)
+
+    args = parser.parse_args()
+    # Расхождение счетчиков после загрузки ожидаемо и исправляется сразу
+    quiz_app.logger.setLevel('ERROR')
+
+    if args.command == 'questions':
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(generate_questions(args.count, args.seed), f, ensure_ascii=False, indent=2)
+        print(f"✅ {args.count} вопросов записано в {args.out}")
+        return 0
+
+    if os.path.exists(args.out):
+        if not args.force:
+            print(f"❌ {args.out} уже существует (используйте --force)")
+            return 1
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.out + suffix):
+                os.remove(args.out + suffix)
+
+    started = time.perf_counter()
+    counts = generate_database(
+        args.out, args.users, args.games, args.days, seed=args.seed, batch_size=args.batch_size,
+        challenge_days=args.challenge_days, exponent=args.exponent
+    )
+    elapsed = time.perf_counter() - started
+
+    for table, count in counts.items():
+        print(f"  📦 {table}: {count}")
+    print(f"✅ База {args.out} готова за {elapsed:.1f} с ({counts['game_results'] / elapsed:.0f} игр/с)")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
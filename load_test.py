@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест API: сессии Mini App с заданной конкурентностью
+
+Каждая сессия повторяет путь пользователя: bootstrap → вопросы (обычная
+игра или марафон) → save_game → таблица лидеров → профиль. Для каждого
+маршрута выводятся пропускная способность и задержки p50/p95/p99.
+
+Запуск:
+    python load_test.py [--sessions 500] [--concurrency 8] [--users 1000]
+    python load_test.py --db big.db              # готовая база (копия, файл не меняется)
+    python load_test.py --gunicorn --workers 4   # локальный gunicorn вместо test client
+    python load_test.py --url http://host:8000   # уже запущенный сервер
+    python load_test.py --json report.json --baseline old.json --max-regression 0.2
+"""
+
+import argparse
+import http.client
+import json
+import math
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+CATEGORIES = ['history', 'science', 'geography', 'sports', 'technology', 'arts']
+DIFFICULTIES = ['easy', 'medium', 'hard']
+MARATHON_SHARE = 0.2
+
+class LatencyRecorder:
+    """Задержки и ошибки по маршрутам (потокобезопасно)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, elapsed, ok):
+        with self._lock:
+            self.latencies.setdefault(route, []).append(elapsed)
+            if not ok:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по ближайшему рангу"""
+    if not sorted_values:
+        return 0.0
+    index = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def build_report(recorder, elapsed):
+    """Сводка по маршрутам: запросы, ошибки, RPS и перцентили в миллисекундах"""
+    routes = {}
+    for route, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        routes[route] = {
+            'requests': len(values),
+            'errors': recorder.errors.get(route, 0),
+            'rps': round(len(values) / elapsed, 1),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(values, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2)
+        }
+    total = sum(route['requests'] for route in routes.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': total,
+        'rps': round(total / elapsed, 1),
+        'routes': routes
+    }
+
+def print_report(report):
+    print(f"\n⏱  {report['requests']} запросов за {report['elapsed_s']} с ({report['rps']} req/s)\n")
+    print(f"{'маршрут':<14}{'запросов':>10}{'ошибок':>8}{'req/s':>9}{'p50 мс':>9}{'p95 мс':>9}{'p99 мс':>9}{'max мс':>9}")
+    for route, stats in report['routes'].items():
+        print(
+            f"{route:<14}{stats['requests']:>10}{stats['errors']:>8}{stats['rps']:>9}"
+            f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}{stats['max_ms']:>9}"
+        )
+
+def find_regressions(report, baseline, max_regression):
+    """Маршруты, у которых p95 вырос больше чем на max_regression относительно базового отчета"""
+    regressions = []
+    for route, stats in report['routes'].items():
+        previous = baseline.get('routes', {}).get(route)
+        if previous and previous['p95_ms'] > 0 and stats['p95_ms'] > previous['p95_ms'] * (1 + max_regression):
+            regressions.append((route, previous['p95_ms'], stats['p95_ms']))
+    return regressions
+
+# =====================================
+# КЛИЕНТЫ
+# =====================================
+
+class InProcessTransport:
+    """Запросы через Flask test client в текущем процессе"""
+
+    def __init__(self, quiz_app):
+        self.quiz_app = quiz_app
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.quiz_app.app.test_client()
+        return client
+
+    def get(self, path):
+        response = self._client().get(path)
+        return response.status_code, response.get_json(silent=True)
+
+    def post(self, path, payload):
+        response = self._client().post(path, json=payload)
+        return response.status_code, response.get_json(silent=True)
+
+class HttpTransport:
+    """Запросы по HTTP к запущенному серверу (keep-alive соединение на поток)"""
+
+    def __init__(self, base_url):
+        parsed = urllib.parse.urlsplit(base_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.prefix = parsed.path.rstrip('/')
+        self._local = threading.local()
+
+    def _request(self, method, path, body=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        try:
+            conn.request(method, self.prefix + path, body=body, headers=headers)
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self._local.conn = None
+            raise
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, payload):
+        return self._request('POST', path, json.dumps(payload).encode())
+
+# =====================================
+# СЕССИЯ MINI APP
+# =====================================
+
+def run_session(transport, recorder, rng, users):
+    """Одна сессия пользователя от стартового экрана до профиля"""
+
+    def call(route, method, path, payload=None):
+        started = time.perf_counter()
+        try:
+            if method == 'GET':
+                status, body = transport.get(path)
+            else:
+                status, body = transport.post(path, payload)
+        except Exception:
+            status, body = 0, None
+        recorder.record(route, time.perf_counter() - started, 200 <= status < 300)
+        return body
+
+    # Активность пользователей неравномерна: часть игроков приходит чаще
+    user_id = f'load_{int(users * rng.random() ** 2)}'
+    call('bootstrap', 'GET', f'/api/bootstrap/{user_id}')
+
+    if rng.random() < MARATHON_SHARE:
+        category, difficulty, mode = 'mixed', 'mixed', 'marathon'
+        questions = call('questions', 'GET', '/api/questions/mixed?count=20') or []
+    else:
+        category, difficulty, mode = rng.choice(CATEGORIES), rng.choice(DIFFICULTIES), 'normal'
+        questions = call('questions', 'GET', f'/api/questions/{category}/{difficulty}?limit=10') or []
+
+    total = len(questions) if isinstance(questions, list) and questions else 10
+    score = sum(rng.random() < 0.65 for _ in range(total))
+    call('save_game', 'POST', '/api/save_game', {
+        'idempotency_key': uuid.UUID(int=rng.getrandbits(128)).hex,
+        'user_id': user_id,
+        'first_name': 'Load',
+        'score': score,
+        'total': total,
+        'category': category,
+        'difficulty': difficulty,
+        'time_spent': rng.randint(30, 300),
+        'game_mode': mode,
+        'best_streak': min(score, rng.randint(0, total)),
+        'current_streak': 0
+    })
+
+    call('leaderboard', 'GET', f'/api/leaderboard/{category if mode == "normal" else "overall"}')
+    call('profile', 'GET', f'/api/profile/{user_id}')
+
+def run_load(transport, sessions, concurrency, users, seed):
+    """Прогон sessions сессий в concurrency потоков; возвращает отчет"""
+    recorder = LatencyRecorder()
+    seeds = random.Random(seed)
+    session_seeds = [seeds.getrandbits(64) for _ in range(sessions)]
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(
+            lambda session_seed: run_session(transport, recorder, random.Random(session_seed), users),
+            session_seeds
+        ))
+    return build_report(recorder, time.perf_counter() - started)
+
+# =====================================
+# ПОДГОТОВКА БАЗЫ И СЕРВЕРА
+# =====================================
+
+def seed_database(quiz_app, users, games, seed):
+    """Наполнение пустой базы через штатную запись игр (для небольших объемов)"""
+    rng = random.Random(seed)
+    batch = []
+    with quiz_app.app.app_context():
+        db = quiz_app.get_db()
+        for _ in range(games):
+            batch.append({
+                'user_id': f'load_{int(users * rng.random() ** 2)}',
+                'first_name': 'Load',
+                'score': rng.randint(0, 10),
+                'total': 10,
+                'category': rng.choice(CATEGORIES),
+                'difficulty': rng.choice(DIFFICULTIES),
+                'time_spent': rng.randint(30, 300),
+                'game_mode': 'normal'
+            })
+            if len(batch) == 500:
+                with db:
+                    quiz_app.record_game_results(db.cursor(), batch)
+                batch = []
+        if batch:
+            with db:
+                quiz_app.record_game_results(db.cursor(), batch)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_gunicorn(database_path, workers):
+    """Локальный gunicorn на свободном порту; возвращает (процесс, URL)"""
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=database_path,
+        RATE_LIMIT_ENABLED='false',
+        TELEGRAM_AUTH_MODE='off'
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'app:app', '--bind', f'127.0.0.1:{port}', '--workers', str(workers)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn завершился при запуске')
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return process, url
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError('gunicorn не начал принимать соединения за 30 секунд')
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест API викторины')
+    parser.add_argument('--sessions', type=int, default=500, help='число сессий пользователей')
+    parser.add_argument('--concurrency', type=int, default=8, help='одновременных сессий')
+    parser.add_argument('--users', type=int, default=1000, help='число разных пользователей')
+    parser.add_argument('--db', help='готовая база (копируется, исходный файл не меняется)')
+    parser.add_argument('--seed-games', type=int, default=5000, help='игр в новой базе, если --db не задан')
+    parser.add_argument('--gunicorn', action='store_true', help='запустить локальный gunicorn')
+    parser.add_argument('--workers', type=int, default=2, help='воркеров gunicorn')
+    parser.add_argument('--url', help='адрес уже запущенного сервера')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='сохранить отчет в JSON')
+    parser.add_argument('--baseline', help='отчет JSON для сравнения')
+    parser.add_argument('--max-regression', type=float, default=0.2, help='допустимый рост p95 (доля)')
+    args = parser.parse_args()
+
+    if args.url:
+        report = run_load(HttpTransport(args.url), args.sessions, args.concurrency, args.users, args.seed)
+    else:
+        import app as quiz_app
+        quiz_app.logger.setLevel('WARNING')
+        quiz_app.RATE_LIMIT_ENABLED = False
+        quiz_app.TELEGRAM_AUTH_MODE = 'off'
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            quiz_app.DATABASE_PATH = os.path.join(tmp_dir, 'load.db')
+            if args.db:
+                shutil.copyfile(args.db, quiz_app.DATABASE_PATH)
+            quiz_app.init_database()
+            quiz_app.init_achievements()
+            if not args.db:
+                print(f"🌱 Наполнение базы: {args.seed_games} игр, {args.users} пользователей")
+                seed_database(quiz_app, args.users, args.seed_games, args.seed)
+            quiz_app.db_pool.close_all()
+
+            if args.gunicorn:
+                process, url = start_gunicorn(quiz_app.DATABASE_PATH, args.workers)
+                try:
+                    report = run_load(HttpTransport(url), args.sessions, args.concurrency, args.users, args.seed)
+                finally:
+                    process.terminate()
+                    process.wait(timeout=10)
+            else:
+                report = run_load(InProcessTransport(quiz_app), args.sessions, args.concurrency, args.users, args.seed)
+                quiz_app.db_pool.close_all()
+
+    print_report(report)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    errors = sum(route['errors'] for route in report['routes'].values())
+    if errors:
+        print(f"❌ Ошибок: {errors}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = find_regressions(report, json.load(f), args.max_regression)
+        for route, before, after in regressions:
+            print(f"📉 {route}: p95 {before} → {after} мс")
+        if regressions:
+            return 1
+
+    return 1 if errors else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -16,6 +16,8 @@ let score = 0;
 let questions = [];
 let totalQuestions = 0;
 let hintsUsed = 0;
+let answerStreak = 0;
+let bestAnswerStreak = 0;
 let maxHints = 2;
 let gameStartTime = null;
 let questionStartTime = null;
@@ -27,6 +29,15 @@ const userName = tg.initDataUnsafe?.user?.username || '';
 const firstName = tg.initDataUnsafe?.user?.first_name || 'Игрок';
 const lastName = tg.initDataUnsafe?.user?.last_name || '';
 
+// Запросы к API с подписанными initData Telegram для проверки на сервере
+function apiFetch(url, options = {}) {
+    const headers = { ...(options.headers || {}) };
+    if (tg.initData) {
+        headers['X-Telegram-Init-Data'] = tg.initData;
+    }
+    return fetch(url, { ...options, headers: headers });
+}
+
 // Информация о категориях с расширенными данными
 const categoryInfo = {
     'history': { 
@@ -84,11 +95,11 @@ document.addEventListener('DOMContentLoaded', () => {
     // Загружаем категории
     loadCategories();
     
-    // Загружаем профиль пользователя
-    loadUserProfile();
+    // Отправляем игры, которые не удалось сохранить раньше
+    flushPendingGames();
     
-    // Загружаем ежедневное задание
-    loadDailyChallenge();
+    // Загружаем профиль, ежедневное задание и категории одним запросом
+    loadBootstrap();
     
     // Загружаем рейтинг
     loadLeaderboard();
@@ -131,6 +142,36 @@ function loadCategories() {
     container.innerHTML = categoriesHTML;
 }
 
+// Загрузка стартового экрана одним запросом
+async function loadBootstrap() {
+    try {
+        const response = await apiFetch(`/api/bootstrap/${userId}`);
+        if (!response.ok) {
+            throw new Error(`HTTP ${response.status}`);
+        }
+        
+        const data = await response.json();
+        userProfile = data.profile;
+        updateProfileDisplay();
+        updateDailyChallengeDisplay(data.daily_challenge);
+        updateCategoryCounts(data.categories);
+    } catch (error) {
+        console.error('Ошибка загрузки стартового экрана:', error);
+        loadUserProfile();
+        loadDailyChallenge();
+    }
+}
+
+// Число вопросов в карточках категорий
+function updateCategoryCounts(categories) {
+    categories.forEach(category => {
+        const card = document.querySelector(`.category-card[onclick="selectCategory('${category.category}')"]`);
+        if (card) {
+            card.querySelector('.category-count').textContent = `${category.questions} вопросов`;
+        }
+    });
+}
+
 // Навигация между экранами
 function showScreen(screenId) {
     document.querySelectorAll('.screen').forEach(screen => {
@@ -223,40 +264,27 @@ async function startMarathonQuiz() {
     updateLoadingScreen('Подготовка марафона...', 'Собираем лучшие вопросы из всех категорий');
     
     try {
-        // Загружаем вопросы из всех категорий и сложностей
-        const allQuestions = [];
-        
-        for (const [category, difficulties] of Object.entries(categoryInfo)) {
-            for (const diff of ['easy', 'medium', 'hard']) {
-                try {
-                    const response = await fetch(`/api/questions/${category}/${diff}`);
-                    if (response.ok) {
-                        const categoryQuestions = await response.json();
-                        // Добавляем метаданные к каждому вопросу
-                        categoryQuestions.forEach(q => {
-                            q.category = category;
-                            q.difficulty = diff;
-                        });
-                        allQuestions.push(...categoryQuestions);
-                    }
-                } catch (error) {
-                    console.warn(`Не удалось загрузить ${category}/${diff}:`, error);
-                }
-            }
+        // Сервер сам выбирает 20 вопросов из всех категорий и сложностей
+        const categories = Object.keys(categoryInfo).join(',');
+        const response = await apiFetch(`/api/questions/mixed?count=20&categories=${categories}`);
+        if (!response.ok) {
+            throw new Error('Ошибка загрузки вопросов');
         }
         
-        if (allQuestions.length === 0) {
+        questions = await response.json();
+        
+        if (questions.length === 0) {
             throw new Error('Вопросы не найдены');
         }
         
-        // Перемешиваем и берем 20 вопросов
-        questions = shuffleArray(allQuestions).slice(0, 20);
         totalQuestions = questions.length;
         
         // Сброс игровых переменных
         currentQuestionIndex = 0;
         score = 0;
         hintsUsed = 0;
+        answerStreak = 0;
+        bestAnswerStreak = 0;
         gameStartTime = Date.now();
         
         // Обновляем интерфейс для марафона
@@ -281,7 +309,7 @@ async function loadAndStartQuiz(category, difficulty) {
         showScreen('loadingScreen');
         updateLoadingScreen('Загрузка вопросов...', `Подготавливаем ${difficultyInfo[difficulty].name.toLowerCase()} уровень`);
         
-        const response = await fetch(`/api/questions/${category}/${difficulty}`);
+        const response = await apiFetch(`/api/questions/${category}/${difficulty}?limit=10`);
         if (!response.ok) {
             throw new Error('Ошибка загрузки вопросов');
         }
@@ -297,6 +325,8 @@ async function loadAndStartQuiz(category, difficulty) {
         currentQuestionIndex = 0;
         score = 0;
         hintsUsed = 0;
+        answerStreak = 0;
+        bestAnswerStreak = 0;
         gameStartTime = Date.now();
         
         // Обновляем информацию о категории и сложности
@@ -406,8 +436,11 @@ function selectAnswer(selectedIndex) {
     const isCorrect = selectedIndex === question.correct;
     if (isCorrect) {
         score++;
+        answerStreak++;
+        bestAnswerStreak = Math.max(bestAnswerStreak, answerStreak);
         tg.HapticFeedback.notificationOccurred('success');
     } else {
+        answerStreak = 0;
         tg.HapticFeedback.notificationOccurred('error');
     }
     
@@ -538,37 +571,57 @@ async function endQuiz() {
     }
     
     // Сохраняем результат и проверяем достижения
+    const gameData = {
+        idempotency_key: generateGameKey(),
+        user_id: userId,
+        username: userName,
+        first_name: firstName,
+        last_name: lastName,
+        score: score,
+        total: totalQuestions,
+        category: currentQuiz || 'mixed',
+        difficulty: currentDifficulty,
+        time_spent: totalTime,
+        hints_used: hintsUsed,
+        game_mode: currentGameMode,
+        best_streak: bestAnswerStreak,
+        current_streak: answerStreak
+    };
+    
     try {
-        const response = await fetch('/api/save_game', {
+        const response = await apiFetch('/api/save_game', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
-            body: JSON.stringify({
-                user_id: userId,
-                username: userName,
-                first_name: firstName,
-                last_name: lastName,
-                score: score,
-                total: totalQuestions,
-                category: currentQuiz || 'mixed',
-                difficulty: currentDifficulty,
-                time_spent: totalTime,
-                hints_used: hintsUsed,
-                game_mode: currentGameMode
-            })
+            body: JSON.stringify(gameData)
         });
         
         if (response.ok) {
             const result = await response.json();
             
-            // Показываем новые достижения
-            if (result.new_achievements && result.new_achievements.length > 0) {
-                showNewAchievements(result.new_achievements);
+            if (result.status === 'queued') {
+                // Сервер записывает игру в фоне: достижения забираем по номеру заявки
+                pollSaveResult(result.poll_url)
+                    .then(saveResult => {
+                        if (saveResult.status === 'error') {
+                            addPendingGame(gameData);
+                        } else {
+                            showSaveResultAchievements(saveResult);
+                        }
+                    })
+                    .catch(error => console.error('Ошибка получения результата сохранения:', error));
+            } else {
+                showSaveResultAchievements(result);
             }
+        } else if (response.status !== 400) {
+            // Сервер недоступен, перегружен (503, 429) или не принял устаревшую
+            // подпись Telegram (401, 403): отправим игру позже. 400 — игра неверна
+            addPendingGame(gameData);
         }
     } catch (error) {
         console.error('Ошибка сохранения результата:', error);
+        addPendingGame(gameData);
     }
     
     // Haptic feedback
@@ -602,10 +655,95 @@ function showNewAchievements(achievements) {
     }
 }
 
+// Ключ идемпотентности игры: повторная отправка не создаст дубликат
+function generateGameKey() {
+    if (window.crypto && crypto.randomUUID) {
+        return crypto.randomUUID();
+    }
+    return `${Date.now()}-${Math.random().toString(16).slice(2)}`;
+}
+
+// Несохраненные игры хранятся в localStorage до успешной отправки
+const PENDING_GAMES_KEY = 'pendingGames';
+const PENDING_GAMES_BATCH = 100;
+
+function loadPendingGames() {
+    try {
+        return JSON.parse(localStorage.getItem(PENDING_GAMES_KEY)) || [];
+    } catch (error) {
+        return [];
+    }
+}
+
+function storePendingGames(games) {
+    try {
+        localStorage.setItem(PENDING_GAMES_KEY, JSON.stringify(games));
+    } catch (error) {
+        console.error('Ошибка сохранения очереди игр:', error);
+    }
+}
+
+function addPendingGame(gameData) {
+    storePendingGames([...loadPendingGames(), gameData]);
+}
+
+// Отправка накопленных игр одним запросом
+async function flushPendingGames() {
+    const games = loadPendingGames().slice(0, PENDING_GAMES_BATCH);
+    if (games.length === 0) return;
+    
+    try {
+        const response = await apiFetch('/api/save_games', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ games: games })
+        });
+        if (!response.ok) return;
+        
+        // Сохраненные, повторные и отклоненные игры убираем из очереди
+        const result = await response.json();
+        const processed = new Set(result.results.map(item => item.idempotency_key));
+        storePendingGames(loadPendingGames().filter(game => !processed.has(game.idempotency_key)));
+        
+        const achievements = result.results.flatMap(item => item.new_achievements || []);
+        if (achievements.length > 0) {
+            showNewAchievements(achievements);
+        }
+    } catch (error) {
+        console.error('Ошибка отправки накопленных игр:', error);
+    }
+}
+
+// Показ достижений из ответа на сохранение игры
+function showSaveResultAchievements(result) {
+    if (result.new_achievements && result.new_achievements.length > 0) {
+        showNewAchievements(result.new_achievements);
+    }
+}
+
+// Ожидание отложенной записи игры
+async function pollSaveResult(pollUrl, attempts = 10) {
+    for (let i = 0; i < attempts; i++) {
+        await new Promise(resolve => setTimeout(resolve, 300));
+        const response = await apiFetch(pollUrl);
+        if (!response.ok) {
+            break;
+        }
+        
+        const result = await response.json();
+        if (result.status !== 'queued') {
+            return result;
+        }
+    }
+    return {};
+}
+
 // Загрузка профиля пользователя
 async function loadUserProfile() {
     try {
-        const response = await fetch(`/api/profile/${userId}`);
+        const response = await apiFetch(`/api/profile/${userId}`);
         if (response.ok) {
             userProfile = await response.json();
             updateProfileDisplay();
@@ -672,9 +810,11 @@ function updateProfileDisplay() {
 // Загрузка рейтинга
 async function loadLeaderboard() {
     const category = document.getElementById('leaderboardCategory').value;
+    const period = document.getElementById('leaderboardPeriod').value;
+    const query = period ? `?period=${period}` : '';
     
     try {
-        const response = await fetch(`/api/leaderboard/${category}`);
+        const response = await apiFetch(`/api/leaderboard/${category}${query}`);
         if (response.ok) {
             const leaderboard = await response.json();
             updateLeaderboardDisplay(leaderboard);
@@ -714,7 +854,7 @@ function updateLeaderboardDisplay(leaderboard) {
 // Загрузка ежедневного задания
 async function loadDailyChallenge() {
     try {
-        const response = await fetch(`/api/daily_challenge/${userId}`);
+        const response = await apiFetch(`/api/daily_challenge/${userId}`);
         if (response.ok) {
             const challenge = await response.json();
             updateDailyChallengeDisplay(challenge);
@@ -775,8 +915,7 @@ function showMainMenu() {
     hintsUsed = 0;
     
     // Перезагружаем профиль и задания
-    loadUserProfile();
-    loadDailyChallenge();
+    loadBootstrap();
 }
 
 // Обработчики Telegram
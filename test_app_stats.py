@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты счетчиков общей статистики и их сверки с данными
+"""
+
+import app as quiz_app
+
+def save_games(client):
+    for user_id, category, score in [('user_1', 'history', 5), ('user_1', 'science', 2), ('user_2', 'history', 4)]:
+        response = client.post('/api/save_game', json={
+            'user_id': user_id, 'score': score, 'total': 5, 'category': category
+        })
+        assert response.get_json()['status'] == 'success'
+
+def test_counters_follow_saves(client):
+    """Счетчики обновляются при записи и совпадают с пересчетом по таблицам"""
+    save_games(client)
+
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_users'], stats['total_games'], stats['total_questions_answered']) == (2, 3, 15)
+
+    conn = quiz_app.connect_db()
+    assert quiz_app.reconcile_app_stats(conn.cursor()) == {}
+    conn.close()
+
+def test_reconcile_detects_and_fixes_drift(client, capsys):
+    """Расхождение находится, --reconcile-stats без --fix завершается с кодом 1, с --fix — пересчитывает"""
+    save_games(client)
+    conn = quiz_app.connect_db()
+    with conn:
+        conn.execute('UPDATE app_stats SET total_games = 99 WHERE id = 1')
+        conn.execute("DELETE FROM category_stats WHERE category = 'science'")
+        drift = quiz_app.reconcile_app_stats(conn.cursor())
+    conn.close()
+
+    assert drift == {'total_games': (99, 3), 'category:science': (None, (1, 40.0))}
+    assert quiz_app.reconcile_stats_command() == 1
+    assert 'total_games: сохранено 99, фактически 3' in capsys.readouterr().out
+
+    assert quiz_app.reconcile_stats_command(fix=True) == 0
+    assert quiz_app.reconcile_stats_command() == 0
+    assert 'Счетчики статистики совпадают с данными' in capsys.readouterr().out
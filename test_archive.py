@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты архивации старых месяцев game_results и помесячных агрегатов
+"""
+
+import os
+from datetime import date
+
+import pytest
+
+import app as quiz_app
+
+@pytest.fixture
+def conn(database):
+    """База с играми за три месяца: два старых и текущий"""
+    conn = quiz_app.connect_db()
+    games = [
+        {'user_id': 'user_1', 'score': 5, 'total': 5, 'category': 'history'},
+        {'user_id': 'user_1', 'score': 2, 'total': 5, 'category': 'science'},
+        {'user_id': 'user_2', 'score': 4, 'total': 5, 'category': 'history'},
+        {'user_id': 'user_1', 'score': 3, 'total': 5, 'category': 'history'},
+        {'user_id': 'user_2', 'score': 1, 'total': 5, 'category': 'arts'}
+    ]
+    with conn:
+        quiz_app.record_game_results(conn.cursor(), games)
+        # Переносим часть игр в прошлые месяцы, как будто они сыграны тогда
+        for game_id, created_at in [(1, '2024-01-10 12:00:00'), (2, '2024-01-31 23:59:59'), (3, '2024-02-01 00:00:00')]:
+            conn.execute('UPDATE game_results SET created_at = ? WHERE id = ?', (created_at, game_id))
+        conn.execute("UPDATE game_results SET created_at = '2024-03-05 08:00:00' WHERE id > 3")
+        quiz_app.rebuild_game_results_monthly(conn.cursor())
+    yield conn
+    conn.close()
+
+def test_month_helpers():
+    """Границы месяцев и первый сохраняемый месяц"""
+    assert quiz_app.month_bounds('2023-12') == ('2023-12-01 00:00:00', '2024-01-01 00:00:00')
+    assert quiz_app.archive_cutoff_month(1, date(2024, 3, 20)) == '2024-03'
+    assert quiz_app.archive_cutoff_month(3, date(2024, 2, 15)) == '2023-12'
+
+def test_archive_moves_old_months(conn, tmp_path):
+    """Старые месяцы уходят в сжатые файлы, агрегаты и счетчики не меняются"""
+    cursor = conn.cursor()
+    category_stats = [tuple(row) for row in quiz_app.fetch_user_category_stats(cursor, 'user_1')]
+    archive_dir = str(tmp_path / 'cold')
+
+    archived = quiz_app.archive_game_results(conn, keep_months=1, archive_dir=archive_dir, today=date(2024, 3, 20))
+
+    assert archived == [('2024-01', 2), ('2024-02', 1)]
+    assert sorted(os.listdir(archive_dir)) == ['game_results_2024-01.db.gz', 'game_results_2024-02.db.gz']
+    assert conn.execute('SELECT COUNT(*) FROM game_results').fetchone()[0] == 2
+    assert [tuple(row) for row in quiz_app.fetch_user_category_stats(cursor, 'user_1')] == category_stats
+    assert quiz_app.reconcile_app_stats(cursor) == {}
+
+    # Повторный запуск ничего не переносит
+    assert quiz_app.archive_game_results(conn, keep_months=1, archive_dir=archive_dir, today=date(2024, 3, 20)) == []
+
+    with quiz_app.open_game_history(conn) as history:
+        rows = history.execute('SELECT id, created_at FROM game_results_history ORDER BY id').fetchall()
+        assert [row['id'] for row in rows] == [1, 2, 3, 4, 5]
+        assert rows[1]['created_at'] == '2024-01-31 23:59:59'
+
+    with quiz_app.open_game_history(conn, months=['2024-02']) as history:
+        assert history.execute('SELECT COUNT(*) FROM game_results_history').fetchone()[0] == 3
+
+    # После выхода из контекста архивы отключены
+    assert {row['name'] for row in conn.execute('PRAGMA database_list')} <= {'main', 'temp'}
+
+def test_history_opens_more_months_than_attach_limit(database, tmp_path):
+    """Больше 9 архивных месяцев открываются одной временной базой"""
+    conn = quiz_app.connect_db()
+    games = [{'user_id': f'user_{i}', 'score': i % 6, 'total': 5, 'category': 'history'} for i in range(13)]
+    with conn:
+        quiz_app.record_game_results(conn.cursor(), games)
+        for game_id in range(1, 13):
+            conn.execute('UPDATE game_results SET created_at = ? WHERE id = ?', (f'2023-{game_id:02d}-15 12:00:00', game_id))
+        conn.execute("UPDATE game_results SET created_at = '2024-01-15 12:00:00' WHERE id = 13")
+
+    archived = quiz_app.archive_game_results(conn, keep_months=1, archive_dir=str(tmp_path / 'cold'), today=date(2024, 1, 20))
+    assert len(archived) == 12
+
+    with quiz_app.open_game_history(conn) as history:
+        rows = history.execute('SELECT id, created_at FROM game_results_history ORDER BY id').fetchall()
+        assert [row['id'] for row in rows] == list(range(1, 14))
+        assert rows[11]['created_at'] == '2023-12-15 12:00:00'
+        assert {row['name'] for row in conn.execute('PRAGMA database_list')} == {'main', 'temp', 'history'}
+
+    assert {row['name'] for row in conn.execute('PRAGMA database_list')} <= {'main', 'temp'}
+    conn.close()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты генератора синтетических данных
+"""
+
+import json
+import sqlite3
+
+import pytest
+
+import app as quiz_app
+import generate_data
+
+@pytest.fixture
+def generate(tmp_path, monkeypatch):
+    """Генерация небольшой базы; DATABASE_PATH восстанавливается после теста"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', quiz_app.DATABASE_PATH)
+
+    def generate(name, **options):
+        path = str(tmp_path / name)
+        counts = generate_data.generate_database(path, users=40, games=600, days=60, batch_size=250, **options)
+        return path, counts
+
+    yield generate
+    quiz_app.db_pool.close_all()
+
+def fetch(path, sql):
+    conn = sqlite3.connect(path)
+    rows = conn.execute(sql).fetchall()
+    conn.close()
+    return rows
+
+def test_generated_database_is_consistent(generate):
+    """Производные таблицы и счетчики совпадают с пересчетом по сгенерированным играм"""
+    path, counts = generate('big.db', seed=1)
+
+    assert counts['game_results'] == fetch(path, 'SELECT COUNT(*) FROM game_results')[0][0] == 600
+    assert counts['user_profiles'] == fetch(path, 'SELECT COUNT(*) FROM user_profiles')[0][0] == 40
+    assert fetch(path, 'SELECT SUM(total_games) FROM user_profiles')[0][0] == 600
+    assert counts['daily_challenges'] == fetch(path, 'SELECT COUNT(*) FROM daily_challenges')[0][0] > 0
+
+    # id растут вместе со временем игры
+    created = [row[0] for row in fetch(path, 'SELECT created_at FROM game_results ORDER BY id')]
+    assert created == sorted(created)
+
+    conn = quiz_app.connect_db(path)
+    with conn:
+        cursor = conn.cursor()
+        assert quiz_app.reconcile_app_stats(cursor) == {}
+        stored = [tuple(row) for row in cursor.execute('SELECT * FROM leaderboard_stats ORDER BY 1, 2')]
+        quiz_app.rebuild_leaderboard_stats(cursor)
+        assert [tuple(row) for row in cursor.execute('SELECT * FROM leaderboard_stats ORDER BY 1, 2')] == stored
+    conn.close()
+
+def test_same_seed_same_games(generate):
+    """Одинаковый seed дает тех же игроков и те же результаты"""
+    sql = 'SELECT user_id, score, total, category, difficulty, game_mode FROM game_results ORDER BY id'
+    first, _ = generate('first.db', seed=7)
+    second, _ = generate('second.db', seed=7)
+    other, _ = generate('other.db', seed=8)
+
+    assert fetch(first, sql) == fetch(second, sql)
+    assert fetch(first, sql) != fetch(other, sql)
+
+def test_database_with_games_not_overwritten(generate):
+    """Повторная генерация в базу с играми отклоняется"""
+    path, _ = generate('twice.db')
+    with pytest.raises(RuntimeError):
+        generate('twice.db')
+
+def test_generated_questions_load_into_bank(tmp_path):
+    """Сгенерированный банк вопросов загружается банком приложения"""
+    path = tmp_path / 'questions.json'
+    path.write_text(json.dumps(generate_data.generate_questions(100, seed=3), ensure_ascii=False), encoding='utf-8')
+
+    snapshot = quiz_app.QuestionBank(str(path)).reload()
+    assert snapshot.total == 100
+    assert set(snapshot.data) == set(generate_data.CATEGORY_WEIGHTS)
+    question = snapshot.data['history']['easy'][0]
+    assert len(question['options']) == 4 and 0 <= question['correct'] < 4
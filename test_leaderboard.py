@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты агрегатов таблиц лидеров
+"""
+
+import app as quiz_app
+
+def save(client, user_id, category, score, total=5):
+    return client.post('/api/save_game', json={
+        'user_id': user_id, 'first_name': user_id, 'score': score, 'total': total, 'category': category
+    })
+
+def test_save_rejects_overall_and_unknown_categories(client):
+    """'overall' и категории вне банка вопросов не попадают в агрегаты"""
+    for category in ('overall', 'unknown', None):
+        response = save(client, 'user_1', category, 5)
+        assert response.status_code == 400
+        assert response.get_json()['error'] == 'Invalid field: category'
+
+    for category in ('history', 'history', quiz_app.MARATHON_CATEGORY):
+        assert save(client, 'user_1', category, 5).status_code == 200
+
+    conn = quiz_app.connect_db()
+    rows = dict(conn.execute("SELECT category, games FROM leaderboard_stats WHERE user_id = 'user_1'").fetchall())
+    conn.close()
+    assert rows == {'history': 2, quiz_app.MARATHON_CATEGORY: 1, 'overall': 3}
+
+def test_unknown_leaderboard_category_not_found(client):
+    """Топ для произвольной строки не строится и не хранится"""
+    assert client.get('/api/leaderboard/no-such-category').status_code == 404
+    assert client.get('/api/leaderboard/overall').status_code == 200
+    assert quiz_app.leaderboard_cache.stats()['boards'] == 1
+
+def test_top_k_matches_database_after_saves(client, monkeypatch):
+    """Топ из кэша после записи насквозь совпадает с запросом к базе"""
+    cache = quiz_app.LeaderboardCache(2, 300)
+    monkeypatch.setattr(quiz_app, 'leaderboard_cache', cache)
+    scores = [3, 5, 1, 4, 2, 5, 0, 4, 3, 1, 5, 2, 0, 3, 4, 1, 2, 5]
+
+    for i, score in enumerate(scores):
+        assert save(client, f'user_{i % 6}', 'history', score).status_code == 200
+        top = client.get('/api/leaderboard/history').get_json()
+        conn = quiz_app.connect_db()
+        expected = [row['user_id'] for row in quiz_app.fetch_leaderboard_rows(conn.cursor(), 'history', 2)]
+        conn.close()
+        assert [entry['user_id'] for entry in top] == expected
+
+    assert cache.stats()['updates'] > 0
+
+def test_update_during_rebuild_is_applied(client, monkeypatch):
+    """Игра, записанная пока топ читается из базы, не теряется"""
+    for user_id, score in [('user_1', 3), ('user_1', 3), ('user_2', 2), ('user_2', 2)]:
+        save(client, user_id, 'history', score)
+    fetch_board_rows = quiz_app.fetch_board_rows
+
+    def racing_fetch(cursor, key, limit):
+        rows = fetch_board_rows(cursor, key, limit)
+        # Другой поток сохраняет игру после чтения, но до установки нового топа
+        conn = quiz_app.connect_db()
+        with conn:
+            (_, _, leaderboard_rows), = quiz_app.record_new_game_results(conn.cursor(), [
+                {'user_id': 'user_2', 'score': 5, 'total': 5, 'category': 'history'}
+            ])
+        conn.close()
+        for row in leaderboard_rows:
+            quiz_app.leaderboard_cache.update(row)
+        return rows
+
+    monkeypatch.setattr(quiz_app, 'fetch_board_rows', racing_fetch)
+    top = client.get('/api/leaderboard/history').get_json()
+    assert [(entry['user_id'], entry['games']) for entry in top] == [('user_2', 3), ('user_1', 2)]
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты рейтингов за день, неделю и месяц
+"""
+
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import app as quiz_app
+
+def save_games(client, games):
+    for user_id, category, score in games:
+        response = client.post('/api/save_game', json={
+            'user_id': user_id, 'first_name': user_id, 'score': score, 'total': 5, 'category': category
+        })
+        assert response.get_json()['status'] == 'success'
+
+def test_leaderboard_buckets():
+    """Корзины дня, ISO-недели и месяца"""
+    assert quiz_app.leaderboard_buckets(datetime(2024, 12, 30, 23, 59)) == {
+        'day': '2024-12-30', 'week': '2025-W01', 'month': '2024-12'
+    }
+
+def test_period_leaderboards(client):
+    """Периодические рейтинги совпадают с пересчетом и отсекают старые игры"""
+    save_games(client, [('user_1', 'history', 5), ('user_2', 'history', 3), ('user_2', 'science', 4)])
+    # Прогреваем кэш, затем обновляем его записью насквозь
+    assert client.get('/api/leaderboard/history?period=week').status_code == 200
+    save_games(client, [('user_2', 'history', 5)])
+
+    week = client.get('/api/leaderboard/history?period=week').get_json()
+    # user_1 сыграл одну игру и не проходит порог LEADERBOARD_MIN_GAMES
+    assert [(entry['user_id'], entry['games'], entry['avg_score']) for entry in week] == [('user_2', 2, 80.0)]
+    assert client.get('/api/leaderboard/history?period=year').status_code == 400
+
+    conn = quiz_app.connect_db()
+    with conn:
+        cursor = conn.cursor()
+        incremental = cursor.execute('SELECT * FROM leaderboard_periods ORDER BY 1, 2, 3, 4').fetchall()
+        quiz_app.rebuild_leaderboard_periods(cursor)
+        rebuilt = cursor.execute('SELECT * FROM leaderboard_periods ORDER BY 1, 2, 3, 4').fetchall()
+        assert [tuple(row) for row in rebuilt] == [tuple(row) for row in incremental]
+
+        # Через 50 дней дневные и недельные корзины устарели, месячные еще хранятся
+        later = datetime.now() + timedelta(days=50)
+        assert quiz_app.expire_leaderboard_periods(cursor, later) > 0
+        periods = {row[0] for row in cursor.execute('SELECT DISTINCT period FROM leaderboard_periods')}
+        assert periods == {'month'}
+    conn.close()
+
+def test_expiry_marked_only_after_commit(client, monkeypatch):
+    """Откат транзакции не отменяет удаление устаревших корзин на сегодня"""
+    monkeypatch.setattr(quiz_app, '_leaderboard_periods_expired_on', None)
+    game = {'user_id': 'user_1', 'score': 5, 'total': 5, 'category': 'history'}
+
+    conn = quiz_app.connect_db()
+    with pytest.raises(RuntimeError):
+        with conn:
+            quiz_app.record_game_results(conn.cursor(), [game])
+            raise RuntimeError('rollback')
+    conn.close()
+    assert quiz_app._leaderboard_periods_expired_on is None
+
+    save_games(client, [('user_1', 'history', 5)])
+    assert quiz_app._leaderboard_periods_expired_on == datetime.now(timezone.utc).strftime('%Y-%m-%d')
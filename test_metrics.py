@@ -0,0 +1,21 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты эндпоинта /metrics
+"""
+
+import app as quiz_app
+
+def test_metrics_report_routes_and_sql(client):
+    """/metrics отдает время маршрутов, число SQL-запросов и показатели кэшей"""
+    client.post('/api/save_game', json={'user_id': 'u1', 'score': 3, 'total': 5, 'category': 'arts'})
+    response = client.get('/metrics')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    lines = response.get_data(as_text=True).splitlines()
+    assert any(line.startswith('quiz_http_request_duration_seconds_count{route="/api/save_game",method="POST"}') for line in lines)
+    sql_count = next(line for line in lines if line.startswith('quiz_http_request_sql_queries_sum{route="/api/save_game"}'))
+    assert float(sql_count.split()[-1]) > 0
+    assert any(line.startswith('quiz_cache_hit_ratio{cache="response"}') for line in lines)
+    assert any(line.startswith('quiz_question_bank_reloads_total') for line in lines)
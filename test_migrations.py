@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты версионных миграций схемы SQLite
+"""
+
+import sqlite3
+
+import pytest
+
+import app as quiz_app
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    """Путь к еще не созданной базе"""
+    path = str(tmp_path / 'migrations.db')
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', path)
+    yield path
+    quiz_app.db_pool.close_all()
+
+def tables(path):
+    conn = sqlite3.connect(path)
+    names = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.close()
+    return names
+
+def applied_versions(path):
+    conn = sqlite3.connect(path)
+    versions = [row[0] for row in conn.execute('SELECT version FROM schema_version ORDER BY version')]
+    conn.close()
+    return versions
+
+def test_dry_run_changes_nothing(db_path, capsys):
+    """--migrate --dry-run показывает все шаги с их SQL и откатывает их"""
+    assert quiz_app.migrate_command(dry_run=True) == 0
+
+    output = capsys.readouterr().out
+    for step in quiz_app.MIGRATIONS:
+        assert f'{step.version:03d} {step.name}' in output
+    assert 'CREATE TABLE IF NOT EXISTS game_results' in output
+    assert tables(db_path) == set()
+
+def test_migrations_applied_once(db_path):
+    """Шаги записываются в schema_version, повторный запуск ничего не делает"""
+    applied = quiz_app.init_database()
+
+    assert [version for version, _, _ in applied] == [step.version for step in quiz_app.MIGRATIONS]
+    assert applied_versions(db_path) == [step.version for step in quiz_app.MIGRATIONS]
+    assert {'game_results', 'user_progress', 'leaderboard_stats', 'leaderboard_periods'} <= tables(db_path)
+
+    assert quiz_app.init_database() == []
+    assert quiz_app.init_database(dry_run=True) == []
+    assert applied_versions(db_path) == [step.version for step in quiz_app.MIGRATIONS]
+
+def test_legacy_database_upgraded(db_path):
+    """База первой версии бота приводится к текущей схеме без потери игр"""
+    conn = sqlite3.connect(db_path)
+    conn.executescript('''
+        CREATE TABLE game_results (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT, username TEXT, first_name TEXT,
+            last_name TEXT, score INTEGER, total INTEGER, category TEXT, difficulty TEXT,
+            percentage REAL, time_spent INTEGER, hints_used INTEGER, game_mode TEXT, date TIMESTAMP
+        );
+        CREATE TABLE user_profiles (
+            user_id TEXT PRIMARY KEY, first_name TEXT, total_games INTEGER, total_score INTEGER,
+            join_date TIMESTAMP, last_activity TIMESTAMP
+        );
+        INSERT INTO game_results (user_id, first_name, score, total, category, date)
+        VALUES ('user_1', 'Тест', 4, 5, 'history', '2023-05-01 10:00:00');
+        INSERT INTO user_profiles VALUES ('user_1', NULL, 1, 4, '2023-05-01 09:00:00', '2023-05-01 10:00:00');
+    ''')
+    conn.close()
+
+    quiz_app.init_database()
+
+    conn = quiz_app.connect_db()
+    game = conn.execute('SELECT * FROM game_results').fetchone()
+    profile = conn.execute('SELECT * FROM user_profiles').fetchone()
+    monthly = conn.execute('SELECT month, games FROM game_results_monthly').fetchall()
+    conn.close()
+    assert (game['created_at'], game['difficulty'], game['game_mode']) == ('2023-05-01 10:00:00', 'easy', 'normal')
+    assert (profile['first_name'], profile['created_at']) == ('Игрок', '2023-05-01 09:00:00')
+    assert [tuple(row) for row in monthly] == [('2023-05', 1)]
+    assert applied_versions(db_path) == [step.version for step in quiz_app.MIGRATIONS]
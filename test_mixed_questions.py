@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты выдачи вопросов: смешанная выборка для марафона и сжатие ответов
+"""
+
+import gzip
+import random
+from collections import Counter
+
+import pytest
+
+import app as quiz_app
+
+QUESTIONS = {
+    category: {
+        difficulty: tuple({'question': f'{category}-{difficulty}-{i}'} for i in range(50))
+        for difficulty in ('easy', 'hard')
+    } for category in ('history', 'science')
+}
+
+def test_weighted_sample_has_no_repeats_and_follows_weights():
+    """Вопросы не повторяются, нулевой вес исключает пул, веса меняют доли"""
+    sample = quiz_app.sample_mixed_questions(
+        QUESTIONS, 150, category_weights={'history': 3}, difficulty_weights={'hard': 0},
+        rng=random.Random(1)
+    )
+    assert len(sample) == 100
+    assert len({question['question'] for question in sample}) == 100
+    assert {question['difficulty'] for question in sample} == {'easy'}
+
+    counts = Counter(
+        question['category'] for question in quiz_app.sample_mixed_questions(
+            QUESTIONS, 40, category_weights={'history': 3}, rng=random.Random(2)
+        )
+    )
+    assert counts['history'] > counts['science']
+
+@pytest.mark.parametrize('query', [
+    'category_weights=history:inf',
+    'category_weights=history:nan',
+    'category_weights=history:-1',
+    'difficulty_weights=easy:1e9',
+    'difficulty_weights=easy',
+    'category_weights=:2'
+])
+def test_invalid_weights_rejected(query, monkeypatch):
+    """Бесконечные, отрицательные и неполные веса — ошибка 400"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    response = quiz_app.app.test_client().get(f'/api/questions/mixed?{query}')
+    assert response.status_code == 400
+    assert response.get_json()['error'] == 'Invalid count or weights'
+
+def test_weights_endpoint(monkeypatch):
+    """Веса категорий и сложностей задаются отдельными параметрами"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    response = quiz_app.app.test_client().get(
+        '/api/questions/mixed?count=5&seed=7&category_weights=arts:0,history:0&difficulty_weights=easy:0'
+    )
+    assert response.status_code == 200
+    questions = response.get_json()
+    assert len(questions) == 5
+    assert not {question['category'] for question in questions} & {'arts', 'history'}
+    assert {question['difficulty'] for question in questions} <= {'medium', 'hard'}
+
+def test_random_questions_compressed_only_as_negotiated(monkeypatch):
+    """Случайная выборка сжимается только в формат из Accept-Encoding"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    monkeypatch.setattr(quiz_app, 'brotli', None)
+    compress = gzip.compress
+    calls = []
+
+    def counting_compress(body, **kwargs):
+        calls.append(len(body))
+        return compress(body, **kwargs)
+
+    monkeypatch.setattr(quiz_app.gzip, 'compress', counting_compress)
+    client = quiz_app.app.test_client()
+
+    plain = client.get('/api/questions/history/easy', headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in plain.headers
+    assert calls == []
+
+    packed = client.get('/api/questions/history/easy', headers={'Accept-Encoding': 'gzip'})
+    assert packed.headers['Content-Encoding'] == 'gzip'
+    assert len(calls) == 1
+
+def test_not_modified_keeps_vary(monkeypatch):
+    """Ответ 304 несет тот же Vary: Accept-Encoding, что и 200"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    client = quiz_app.app.test_client()
+    first = client.get('/api/questions/history/easy?seed=1')
+    second = client.get('/api/questions/history/easy?seed=1', headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 304
+    assert second.headers['Vary'] == first.headers['Vary'] == 'Accept-Encoding'
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты кэша профилей и стартового эндпоинта /api/bootstrap
+"""
+
+import app as quiz_app
+
+def test_profile_cache_is_bounded_lru():
+    """Кэш хранит не больше size профилей и вытесняет давно прочитанные"""
+    cache = quiz_app.ProfileCache(2)
+    cache.put('a', 1, {'user_id': 'a'})
+    cache.put('b', 1, {'user_id': 'b'})
+    assert cache.get('a', 1) == {'user_id': 'a'}
+    cache.put('c', 1, {'user_id': 'c'})
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == {'user_id': 'a'}
+    assert cache.get('c', 2) is None
+    assert cache.stats() == {'entries': 2, 'size': 2, 'hits': 2, 'misses': 2}
+
+def test_profile_cache_invalidated_by_save(client):
+    """Повторное чтение берется из кэша, сохраненная игра сразу видна в профиле"""
+    assert client.get('/api/profile/user_1').get_json()['profile']['total_games'] == 0
+    client.get('/api/profile/user_1')
+    assert quiz_app.profile_cache.stats()['hits'] == 1
+
+    response = client.post('/api/save_game', json={'user_id': 'user_1', 'score': 4, 'total': 5, 'category': 'history'})
+    assert response.get_json()['status'] == 'success'
+    assert quiz_app.profile_cache.stats()['entries'] == 0
+
+    profile = client.get('/api/profile/user_1').get_json()
+    assert (profile['profile']['total_games'], profile['profile']['total_score']) == (1, 4)
+    assert len(profile['recent_games']) == 1
+
+def test_profile_cache_drops_entry_changed_by_other_worker(client):
+    """Запись другого воркера меняет версию профиля, и устаревший снимок не отдается"""
+    client.get('/api/profile/user_1')
+    conn = quiz_app.connect_db()
+    with conn:
+        quiz_app.record_game_results(conn.cursor(), [{'user_id': 'user_1', 'score': 5, 'total': 5, 'category': 'science'}])
+    conn.close()
+
+    assert client.get('/api/profile/user_1').get_json()['profile']['total_games'] == 1
+
+def test_bootstrap_combines_start_screen(client):
+    """/api/bootstrap отдает профиль, задание дня и категории одним ответом"""
+    payload = client.get('/api/bootstrap/user_1').get_json()
+
+    assert set(payload) == {'profile', 'daily_challenge', 'categories'}
+    assert payload['profile'] == client.get('/api/profile/user_1').get_json()
+    assert payload['daily_challenge'] == client.get('/api/daily_challenge/user_1').get_json()
+    assert {category['category'] for category in payload['categories']} == set(quiz_app.load_questions())
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты счетчиков прогресса: серия ответов, серия дней и освоенные категории
+"""
+
+from datetime import date, timedelta
+
+import app as quiz_app
+
+def save(client, score=5, total=5, category='history', **fields):
+    response = client.post('/api/save_game', json={
+        'user_id': 'user_1', 'first_name': 'Тест', 'score': score, 'total': total, 'category': category, **fields
+    })
+    assert response.get_json()['status'] == 'success'
+    return {ach['id'] for ach in response.get_json()['new_achievements']}
+
+def progress():
+    conn = quiz_app.connect_db()
+    row = conn.execute('''
+        SELECT p.current_streak, p.best_streak, u.daily_streak, u.best_daily_streak,
+               u.last_played_date, u.mastered_categories
+        FROM user_profiles p JOIN user_progress u ON u.user_id = p.user_id
+        WHERE p.user_id = 'user_1'
+    ''').fetchone()
+    conn.close()
+    return dict(row)
+
+def test_answer_streak_carries_over_perfect_games(client):
+    """Идеальные игры продолжают серию, ошибка начинает ее с серии текущей игры"""
+    assert 'streak_master' not in save(client, current_streak=5, best_streak=5)
+    assert 'streak_master' in save(client, current_streak=5, best_streak=5)
+    assert (progress()['current_streak'], progress()['best_streak']) == (10, 10)
+
+    save(client, score=3, current_streak=2, best_streak=3)
+    assert (progress()['current_streak'], progress()['best_streak']) == (2, 10)
+
+def test_daily_streak_counts_utc_days(client, monkeypatch):
+    """Серия дней растет по соседним датам UTC и сбрасывается после пропуска"""
+    start = date(2024, 3, 1)
+    for offset, streak in [(0, 1), (0, 1), (1, 2), (2, 3), (4, 1)]:
+        monkeypatch.setattr(quiz_app, 'utc_today', lambda day=start + timedelta(days=offset): day)
+        save(client, score=1)
+        assert progress()['daily_streak'] == streak
+        assert progress()['last_played_date'] == (start + timedelta(days=offset)).isoformat()
+
+    assert progress()['best_daily_streak'] == 3
+
+def test_mastered_categories_counted_once(client):
+    """Категория засчитывается при 80%+ один раз, слабые игры ее не добавляют"""
+    save(client, category='history')
+    save(client, category='history')
+    save(client, score=1, category='arts')
+    assert progress()['mastered_categories'] == 1
+
+    assert 'scholar' not in save(client, score=4, category='science')
+    assert 'scholar' in save(client, category='arts')
+    assert progress()['mastered_categories'] == 3
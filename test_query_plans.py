@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Регрессионные тесты планов запросов: ни один запрос, выполняемый
+обработчиками API, не должен читать таблицу полным сканированием
+"""
+
+import re
+import sqlite3
+
+import pytest
+
+import app as quiz_app
+
+# Служебные команды, для которых план запроса не строится
+SKIPPED_STATEMENTS = ('PRAGMA', 'BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+@pytest.fixture
+def traced_client(client, monkeypatch):
+    """Тестовый клиент на временной базе, записывающий все SQL-запросы"""
+    statements = []
+    connect_db = quiz_app.connect_db
+
+    def traced_connect_db(path=None):
+        conn = connect_db(path)
+        conn.set_trace_callback(statements.append)
+        return conn
+
+    monkeypatch.setattr(quiz_app, 'connect_db', traced_connect_db)
+    return client, statements
+
+def exercise_api(client):
+    """Прогон всех маршрутов API, которые обращаются к базе"""
+    for i, (category, score) in enumerate([('history', 5), ('science', 4), ('history', 2), ('arts', 5)]):
+        response = client.post('/api/save_game', json={
+            'user_id': f'user_{i % 2}',
+            'first_name': 'Тест',
+            'score': score,
+            'total': 5,
+            'category': category,
+            'difficulty': 'easy',
+            'time_spent': 60,
+            'game_mode': 'marathon' if i == 3 else 'normal',
+            'best_streak': score,
+            'current_streak': score
+        })
+        assert response.status_code == 200
+
+    batch = [
+        {'user_id': 'user_2', 'score': 3, 'total': 5, 'category': 'science', 'idempotency_key': 'game-1'},
+        {'user_id': 'user_2', 'score': 4, 'total': 5, 'category': 'science', 'idempotency_key': 'game-1'}
+    ]
+    response = client.post('/api/save_games', json={'games': batch})
+    assert [result['status'] for result in response.get_json()['results']] == ['success', 'duplicate']
+
+    for path in [
+        '/api/profile/user_0',
+        '/api/profile/new_user',
+        '/api/daily_challenge/user_0',
+        '/api/bootstrap/user_1',
+        '/api/leaderboard/history',
+        '/api/leaderboard/overall',
+        '/api/leaderboard/history?period=day',
+        '/api/leaderboard/overall?period=month',
+        '/api/stats',
+        '/health'
+    ]:
+        assert client.get(path).status_code == 200
+
+def full_scans(conn, statement):
+    """Таблицы, которые запрос читает полным сканированием"""
+    plan = conn.execute(f'EXPLAIN QUERY PLAN {statement}').fetchall()
+    return [m.group(1) for m in (FULL_SCAN.match(row[3]) for row in plan) if m]
+
+def test_api_queries_use_indexes(traced_client):
+    """Все запросы API используют индексы"""
+    client, statements = traced_client
+    exercise_api(client)
+
+    queries = {
+        ' '.join(statement.split())
+        for statement in statements
+        if not statement.lstrip().upper().startswith(SKIPPED_STATEMENTS)
+    }
+    assert queries
+
+    conn = sqlite3.connect(quiz_app.DATABASE_PATH)
+    try:
+        offenders = {query: full_scans(conn, query) for query in queries}
+    finally:
+        conn.close()
+
+    offenders = {query: tables for query, tables in offenders.items() if tables}
+    assert not offenders, f"Полное сканирование таблиц: {offenders}"
+
+def test_full_scan_detection():
+    """Детектор замечает запрос без подходящего индекса"""
+    conn = sqlite3.connect(':memory:')
+    conn.execute('CREATE TABLE t (a INTEGER, b INTEGER)')
+    conn.execute('CREATE INDEX idx_t_a ON t(a)')
+
+    assert full_scans(conn, 'SELECT * FROM t WHERE b = 1') == ['t']
+    assert full_scans(conn, 'SELECT * FROM t WHERE a = 1') == []
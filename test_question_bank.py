@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты банка вопросов в памяти и его горячей перезагрузки
+"""
+
+import json
+import os
+
+import pytest
+
+import app as quiz_app
+
+def question(text):
+    return {'question': text, 'options': ['a', 'b', 'c', 'd'], 'correct': 0, 'explanation': ''}
+
+def write_bank(path, texts, mtime_ns=None):
+    path.write_text(json.dumps({'history': {'easy': [question(text) for text in texts]}}), encoding='utf-8')
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+@pytest.fixture
+def bank_file(tmp_path):
+    path = tmp_path / 'questions.json'
+    write_bank(path, ['q1', 'q2'], mtime_ns=1_000_000_000_000_000_000)
+    return path
+
+def test_unchanged_file_not_reparsed(bank_file):
+    """Пока mtime и размер файла прежние, снимок тот же"""
+    bank = quiz_app.QuestionBank(str(bank_file), check_interval=0)
+    first = bank.snapshot()
+
+    assert first.total == 2
+    assert bank.snapshot() is first
+    assert bank.stats()['reloads'] == 1
+
+def test_reload_on_mtime_or_size_change(bank_file):
+    """Новый снимок подменяет старый при смене mtime или размера файла"""
+    bank = quiz_app.QuestionBank(str(bank_file), check_interval=0)
+    first = bank.snapshot()
+
+    # Тот же размер, другое время изменения
+    write_bank(bank_file, ['q3', 'q4'], mtime_ns=2_000_000_000_000_000_000)
+    second = bank.snapshot()
+    assert [item['question'] for item in second.data['history']['easy']] == ['q3', 'q4']
+    assert second.encoded['history']['easy'][0] == quiz_app.encode_json(question('q3'))
+
+    # То же время изменения, другой размер
+    write_bank(bank_file, ['q3', 'q4', 'q5'], mtime_ns=2_000_000_000_000_000_000)
+    third = bank.snapshot()
+    assert third.total == 3
+
+    assert (first.version, second.version, third.version) == (1, 2, 3)
+    assert bank.stats()['reloads'] == 3
+
+def test_check_interval_limits_stat_calls(bank_file):
+    """Файл проверяется не чаще раза в check_interval секунд"""
+    bank = quiz_app.QuestionBank(str(bank_file), check_interval=3600)
+    first = bank.snapshot()
+    write_bank(bank_file, ['q3'], mtime_ns=2_000_000_000_000_000_000)
+
+    assert bank.snapshot() is first
+    assert bank.reload().total == 1
+
+def test_broken_file_keeps_previous_snapshot(bank_file):
+    """Файл с ошибкой JSON не заменяет рабочий снимок, ошибка считается"""
+    bank = quiz_app.QuestionBank(str(bank_file), check_interval=0)
+    first = bank.snapshot()
+
+    bank_file.write_text('{"history": {"easy": [', encoding='utf-8')
+    assert bank.snapshot() is first
+    assert bank.stats()['reload_errors'] == 1
+    assert bank.stats()['reloads'] == 1
+
+    write_bank(bank_file, ['q9'], mtime_ns=3_000_000_000_000_000_000)
+    assert bank.snapshot().total == 1
+    assert bank.stats()['version'] == 2
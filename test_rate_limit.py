@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты ограничения частоты запросов (корзина токенов)
+"""
+
+import app as quiz_app
+
+def test_bucket_refills_over_time(tmp_path):
+    """Корзина пропускает всплеск, затем — по скорости пополнения"""
+    for store in (quiz_app.MemoryBucketStore(), quiz_app.SQLiteBucketStore(str(tmp_path / 'limits.db'))):
+        assert [store.consume('k', 1.0, 3, 100.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+        assert store.consume('k', 1.0, 3, 100.0) == 1.0
+        assert store.consume('k', 1.0, 3, 100.5) == 0.5
+        assert store.consume('k', 1.0, 3, 101.0) == 0.0
+        assert store.consume('other', 1.0, 3, 101.0) == 0.0
+
+def test_route_returns_429_with_retry_after(tmp_path, monkeypatch):
+    """Превышение лимита маршрута — 429 с Retry-After и счетчиком"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'limits.db'))
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', True)
+    limiter = quiz_app.RateLimiter(quiz_app.MemoryBucketStore(), {'questions': (6, 2)})
+    monkeypatch.setattr(quiz_app, 'rate_limiter', limiter)
+    client = quiz_app.app.test_client()
+
+    statuses = [client.get('/api/questions/history/easy').status_code for _ in range(3)]
+    response = client.get('/api/questions/history/easy')
+
+    assert statuses == [200, 200, 429]
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '10'
+    assert limiter.stats()['throttled'] == {'questions': 2}
+
+def test_stores_drop_stale_buckets(tmp_path):
+    """Память хранит не больше max_keys корзин, SQLite удаляет восстановившиеся"""
+    memory = quiz_app.MemoryBucketStore(max_keys=3)
+    for i in range(10):
+        memory.consume(f'ip:{i}', 1.0, 3, 100.0)
+    assert list(memory._buckets) == ['ip:7', 'ip:8', 'ip:9']
+
+    store = quiz_app.SQLiteBucketStore(str(tmp_path / 'limits.db'), prune_interval=10.0)
+    store.consume('old', 1.0, 3, 100.0)
+    store.consume('new', 1.0, 3, 105.0)
+    store.consume('new', 1.0, 3, 111.0)
+    keys = [row[0] for row in store._connection().execute('SELECT key FROM rate_limit_buckets')]
+    assert keys == ['new']
+
+def test_rate_limit_overrides_validated(monkeypatch):
+    """Неверные значения RATE_LIMIT_<ИМЯ> не меняют лимит и не ломают запуск"""
+    assert quiz_app.parse_rate_limit('30/5') == (30.0, 5)
+    assert quiz_app.parse_rate_limit('30') == (30.0, 30)
+    monkeypatch.setenv('RATE_LIMIT_SAVE', '30/0')
+    monkeypatch.setenv('RATE_LIMIT_USER', 'fast')
+    monkeypatch.setenv('RATE_LIMIT_QUESTIONS', '90/15')
+    limits = quiz_app.load_rate_limits({'save': (20, 10), 'user': (120, 30), 'questions': (60, 20)})
+    assert limits == {'save': (20, 10), 'user': (120, 30), 'questions': (90.0, 15)}
+
+def test_forwarded_client_key_uses_proxy_address(monkeypatch):
+    """За прокси ключ — адрес, который дописал прокси, а не присланный клиентом"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_TRUST_FORWARDED', True)
+    headers = {'X-Forwarded-For': '1.2.3.4, 203.0.113.7'}
+    with quiz_app.app.test_request_context('/', headers=headers):
+        assert quiz_app.rate_limit_client_key() == 'ip:203.0.113.7'
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты сохранения результатов игр
+"""
+
+import app as quiz_app
+
+def game(key, **fields):
+    return {'user_id': 'user_1', 'score': 3, 'total': 5, 'category': 'history', 'idempotency_key': key, **fields}
+
+def test_batch_reports_invalid_games_per_item(client):
+    """Игры с неверными полями получают ошибку, остальные игры пакета сохраняются"""
+    invalid = [
+        (game('k1', user_id=['user_1']), 'Invalid field: user_id'),
+        (game('k2', category={'name': 'history'}), 'Invalid field: category'),
+        (game('k3', difficulty=['easy']), 'Invalid field: difficulty'),
+        (game('k4', game_mode={'mode': 'normal'}), 'Invalid field: game_mode'),
+        (game('k5', first_name=['Тест']), 'Invalid field: first_name'),
+        (game('k6', score=float('nan')), 'Invalid field: score'),
+        (game('k7', time_spent=float('inf')), 'Invalid field: time_spent'),
+        (game('k8', total=2 ** 64), 'Invalid field: total'),
+        (game('k9', score=25, total=5), 'Invalid field: score')
+    ]
+    batch = [item for item, _ in invalid] + [game('ok-1'), game('ok-2', user_id=42, score=5)]
+
+    response = client.post('/api/save_games', json={'games': batch})
+
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [result.get('error') for result in results[:len(invalid)]] == [error for _, error in invalid]
+    assert [result['status'] for result in results[len(invalid):]] == ['success', 'success']
+    assert client.get('/api/profile/42').get_json()['profile']['total_score'] == 5
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты отложенной записи игр через очередь (SAVE_QUEUE_ENABLED)
+"""
+
+import sqlite3
+
+import pytest
+
+import app as quiz_app
+
+@pytest.fixture
+def save_queue(database, monkeypatch):
+    """Включенная очередь записи на чистой базе"""
+    monkeypatch.setattr(quiz_app, 'SAVE_QUEUE_ENABLED', True)
+    save_queue = quiz_app.SaveQueue(size=10, batch_size=5, result_ttl=300, retry_delay=0.01)
+    monkeypatch.setattr(quiz_app, 'save_queue', save_queue)
+    yield save_queue
+    save_queue.flush(5.0)
+
+def game(user_id='user_1', score=3):
+    return {'user_id': user_id, 'first_name': 'Тест', 'score': score, 'total': 5, 'category': 'history'}
+
+def games_count():
+    conn = quiz_app.connect_db()
+    count = conn.execute('SELECT COUNT(*) FROM game_results').fetchone()[0]
+    conn.close()
+    return count
+
+def test_queued_ack_and_poll(save_queue):
+    """save_game сразу отвечает 202 с номером заявки, результат забирается опросом"""
+    client = quiz_app.app.test_client()
+    response = client.post('/api/save_game', json=game(score=5))
+
+    assert response.status_code == 202
+    payload = response.get_json()
+    assert payload['status'] == 'queued'
+    assert payload['poll_url'] == f"/api/save_game/{payload['ticket']}"
+
+    save_queue.flush(5.0)
+    result = client.get(payload['poll_url']).get_json()
+    assert result['status'] == 'success'
+    assert {ach['id'] for ach in result['new_achievements']} >= {'first_game'}
+    assert games_count() == 1
+    assert client.get('/api/save_game/unknown').status_code == 404
+
+def test_batch_written_with_one_executemany(save_queue, monkeypatch):
+    """Игры из очереди пишутся одной транзакцией и одним executemany"""
+    monkeypatch.setattr(save_queue, '_ensure_writer', lambda: None)
+    calls = []
+    insert_game_results = quiz_app.insert_game_results
+
+    def counting_insert(cursor, games, *args):
+        calls.append(len(games))
+        return insert_game_results(cursor, games, *args)
+
+    monkeypatch.setattr(quiz_app, 'insert_game_results', counting_insert)
+    tickets = [save_queue.submit(game(f'user_{i}')) for i in range(3)]
+
+    conn = quiz_app.storage.acquire()
+    try:
+        save_queue._write(conn, save_queue._take_batch())
+    finally:
+        quiz_app.storage.release(conn)
+
+    assert calls == [3]
+    assert save_queue.stats()['batches'] == 1
+    assert [save_queue.result(ticket)['status'] for ticket in tickets] == ['success'] * 3
+
+def test_full_queue_returns_503(save_queue, monkeypatch):
+    """Переполненная очередь отвечает 503 с Retry-After"""
+    full_queue = quiz_app.SaveQueue(size=1, batch_size=1, result_ttl=300)
+    monkeypatch.setattr(full_queue, '_ensure_writer', lambda: None)
+    monkeypatch.setattr(quiz_app, 'save_queue', full_queue)
+    client = quiz_app.app.test_client()
+
+    assert client.post('/api/save_game', json=game()).status_code == 202
+    response = client.post('/api/save_game', json=game())
+
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert full_queue.stats()['rejected'] == 1
+
+def test_transient_error_retried_until_written(save_queue, monkeypatch):
+    """Принятая игра записывается, даже если первая попытка наткнулась на блокировку"""
+    record_new_game_results = quiz_app.record_new_game_results
+    attempts = []
+
+    def locked_once(cursor, games):
+        attempts.append(len(games))
+        if len(attempts) == 1:
+            raise sqlite3.OperationalError('database is locked')
+        return record_new_game_results(cursor, games)
+
+    monkeypatch.setattr(quiz_app, 'record_new_game_results', locked_once)
+    ticket = save_queue.submit(game())
+    save_queue.flush(5.0)
+
+    assert save_queue.result(ticket)['status'] == 'success'
+    assert len(attempts) == 2
+    assert save_queue.stats()['retries'] == 1
+    assert games_count() == 1
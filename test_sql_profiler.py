@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты профилировщика SQL и журнала медленных запросов
+"""
+
+import logging
+
+import app as quiz_app
+
+def test_profiler_groups_statements_and_logs_slow_plans(tmp_path, monkeypatch, caplog):
+    """Статистика по нормализованному SQL и план для медленных запросов"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'profiler.db'))
+    monkeypatch.setattr(quiz_app, 'ADMIN_TOKEN', 'secret')
+    monkeypatch.setattr(quiz_app, 'sql_profiler', quiz_app.SqlProfiler(enabled=False, slow_query_ms=1000))
+    quiz_app.db_pool.close_all()
+    quiz_app.init_database()
+    quiz_app.init_achievements()
+    quiz_app.profile_cache.clear()
+    client = quiz_app.app.test_client()
+    admin = {'Authorization': 'Bearer secret'}
+
+    try:
+        assert client.post('/admin/sql_profiler', json={'enabled': True}).status_code == 403
+        response = client.post('/admin/sql_profiler', json={'enabled': True, 'slow_query_ms': 0}, headers=admin)
+        assert response.get_json()['profiler']['enabled'] is True
+
+        with caplog.at_level(logging.WARNING, logger='app'):
+            for user_id in ('u1', 'u2'):
+                client.get(f'/api/profile/{user_id}')
+
+        statements = client.get('/admin/sql_profiler', headers=admin).get_json()['statements']
+    finally:
+        quiz_app.db_pool.close_all()
+
+    profile_lookup = next(s for s in statements if s['sql'] == 'SELECT * FROM user_profiles WHERE user_id = ?')
+    assert profile_lookup['count'] >= 2
+    assert profile_lookup['p95_ms'] <= profile_lookup['max_ms']
+    assert any('Медленный запрос' in record.message for record in caplog.records)
+    assert any('План запроса' in record.message for record in caplog.records)
+
+def test_slow_plan_logged_once_when_profiler_disabled(tmp_path, monkeypatch, caplog):
+    """При выключенной статистике план каждой формы запроса пишется один раз"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'slow.db'))
+    quiz_app.init_database()
+    profiler = quiz_app.SqlProfiler(enabled=False, slow_query_ms=0)
+    conn = quiz_app.connect_db()
+    conn.profiler = profiler
+
+    with caplog.at_level(logging.WARNING, logger='app'):
+        for user_id in ('u1', 'u2', 'u3', 'u4', 'u5'):
+            quiz_app.fetch_profile(conn.cursor(), user_id)
+    conn.close()
+
+    messages = [record.message for record in caplog.records]
+    assert sum('Медленный запрос' in message for message in messages) == 5
+    assert sum('План запроса' in message for message in messages) == 1
+    assert profiler.stats()['statements'] == 0
+
+def test_executemany_does_not_use_up_plan(tmp_path, monkeypatch, caplog):
+    """Медленный executemany не мешает записать план той же формы из execute"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'slow_many.db'))
+    quiz_app.init_database()
+    conn = quiz_app.connect_db()
+    conn.profiler = quiz_app.SqlProfiler(enabled=False, slow_query_ms=0)
+    sql = 'INSERT INTO game_save_keys (user_id, idempotency_key) VALUES (?, ?)'
+
+    with caplog.at_level(logging.WARNING, logger='app'):
+        conn.cursor().executemany(sql, [('u1', 'k1'), ('u1', 'k2')])
+        conn.cursor().execute(sql, ('u1', 'k3'))
+    conn.close()
+
+    assert sum('План запроса' in record.message for record in caplog.records) == 1
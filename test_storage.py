@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты слоя доступа к данным на SQLite и PostgreSQL.
+
+PostgreSQL проверяется, если задана TEST_POSTGRES_DSN (отдельная база,
+таблицы которой тест очищает) и установлены psycopg и psycopg_pool.
+"""
+
+import os
+from datetime import date, datetime
+
+import pytest
+
+import app as quiz_app
+
+TEST_POSTGRES_DSN = os.environ.get('TEST_POSTGRES_DSN', '')
+
+POSTGRES_TABLES = (
+    'game_results', 'user_profiles', 'daily_challenges', 'leaderboard_stats', 'leaderboard_periods',
+    'game_results_monthly',
+    'user_achievements', 'user_progress', 'user_mastered_categories',
+    'game_save_keys', 'category_stats'
+)
+
+@pytest.fixture(params=['sqlite', 'postgres'])
+def client(request, tmp_path, monkeypatch):
+    """Тестовый клиент на чистой базе выбранного хранилища"""
+    monkeypatch.setattr(quiz_app, 'RATE_LIMIT_ENABLED', False)
+    if request.param == 'sqlite':
+        monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'storage.db'))
+        storage = quiz_app.SQLiteStorage(quiz_app.db_pool)
+    else:
+        if not TEST_POSTGRES_DSN or quiz_app.psycopg is None:
+            pytest.skip('нужны TEST_POSTGRES_DSN и psycopg')
+        storage = quiz_app.PostgresStorage(TEST_POSTGRES_DSN, 1, 4)
+    monkeypatch.setattr(quiz_app, 'storage', storage)
+
+    storage.init_schema()
+    if storage.name == 'postgres':
+        with storage.connection() as conn, conn:
+            conn.execute(f"TRUNCATE {', '.join(POSTGRES_TABLES)}")
+            conn.execute('UPDATE app_stats SET total_users = 0, total_games = 0, total_questions_answered = 0')
+    quiz_app.init_achievements()
+    quiz_app.leaderboard_cache.clear()
+    quiz_app.response_cache.clear()
+    quiz_app.profile_cache.clear()
+
+    yield quiz_app.app.test_client()
+    storage.close_all()
+
+def test_game_flow(client):
+    """Сохранение игр, профиль, рейтинг и статистика одинаковы на обоих хранилищах"""
+    games = [
+        ('user_1', 'history', 5, 'game-1'),
+        ('user_1', 'history', 3, 'game-2'),
+        ('user_1', 'science', 4, 'game-3'),
+        ('user_2', 'history', 2, 'game-4')
+    ]
+    for user_id, category, score, key in games:
+        response = client.post('/api/save_game', json={
+            'user_id': user_id, 'first_name': 'Тест', 'score': score, 'total': 5,
+            'category': category, 'time_spent': 200, 'idempotency_key': key
+        })
+        assert response.get_json()['status'] == 'success'
+
+    duplicate = client.post('/api/save_game', json={
+        'user_id': 'user_1', 'score': 5, 'total': 5, 'category': 'history', 'idempotency_key': 'game-1'
+    })
+    assert duplicate.get_json()['status'] == 'duplicate'
+
+    profile = client.get('/api/profile/user_1').get_json()
+    assert profile['profile']['total_games'] == 3
+    assert profile['profile']['total_score'] == 12
+    assert {stat['category']: stat['games'] for stat in profile['category_stats']} == {'history': 2, 'science': 1}
+    assert len(profile['recent_games']) == 3
+    unlocked = {ach['id'] for ach in profile['achievements'] if ach['unlocked']}
+    assert unlocked == {'first_game', 'perfectionist'}
+
+    leaderboard = client.get('/api/leaderboard/history').get_json()
+    assert [(entry['user_id'], entry['avg_score'], entry['best_score']) for entry in leaderboard] == [
+        ('user_1', 80.0, 100.0)
+    ]
+
+    stats = client.get('/api/stats').get_json()
+    assert (stats['total_users'], stats['total_games'], stats['total_questions_answered']) == (2, 4, 20)
+
+    challenge = client.get('/api/daily_challenge/user_1').get_json()
+    assert challenge['type'] in ('games_count', 'category_master', 'perfect_answers')
+
+    health = client.get('/health').get_json()
+    assert health['database']['users_count'] == 2
+
+def test_numeric_user_id_stored_as_text(client):
+    """Числовой user_id из клиента записывается в текстовые колонки как строка"""
+    response = client.post('/api/save_game', json={
+        'user_id': 42, 'first_name': 'Тест', 'score': 5, 'total': 5, 'category': 'history'
+    })
+    assert response.get_json()['status'] == 'success'
+
+    profile = client.get('/api/profile/42').get_json()
+    assert profile['profile']['user_id'] == '42'
+    assert profile['profile']['total_games'] == 1
+
+def test_postgres_sql_placeholders():
+    """Плейсхолдеры ? переводятся в %s, знак процента экранируется"""
+    assert quiz_app.postgres_sql("SELECT * FROM t WHERE a = ? AND b LIKE 'x%'") == (
+        "SELECT * FROM t WHERE a = %s AND b LIKE 'x%%'"
+    )
+
+def test_postgres_row_matches_sqlite_row():
+    """Строка PostgreSQL доступна по индексу и имени, даты приходят текстом"""
+    row = quiz_app.PostgresRow(
+        {'user_id': 0, 'created_at': 1, 'last_played_date': 2},
+        tuple(map(quiz_app.postgres_value, ('42', datetime(2024, 5, 1, 12, 30, 5, 123), date(2024, 5, 1))))
+    )
+    assert row[0] == row['user_id'] == '42'
+    assert row['created_at'] == '2024-05-01 12:30:05'
+    assert row['last_played_date'] == '2024-05-01'
+    assert dict(zip(row.keys(), row)) == {
+        'user_id': '42', 'created_at': '2024-05-01 12:30:05', 'last_played_date': '2024-05-01'
+    }
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Тесты проверки initData Telegram Web App и авторизации маршрутов
+"""
+
+import hashlib
+import hmac
+import json
+import time
+import urllib.parse
+
+import pytest
+
+import app as quiz_app
+
+BOT_TOKEN = '123456:TEST-TOKEN'
+
+def sign_init_data(user, auth_date=None, bot_token=BOT_TOKEN):
+    """initData, подписанные так же, как это делает Telegram"""
+    params = {
+        'auth_date': str(int(time.time()) if auth_date is None else auth_date),
+        'query_id': 'AAHdF6IQAAAAAN0XohDhrOrc',
+        'user': json.dumps(user, ensure_ascii=False, separators=(',', ':'))
+    }
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(params.items()))
+    secret_key = hmac.new(b'WebAppData', bot_token.encode(), hashlib.sha256).digest()
+    params['hash'] = hmac.new(secret_key, data_check_string.encode(), hashlib.sha256).hexdigest()
+    return urllib.parse.urlencode(params)
+
+@pytest.fixture
+def auth():
+    return quiz_app.TelegramAuth(BOT_TOKEN, max_age=3600, cache_size=16, cache_ttl=600)
+
+def test_verify_valid_init_data(auth):
+    """Подписанные initData проверяются, повторная проверка берется из кэша"""
+    init_data = sign_init_data({'id': 42, 'first_name': 'Тест'})
+
+    assert auth.verify(init_data)['id'] == 42
+    assert auth.verify(init_data)['id'] == 42
+    assert (auth.hits, auth.misses) == (1, 1)
+
+def test_verify_rejects_tampered_and_stale(auth):
+    """Подмена данных, чужой токен и устаревшая auth_date отклоняются"""
+    init_data = sign_init_data({'id': 42, 'first_name': 'Тест'})
+    tampered = init_data.replace('%3A42', '%3A43')
+    assert tampered != init_data
+
+    assert auth.verify(tampered) is None
+    assert auth.verify(sign_init_data({'id': 42}, bot_token='other:TOKEN')) is None
+    assert auth.verify(sign_init_data({'id': 42}, auth_date=int(time.time()) - 7200)) is None
+    assert auth.verify('') is None
+
+    # Кэш не подменяет проверку для других данных с тем же hash
+    auth.verify(init_data)
+    assert auth.verify(tampered) is None
+
+def test_routes_require_matching_user(tmp_path, monkeypatch, auth):
+    """В режиме required маршруты пользователя требуют initData этого пользователя"""
+    monkeypatch.setattr(quiz_app, 'DATABASE_PATH', str(tmp_path / 'auth.db'))
+    monkeypatch.setattr(quiz_app, 'TELEGRAM_AUTH_MODE', 'required')
+    monkeypatch.setattr(quiz_app, 'telegram_auth', auth)
+    quiz_app.init_database()
+    quiz_app.init_achievements()
+    client = quiz_app.app.test_client()
+    headers = {'X-Telegram-Init-Data': sign_init_data({'id': 42, 'first_name': 'Тест'})}
+
+    try:
+        assert client.get('/api/profile/42').status_code == 401
+        assert client.get('/api/profile/42', headers=headers).status_code == 200
+        assert client.get('/api/profile/7', headers=headers).status_code == 403
+
+        game = {'user_id': 7, 'score': 1, 'total': 5, 'category': 'arts'}
+        assert client.post('/api/save_game', json=game, headers=headers).status_code == 403
+        game['user_id'] = 42
+        assert client.post('/api/save_game', json=game, headers=headers).status_code == 200
+
+        # Публичные маршруты доступны без initData
+        assert client.get('/api/stats').status_code == 200
+    finally:
+        quiz_app.db_pool.close_all()